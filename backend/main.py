@@ -1,13 +1,17 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from pathlib import Path
-from services.llm import get_llm_response
-from services.tts import text_to_speech
+from services.llm import close_clients, close_async_clients
+from services import llm_log, jobs, pipeline
+from services.conversation import run_conversation, format_sse
 from database import engine
 import models
-from routers import personas, scenarios, simulations, search, evolve, voice
+from routers import personas, scenarios, simulations, search, evolve, voice, llm
+from routers import jobs as jobs_router
 
 # Create tables
 models.Base.metadata.create_all(bind=engine)
@@ -44,6 +48,24 @@ app.include_router(simulations.router)
 app.include_router(search.router)
 app.include_router(evolve.router)
 app.include_router(voice.router)
+app.include_router(llm.router)
+app.include_router(jobs_router.router)
+
+
+@app.on_event("startup")
+async def startup():
+    """Pick up background jobs and post-processing interrupted by the last shutdown"""
+    simulations.fail_interrupted_runs()
+    pipeline.requeue_unfinished()
+    jobs.requeue_unfinished()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Release pooled LLM HTTP connections and write out queued LLM call records"""
+    await asyncio.to_thread(llm_log.flush)
+    close_clients()
+    await close_async_clients()
 
 
 @app.get("/")
@@ -52,41 +74,47 @@ def root():
 
 
 @app.post("/api/simulate")
-def simulate(request: SimulateRequest):
+async def simulate(request: SimulateRequest):
     """Run conversation between two AI personas"""
     transcript = []
-
-    # Initialize Agent A with context to start conversation
-    messages_a = [{"role": "user", "content": request.context}]
-    messages_b = []
-
-    for turn in range(request.max_turns):
-        # Agent A speaks
-        response_a = get_llm_response(request.persona_a_prompt, messages_a)
-
-        # Generate audio for Agent A
-        audio_a = text_to_speech(response_a)
-
-        transcript.append({
-            "agent": "A",
-            "text": response_a,
-            "audio": audio_a  # May be None if TTS failed
-        })
-        messages_a.append({"role": "assistant", "content": response_a})
-        messages_b.append({"role": "user", "content": response_a})
-
-        # Agent B responds
-        response_b = get_llm_response(request.persona_b_prompt, messages_b)
-
-        # Generate audio for Agent B
-        audio_b = text_to_speech(response_b)
-
-        transcript.append({
-            "agent": "B",
-            "text": response_b,
-            "audio": audio_b  # May be None if TTS failed
-        })
-        messages_b.append({"role": "assistant", "content": response_b})
-        messages_a.append({"role": "user", "content": response_b})
-
-    return {"transcript": transcript}
+    stop_reason = None
+
+    async for event in run_conversation(
+        request.persona_a_prompt,
+        request.persona_b_prompt,
+        request.context,
+        request.max_turns
+    ):
+        if event["type"] == "turn":
+            transcript.append(event["turn"])
+        elif event["type"] == "turn_audio":
+            transcript[event["index"]]["audio"] = event["audio"]
+        elif event["type"] == "end":
+            stop_reason = event["reason"]
+
+    return {"transcript": transcript, "stop_reason": stop_reason}
+
+
+@app.post("/api/simulate/stream")
+async def simulate_stream(request: SimulateRequest):
+    """Run conversation between two AI personas, streaming replies as Server-Sent Events"""
+    async def events():
+        transcript = []
+        try:
+            async for event in run_conversation(
+                request.persona_a_prompt,
+                request.persona_b_prompt,
+                request.context,
+                request.max_turns,
+                stream=True
+            ):
+                if event["type"] == "turn":
+                    transcript.append(event["turn"])
+                elif event["type"] == "turn_audio":
+                    transcript[event["index"]]["audio"] = event["audio"]
+                yield format_sse(event)
+            yield format_sse({"type": "completed", "transcript": transcript})
+        except Exception as e:
+            yield format_sse({"type": "failed", "error": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -38,30 +38,81 @@ class Scenario(Base):
     simulation_runs = relationship("SimulationRun", back_populates="scenario")
 
 
+class SimulationBatch(Base):
+    __tablename__ = "simulation_batches"
+
+    id = Column(Integer, primary_key=True, index=True)
+    status = Column(String, default="pending")  # pending/running/completed
+    parallelism = Column(Integer)
+    total_runs = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    completed_at = Column(DateTime, nullable=True)
+
+    # Relationships
+    runs = relationship("SimulationRun", back_populates="batch")
+
+
+class ConversationPrefix(Base):
+    """Opening turns shared by forked simulation runs, stored once"""
+    __tablename__ = "conversation_prefixes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    scenario_id = Column(Integer, ForeignKey("scenarios.id"))
+    source_run_id = Column(Integer, nullable=True)  # Run the prefix was cut from (None = generated for the fork)
+    transcript = Column(JSON)  # The first `turns` messages
+    state = Column(JSON)  # Both personas' message histories after them (ConversationState.to_dict)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    # Relationships
+    scenario = relationship("Scenario")
+    runs = relationship("SimulationRun", back_populates="prefix")
+
+
 class SimulationRun(Base):
     __tablename__ = "simulation_runs"
 
     id = Column(Integer, primary_key=True, index=True)
-    scenario_id = Column(Integer, ForeignKey("scenarios.id"))
+    scenario_id = Column(Integer, ForeignKey("scenarios.id"), index=True)
+    batch_id = Column(Integer, ForeignKey("simulation_batches.id"), nullable=True, index=True)  # Set for batch runs
     transcript = Column(JSON)
     audio_paths = Column(JSON)
-    status = Column(String, default="pending")  # pending/running/completed/failed
+    status = Column(String, default="pending", index=True)  # pending/running/completed/failed
     duration_seconds = Column(Float)
+    stop_reason = Column(String, nullable=True)  # commitment/refusal/hang_up/loop/max_turns/succeeded/hopeless/violation
+    checkpoint = Column(JSON, nullable=True)  # Message histories after the last saved turn (cleared when done)
+    # Forked runs continue a shared prefix; transcript then holds only the turns after it
+    prefix_id = Column(Integer, ForeignKey("conversation_prefixes.id"), nullable=True)
+    agent_prompt = Column(String, nullable=True)  # Overrides persona A's system prompt (prompt variants)
+    seed = Column(Integer, nullable=True)  # Sampling seed for the conversation's LLM calls
+    turn_evaluation = Column(JSON, nullable=True)  # Windows judged during the conversation (services/turn_evaluation.py)
+    # Post-processing after the transcript is stored (services/pipeline.py): pending/running/completed/failed
+    evaluation_status = Column(String, nullable=True)
+    index_status = Column(String, nullable=True)  # also "skipped" when there is no evaluation to index
+    postprocess_error = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
     scenario = relationship("Scenario", back_populates="simulation_runs")
     evaluation = relationship("Evaluation", back_populates="simulation_run", uselist=False)
+    batch = relationship("SimulationBatch", back_populates="runs")
+    prefix = relationship("ConversationPrefix", back_populates="runs")
+
+    @property
+    def full_transcript(self):
+        """The shared prefix (forked runs) followed by this run's own turns"""
+        return (self.prefix.transcript if self.prefix else []) + (self.transcript or [])
 
 
 class Evaluation(Base):
     __tablename__ = "evaluations"
 
     id = Column(Integer, primary_key=True, index=True)
-    run_id = Column(Integer, ForeignKey("simulation_runs.id"))
+    run_id = Column(Integer, ForeignKey("simulation_runs.id"), index=True)
     scores = Column(JSON)
     overall_score = Column(Float)
     feedback = Column(String)
+    score_variance = Column(JSON, nullable=True)  # Per-metric variance across ensemble judges (None = single judge)
+    judge_count = Column(Integer, default=1)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
@@ -103,3 +154,42 @@ class MutationAttempt(Base):
 
     # Relationships
     version = relationship("AgentVersion", back_populates="mutation_attempts")
+
+
+class LLMCall(Base):
+    __tablename__ = "llm_calls"
+
+    # Append-only log of LLM calls, written in batches by services/llm_log.py
+    id = Column(Integer, primary_key=True, index=True)
+    call_site = Column(String, index=True)  # agent_turn/customer_turn/judge/pattern_extraction/mutation/context_summary
+    provider = Column(String)
+    model = Column(String)
+    status = Column(String)  # ok/error/cached
+    error = Column(String, nullable=True)
+    latency_seconds = Column(Float)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    cached_tokens = Column(Integer, nullable=True)  # Prompt tokens served from the provider's prefix cache
+    streamed = Column(Boolean, default=False)
+    run_id = Column(Integer, index=True, nullable=True)
+    evolution_id = Column(String, index=True, nullable=True)
+    persona_id = Column(Integer, index=True, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    # Background work (evolution cycles, simulations, batches) run by services/jobs.py
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # evolution/simulation/simulation_batch
+    params = Column(JSON)
+    status = Column(String, default="queued", index=True)  # queued/running/completed/failed
+    phase = Column(String, nullable=True)  # e.g. baseline/mutation_generation/mutation_testing
+    progress = Column(JSON)  # {"completed", "total", "message"} within the current phase
+    result = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    attempts = Column(Integer, default=0)  # incremented each time the job starts (restarts re-run it)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
@@ -1,8 +1,13 @@
+import uuid
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from database import get_db
+from database import get_db, SessionLocal
 import models
-from services.mutation import generate_mutation
+from services import jobs, pipeline
+from services.mutation import generate_mutation_async, analyze_history_async
+from services.rate_limit import batch_priority
+from services.llm_log import call_context
 from routers.simulations import run_simulation
 
 router = APIRouter(prefix="/api/evolve", tags=["evolution"])
@@ -15,6 +20,7 @@ N_MUTATIONS = 3  # Number of mutation variants
 N_MUTATION_TESTS = 5  # Test simulations per mutation (same as baseline for fair comparison)
 PLATEAU_WINDOW = 3  # Number of evolution cycles to check for plateau
 PLATEAU_THRESHOLD = 0.2  # Minimum improvement required to not be considered plateau
+JUDGE_NOISE_MARGIN = 1.0  # With a judge ensemble, a mutation must beat baseline by this many standard errors of judge noise
 
 
 def check_plateau(persona_id: int, db: Session) -> dict:
@@ -70,7 +76,7 @@ def check_plateau(persona_id: int, db: Session) -> dict:
 
 
 @router.post("/{persona_id}")
-def evolve_persona(persona_id: int, scenario_ids: str, db: Session = Depends(get_db)):
+async def evolve_persona(persona_id: int, scenario_ids: str, db: Session = Depends(get_db)):
     """
     Run evolution cycle for a persona against MULTIPLE scenarios
 
@@ -87,6 +93,75 @@ def evolve_persona(persona_id: int, scenario_ids: str, db: Session = Depends(get
         persona_id: ID of persona to evolve
         scenario_ids: Comma-separated scenario IDs (e.g., "1,2,3,4,5")
     """
+    return await run_evolution_cycle(persona_id, scenario_ids, db)
+
+
+async def run_evolution_cycle(persona_id: int, scenario_ids: str, db: Session, progress=None):
+    """
+    Run one evolution cycle. progress(phase, completed, total, message) is called as it
+    moves through the baseline, mutation_generation, mutation_testing and saving phases.
+    """
+    # Evolution is bulk work: its LLM calls yield to interactive simulations.
+    # Every LLM call in the cycle is logged under one evolution_id (see /api/llm/usage).
+    evolution_id = uuid.uuid4().hex
+    # Judging is deferred until the scores are awaited, so each round's transcripts share judge calls
+    with batch_priority(), call_context(evolution_id=evolution_id, persona_id=persona_id), pipeline.deferred():
+        result = await _evolve_persona(persona_id, scenario_ids, db, progress or _no_progress)
+    return {"evolution_id": evolution_id, **result}
+
+
+def _no_progress(phase, completed=None, total=None, message=None):
+    pass
+
+
+async def _evaluations(run_ids, db):
+    """
+    Wait for these runs' post-processing, then return their evaluations. A run whose judging
+    failed has a placeholder evaluation with neutral scores (scores["judge_failed"]); those are
+    left out, so they never count towards an average, the improvement or the noise margin.
+    """
+    await pipeline.wait(run_ids)
+    evaluations = db.query(models.Evaluation).filter(models.Evaluation.run_id.in_(run_ids)).all()
+    by_run = {evaluation.run_id: evaluation for evaluation in evaluations
+              if not (evaluation.scores or {}).get("judge_failed")}
+    skipped = [run_id for run_id in run_ids if run_id not in by_run]
+    if skipped:
+        print(f"  Leaving out {len(skipped)} runs without a judged evaluation: {skipped}")
+    return [by_run[run_id] for run_id in run_ids if run_id in by_run]
+
+
+def _score_variance(evaluation):
+    """(variance of the overall score across judges, judge count); (0, 1) for single-judge evaluations"""
+    variance = (evaluation.score_variance or {}).get("overall", 0.0)
+    return variance, evaluation.judge_count or 1
+
+
+def _judge_noise(variances):
+    """Standard error of judge noise in an average of overall scores, from (variance, judges) per run"""
+    if not variances:
+        return 0.0
+    # Each aggregated score varies by about variance / judges; the average of n runs by 1/n^2 of their sum
+    return sum(variance / judges for variance, judges in variances) ** 0.5 / len(variances)
+
+
+async def _evolution_job(params, progress):
+    """Job handler: an evolution cycle in its own session (see POST /api/jobs/evolution)"""
+    db = SessionLocal()
+    try:
+        # A cycle interrupted mid-testing leaves a mutation on the persona; start again from the original
+        persona = db.query(models.Persona).filter(models.Persona.id == params["persona_id"]).first()
+        if persona and params.get("base_prompt") and persona.system_prompt != params["base_prompt"]:
+            persona.system_prompt = params["base_prompt"]
+            db.commit()
+        return await run_evolution_cycle(params["persona_id"], params["scenario_ids"], db, progress)
+    finally:
+        db.close()
+
+
+jobs.register_handler("evolution", _evolution_job)
+
+
+async def _evolve_persona(persona_id: int, scenario_ids: str, db: Session, progress):
     # Get persona
     persona = db.query(models.Persona).filter(models.Persona.id == persona_id).first()
     if not persona:
@@ -127,31 +202,40 @@ def evolve_persona(persona_id: int, scenario_ids: str, db: Session = Depends(get
     print(f"Step 1: Running {N_BASELINE_SIMS} baseline simulations...")
     baseline_scores = []
     baseline_evaluations = []
+    baseline_run_ids = []
+    baseline_variances = []
 
     for i in range(N_BASELINE_SIMS):
         scenario = scenarios[i % len(scenarios)]  # Round-robin distribution
         print(f"  Baseline {i+1}/{N_BASELINE_SIMS} (vs {scenario.name})...")
-        sim_run = run_simulation(scenario.id, db)
-
-        # Get evaluation
-        evaluation = db.query(models.Evaluation).filter(
-            models.Evaluation.run_id == sim_run.id
-        ).first()
-
-        if evaluation:
-            baseline_scores.append(evaluation.overall_score)
-            # Handle both old and new metric names for backwards compatibility
-            baseline_evaluations.append({
-                'goal_completion': evaluation.scores.get('goal_completion', evaluation.scores.get('task_completion', 5)),
-                'conversational_quality': evaluation.scores.get('conversational_quality', evaluation.scores.get('naturalness', 5)),
-                'compliance': evaluation.scores.get('compliance', 5),
-                'adaptation_quality': evaluation.scores.get('adaptation_quality', 5),  # NEW
-                'feedback': evaluation.feedback,
-                'structured_issues': evaluation.scores.get('structured_issues', {})  # NEW
-            })
-
-    avg_baseline = sum(baseline_scores) / len(baseline_scores) if baseline_scores else 0
+        progress("baseline", i, N_BASELINE_SIMS, f"Baseline {i+1}/{N_BASELINE_SIMS} vs {scenario.name}")
+        sim_run = await run_simulation(scenario.id, db)
+        baseline_run_ids.append(sim_run.id)
+
+    # All baseline transcripts are judged together here (packed into shared judge calls)
+    for evaluation in await _evaluations(baseline_run_ids, db):
+        baseline_scores.append(evaluation.overall_score)
+        baseline_variances.append(_score_variance(evaluation))
+        # Handle both old and new metric names for backwards compatibility
+        baseline_evaluations.append({
+            'goal_completion': evaluation.scores.get('goal_completion', evaluation.scores.get('task_completion', 5)),
+            'conversational_quality': evaluation.scores.get('conversational_quality', evaluation.scores.get('naturalness', 5)),
+            'compliance': evaluation.scores.get('compliance', 5),
+            'adaptation_quality': evaluation.scores.get('adaptation_quality', 5),  # NEW
+            'feedback': evaluation.feedback,
+            'structured_issues': evaluation.scores.get('structured_issues', {})  # NEW
+        })
+
+    if not baseline_scores:
+        print("  No baseline run was judged. Keeping original prompt.")
+        return {
+            "evolved": False,
+            "reason": "Baseline judging failed",
+        }
+
+    avg_baseline = sum(baseline_scores) / len(baseline_scores)
     print(f"\n  Baseline average: {avg_baseline:.2f}/10")
+    progress("baseline", N_BASELINE_SIMS, N_BASELINE_SIMS, f"Baseline average {avg_baseline:.2f}/10")
 
     # Step 2: Check if evolution needed
     if avg_baseline >= FAILURE_THRESHOLD:
@@ -165,19 +249,23 @@ def evolve_persona(persona_id: int, scenario_ids: str, db: Session = Depends(get
 
     print(f"  Score below threshold! Triggering evolution...")
 
-    # Step 3: Generate mutations
+    # Step 3: Generate mutations (independent, so requested concurrently)
     print(f"\nStep 2: Generating {N_MUTATIONS} mutations...")
-    mutations = []
-
-    for i in range(N_MUTATIONS):
-        print(f"  Generating mutation {i+1}/{N_MUTATIONS}...")
-        mutation_result = generate_mutation(
+    progress("mutation_generation", 0, N_MUTATIONS, f"Generating {N_MUTATIONS} mutations")
+    # Examples and patterns are the same for every mutation: fetch and extract them once
+    analysis = await analyze_history_async(persona.name, baseline_evaluations)
+    mutations = await asyncio.gather(*[
+        generate_mutation_async(
             current_prompt=persona.system_prompt,
             persona_name=persona.name,
             evaluations=baseline_evaluations,
-            scenario_names=[s.name for s in scenarios]  # Pass ALL scenario names
+            scenario_names=[s.name for s in scenarios],  # Pass ALL scenario names
+            analysis=analysis
         )
-        mutations.append(mutation_result)  # Now storing dict with prompt + metadata
+        for _ in range(N_MUTATIONS)
+    ])  # Each is a dict with prompt + metadata
+
+    progress("mutation_generation", N_MUTATIONS, N_MUTATIONS)
 
     # Step 4: Test each mutation
     print(f"\nStep 3: Testing mutations...")
@@ -192,27 +280,19 @@ def evolve_persona(persona_id: int, scenario_ids: str, db: Session = Depends(get
         db.commit()
 
         # Run test simulations (distributed across scenarios)
-        mut_scores = []
+        mut_run_ids = []
         for test_idx in range(N_MUTATION_TESTS):
             scenario = scenarios[test_idx % len(scenarios)]  # Round-robin
             print(f"    Test {test_idx+1}/{N_MUTATION_TESTS} (vs {scenario.name})...")
-            sim_run = run_simulation(scenario.id, db)
-
-            evaluation = db.query(models.Evaluation).filter(
-                models.Evaluation.run_id == sim_run.id
-            ).first()
-
-            if evaluation:
-                mut_scores.append(evaluation.overall_score)
-
-        avg_mutation_score = sum(mut_scores) / len(mut_scores) if mut_scores else 0
-        print(f"    Mutation {mut_idx+1} average: {avg_mutation_score:.2f}/10")
+            progress("mutation_testing", mut_idx * N_MUTATION_TESTS + test_idx, N_MUTATIONS * N_MUTATION_TESTS,
+                     f"Mutation {mut_idx+1}/{N_MUTATIONS}, test {test_idx+1}/{N_MUTATION_TESTS} vs {scenario.name}")
+            sim_run = await run_simulation(scenario.id, db)
+            mut_run_ids.append(sim_run.id)
 
         mutation_results.append({
             'mutation_id': mut_idx,
             'prompt': mutation_data['mutated_prompt'],
-            'avg_score': avg_mutation_score,
-            'scores': mut_scores,
+            'run_ids': mut_run_ids,
             'metadata': mutation_data['metadata'],
             'reasoning_prompt': mutation_data['reasoning_prompt']
         })
@@ -221,22 +301,38 @@ def evolve_persona(persona_id: int, scenario_ids: str, db: Session = Depends(get
         persona.system_prompt = original_prompt
         db.commit()
 
+    # Scores are only needed once every mutation has been tested, so all the test
+    # transcripts are judged together
+    for result in mutation_results:
+        mut_evaluations = await _evaluations(result.pop('run_ids'), db)
+        mut_scores = [evaluation.overall_score for evaluation in mut_evaluations]
+        result['scores'] = mut_scores
+        result['avg_score'] = sum(mut_scores) / len(mut_scores) if mut_scores else 0
+        result['judge_noise'] = _judge_noise([_score_variance(evaluation) for evaluation in mut_evaluations])
+        print(f"    Mutation {result['mutation_id']+1} average: {result['avg_score']:.2f}/10")
+
+    progress("mutation_testing", N_MUTATIONS * N_MUTATION_TESTS, N_MUTATIONS * N_MUTATION_TESTS)
+
     # Step 5: Pick best mutation
     best_mutation = max(mutation_results, key=lambda x: x['avg_score'])
     print(f"\n  Best mutation: #{best_mutation['mutation_id']+1} (score: {best_mutation['avg_score']:.2f}/10)")
 
-    # Step 6: Check if mutation is better than baseline
-    if best_mutation['avg_score'] <= avg_baseline:
-        print(f"  No improvement found. Keeping original prompt.")
+    # Step 6: Check if mutation is better than baseline (by more than the judges disagree,
+    # when ensemble variance is available; 0 with a single judge)
+    margin = JUDGE_NOISE_MARGIN * (_judge_noise(baseline_variances) ** 2 + best_mutation['judge_noise'] ** 2) ** 0.5
+    if best_mutation['avg_score'] <= avg_baseline + margin:
+        print(f"  No improvement found (beyond judge noise margin {margin:.2f}). Keeping original prompt.")
         return {
             "evolved": False,
             "reason": "No improvement found",
             "baseline_score": avg_baseline,
-            "best_mutation_score": best_mutation['avg_score']
+            "best_mutation_score": best_mutation['avg_score'],
+            "judge_noise_margin": margin
         }
 
     # Step 7: Save as new version
     print(f"\n  Improvement found! Saving new version...")
+    progress("saving", message="Saving new version")
 
     # Get current version number
     latest_version = db.query(models.AgentVersion).filter(
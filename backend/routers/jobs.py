@@ -0,0 +1,97 @@
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import Optional
+import models
+from database import get_db
+from services import jobs
+from services.conversation import format_sse
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+SSE_KEEPALIVE_SECONDS = 15
+
+
+@router.post("/evolution")
+async def create_evolution_job(persona_id: int, scenario_ids: str, db: Session = Depends(get_db)):
+    """Run an evolution cycle in the background (same arguments as POST /api/evolve/{persona_id})"""
+    persona = db.query(models.Persona).filter(models.Persona.id == persona_id).first()
+    if not persona:
+        raise HTTPException(status_code=404, detail="Persona not found")
+    try:
+        [int(x.strip()) for x in scenario_ids.split(",")]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid scenario_ids format. Use comma-separated integers.")
+
+    job = jobs.enqueue(db, "evolution", {
+        "persona_id": persona_id,
+        "scenario_ids": scenario_ids,
+        "base_prompt": persona.system_prompt,
+    })
+    return jobs.serialize(job)
+
+
+@router.post("/simulation")
+async def create_simulation_job(scenario_id: int, db: Session = Depends(get_db)):
+    """Run one simulation in the background"""
+    scenario = db.query(models.Scenario).filter(models.Scenario.id == scenario_id).first()
+    if not scenario:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+
+    job = jobs.enqueue(db, "simulation", {"scenario_id": scenario_id})
+    return jobs.serialize(job)
+
+
+@router.get("/")
+def list_jobs(status: Optional[str] = None, kind: Optional[str] = None, limit: int = 50,
+              db: Session = Depends(get_db)):
+    """Most recent jobs first"""
+    query = db.query(models.Job)
+    if status:
+        query = query.filter(models.Job.status == status)
+    if kind:
+        query = query.filter(models.Job.kind == kind)
+    return [jobs.serialize(job) for job in query.order_by(models.Job.id.desc()).limit(limit).all()]
+
+
+@router.get("/{job_id}")
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    """Job status, current phase/progress and result"""
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.serialize(job)
+
+
+@router.get("/{job_id}/events")
+def job_events(job_id: int, db: Session = Depends(get_db)):
+    """
+    Server-Sent Events for a job: a "job" snapshot first, then "running", "progress"
+    and finally "completed" or "failed". Ends right away if the job already finished.
+    """
+    job = db.query(models.Job).filter(models.Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # Subscribe before taking the snapshot so no update falls in between
+    queue = jobs.subscribe(job_id)
+    snapshot = jobs.serialize(job)
+
+    async def events():
+        try:
+            yield format_sse({"type": "job", "job": snapshot})
+            if snapshot["status"] in ("completed", "failed"):
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event)
+                if event["type"] in ("completed", "failed"):
+                    return
+        finally:
+            jobs.unsubscribe(job_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
@@ -0,0 +1,86 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from database import get_db
+from services import llm_cache, llm_log, judge_cache
+from services.evaluation import RUBRIC_VERSION
+from services.llm import get_stream_stats, get_routing_stats
+from services.rate_limit import get_all_stats
+
+router = APIRouter(prefix="/api/llm", tags=["llm"])
+
+
+@router.get("/cache")
+def get_cache_stats():
+    """LLM response cache hit/miss counters and size"""
+    return llm_cache.get_stats()
+
+
+@router.delete("/cache")
+def clear_cache():
+    """Empty the LLM response cache"""
+    llm_cache.clear()
+    return {"message": "LLM cache cleared"}
+
+
+@router.get("/judge-cache")
+def get_judge_cache_stats():
+    """Judge score cache hit/miss counters, entries and the current rubric version"""
+    return judge_cache.get_stats(RUBRIC_VERSION)
+
+
+@router.delete("/judge-cache")
+def clear_judge_cache(stale_only: bool = False):
+    """Empty the judge score cache (stale_only: just entries from older rubric versions)"""
+    deleted = judge_cache.clear(keep_version=RUBRIC_VERSION if stale_only else None)
+    return {"message": f"Removed {deleted} judge cache entries"}
+
+
+@router.get("/rate-limits")
+def get_rate_limits():
+    """Per-provider rate budgets, queue depth and 429/retry counters"""
+    return get_all_stats()
+
+
+@router.get("/streaming")
+def get_streaming_stats():
+    """Time-to-first-token and tokens/sec over recent streaming calls"""
+    return get_stream_stats()
+
+
+@router.get("/routing")
+def get_routing():
+    """Per-provider latency percentiles, hedge thresholds and failover counters"""
+    return get_routing_stats()
+
+
+@router.get("/usage")
+def get_usage(db: Session = Depends(get_db)):
+    """Token and latency totals over all logged LLM calls, by call site, plus log writer counters"""
+    return {**llm_log.summarize(db), "log": llm_log.get_stats()}
+
+
+@router.get("/usage/runs/{run_id}")
+def get_run_usage(run_id: int, db: Session = Depends(get_db)):
+    """LLM tokens and latency spent on one simulation run (turns and judge)"""
+    return llm_log.summarize(db, run_id=run_id)
+
+
+@router.get("/usage/evolutions/{evolution_id}")
+def get_evolution_usage(evolution_id: str, db: Session = Depends(get_db)):
+    """LLM tokens and latency spent on one evolution cycle (simulations, patterns and mutations)"""
+    return llm_log.summarize(db, evolution_id=evolution_id)
+
+
+@router.get("/usage/personas/{persona_id}")
+def get_persona_usage(persona_id: int, db: Session = Depends(get_db)):
+    """LLM tokens and latency spent on a persona across all runs and evolution cycles"""
+    return llm_log.summarize(db, persona_id=persona_id)
+
+
+@router.get("/usage/by/{dimension}")
+def get_usage_breakdown(dimension: str, limit: int = 50, db: Session = Depends(get_db)):
+    """Totals per run, evolution cycle or persona (dimension: runs, evolutions, personas), most tokens first"""
+    fields = {"runs": "run_id", "evolutions": "evolution_id", "personas": "persona_id"}
+    if dimension not in fields:
+        raise HTTPException(status_code=400, detail=f"dimension must be one of: {', '.join(fields)}")
+    return llm_log.summarize_by(db, fields[dimension], limit=limit)
@@ -1,22 +1,500 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+import os
+import json
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session, contains_eager, defer
+from sqlalchemy.orm.attributes import set_committed_value
+from typing import List, Optional
 from datetime import datetime
 import models
 import schemas
-from database import get_db
-from services.llm import get_llm_response
-from services.tts import text_to_speech
-from services.evaluation import evaluate_conversation
-from services.vector_store import add_conversation
+from database import get_db, SessionLocal
+from services.conversation import run_conversation, format_sse, ConversationState, CONCISE_INSTRUCTION
+from services.llm import sampling_seed
+from services.llm_log import call_context
+from services import jobs, live, pipeline
 
 router = APIRouter(prefix="/api/simulations", tags=["simulations"])
 
+# Batch runs: default and max number of simulations running at once per batch
+SIMULATION_BATCH_PARALLELISM = int(os.getenv("SIMULATION_BATCH_PARALLELISM", "4"))
+SIMULATION_BATCH_MAX_PARALLELISM = 32
 
-@router.get("/", response_model=List[schemas.SimulationRun])
-def list_simulations(db: Session = Depends(get_db)):
-    """List all simulation runs"""
-    return db.query(models.SimulationRun).order_by(models.SimulationRun.created_at.desc()).all()
+# Listing page size: default and max
+SIMULATION_LIST_LIMIT = 50
+SIMULATION_LIST_MAX_LIMIT = 500
+
+# Columns returned for each run by the listing (fields=full adds transcript and audio_paths)
+LIST_FIELDS = ["id", "scenario_id", "status", "duration_seconds", "stop_reason", "batch_id", "prefix_id",
+               "agent_prompt", "seed", "evaluation_status", "index_status", "created_at"]
+
+# Times a simulation picks itself back up from its last checkpoint after a failed turn
+SIMULATION_RESUME_ATTEMPTS = int(os.getenv("SIMULATION_RESUME_ATTEMPTS", "1"))
+
+# Live watchers: seconds between keepalives while waiting for the next event
+LIVE_KEEPALIVE_SECONDS = 15
+
+# Simulations started by /run/stream (kept referenced so they aren't garbage collected mid-run)
+_stream_tasks = set()
+
+
+@router.get("/", response_model=schemas.SimulationRunPage)
+def list_simulations(
+    limit: int = SIMULATION_LIST_LIMIT,
+    cursor: Optional[int] = None,
+    scenario_id: Optional[int] = None,
+    status: Optional[str] = None,
+    batch_id: Optional[int] = None,
+    min_score: Optional[float] = None,
+    max_score: Optional[float] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    fields: str = "summary",
+    db: Session = Depends(get_db)
+):
+    """
+    List simulation runs, newest first, one page at a time. Pass next_cursor back as
+    cursor for the next page (keyset pagination on id, so deep pages stay cheap).
+    fields=summary leaves transcripts and audio paths out (they aren't even loaded);
+    fields=full includes them. Evaluations come from the same query.
+    """
+    if not 1 <= limit <= SIMULATION_LIST_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be 1-{SIMULATION_LIST_MAX_LIMIT}")
+    if fields not in ("summary", "full"):
+        raise HTTPException(status_code=400, detail="fields must be 'summary' or 'full'")
+
+    query = db.query(models.SimulationRun).outerjoin(models.SimulationRun.evaluation).options(
+        contains_eager(models.SimulationRun.evaluation),
+        defer(models.SimulationRun.checkpoint)
+    )
+    if fields == "summary":
+        query = query.options(defer(models.SimulationRun.transcript), defer(models.SimulationRun.audio_paths))
+
+    if cursor is not None:
+        query = query.filter(models.SimulationRun.id < cursor)
+    if scenario_id is not None:
+        query = query.filter(models.SimulationRun.scenario_id == scenario_id)
+    if status:
+        query = query.filter(models.SimulationRun.status == status)
+    if batch_id is not None:
+        query = query.filter(models.SimulationRun.batch_id == batch_id)
+    if min_score is not None:
+        query = query.filter(models.Evaluation.overall_score >= min_score)
+    if max_score is not None:
+        query = query.filter(models.Evaluation.overall_score <= max_score)
+    if created_after:
+        query = query.filter(models.SimulationRun.created_at >= created_after)
+    if created_before:
+        query = query.filter(models.SimulationRun.created_at < created_before)
+
+    # One extra row tells us whether there is a next page
+    runs = query.order_by(models.SimulationRun.id.desc()).limit(limit + 1).all()
+    next_cursor = runs[limit - 1].id if len(runs) > limit else None
+
+    items = []
+    for run in runs[:limit]:
+        item = {field: getattr(run, field) for field in LIST_FIELDS}
+        item["evaluation"] = run.evaluation
+        if fields == "full":
+            item["transcript"] = run.transcript
+            item["audio_paths"] = run.audio_paths
+        items.append(item)
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@router.post("/batch")
+async def run_simulation_batch(request: schemas.SimulationBatchCreate, db: Session = Depends(get_db)):
+    """
+    Queue many simulations and run them concurrently as a background job.
+    Each item runs a scenario `repeat` times; at most `parallelism` run at once.
+    Returns the batch right away; poll GET /batch/{batch_id} for progress,
+    or follow /api/jobs/{job_id}/events. Interrupted batches resume on restart.
+    """
+    parallelism = _batch_parallelism(request.parallelism)
+    if not request.items or any(item.repeat < 1 for item in request.items):
+        raise HTTPException(status_code=400, detail="Give at least one item, each with repeat >= 1")
+
+    scenario_ids = {item.scenario_id for item in request.items}
+    found = {s.id for s in db.query(models.Scenario.id).filter(models.Scenario.id.in_(scenario_ids)).all()}
+    if found != scenario_ids:
+        raise HTTPException(status_code=404, detail=f"Scenarios not found: {sorted(scenario_ids - found)}")
+
+    batch = models.SimulationBatch(
+        status="pending",
+        parallelism=parallelism,
+        total_runs=sum(item.repeat for item in request.items)
+    )
+    db.add(batch)
+    db.flush()
+
+    # Create every run up front as pending so the whole batch is visible immediately
+    for item in request.items:
+        for _ in range(item.repeat):
+            db.add(models.SimulationRun(scenario_id=item.scenario_id, batch_id=batch.id, status="pending"))
+    db.commit()
+    db.refresh(batch)
+
+    job = jobs.enqueue(db, "simulation_batch", {"batch_id": batch.id})
+    print(f"\n=== Queued Simulation Batch {batch.id}: {batch.total_runs} runs, parallelism {parallelism} ===")
+    return {**_batch_summary(batch), "job_id": job.id}
+
+
+def _batch_parallelism(requested):
+    parallelism = SIMULATION_BATCH_PARALLELISM if requested is None else requested
+    if not 1 <= parallelism <= SIMULATION_BATCH_MAX_PARALLELISM:
+        raise HTTPException(status_code=400, detail=f"parallelism must be 1-{SIMULATION_BATCH_MAX_PARALLELISM}")
+    return parallelism
+
+
+@router.post("/prefixes")
+async def create_prefix(request: schemas.ConversationPrefixCreate, db: Session = Depends(get_db)):
+    """
+    Snapshot the first `turns` messages of a conversation so runs can be forked from it:
+    cut from an existing run (source_run_id) or generated for a scenario (scenario_id)
+    """
+    if request.turns < 1:
+        raise HTTPException(status_code=400, detail="turns must be at least 1")
+
+    if request.source_run_id:
+        source = db.query(models.SimulationRun).filter(models.SimulationRun.id == request.source_run_id).first()
+        if not source:
+            raise HTTPException(status_code=404, detail="Simulation run not found")
+        if len(source.full_transcript) < request.turns:
+            raise HTTPException(status_code=400, detail=f"Run {source.id} has only {len(source.full_transcript)} messages")
+        scenario = source.scenario
+        transcript = [dict(turn) for turn in source.full_transcript[:request.turns]]
+        state = ConversationState.from_transcript(transcript, scenario.context)
+    else:
+        scenario = db.query(models.Scenario).filter(models.Scenario.id == request.scenario_id).first()
+        if not scenario:
+            raise HTTPException(status_code=404, detail="Scenario not found")
+        if request.turns > scenario.max_turns * 2:
+            raise HTTPException(status_code=400, detail=f"Scenario allows at most {scenario.max_turns * 2} messages")
+        transcript, state = await _generate_prefix(scenario, request.turns)
+
+    prefix = models.ConversationPrefix(
+        scenario_id=scenario.id,
+        source_run_id=request.source_run_id,
+        transcript=transcript,
+        state=state.to_dict()
+    )
+    db.add(prefix)
+    db.commit()
+    db.refresh(prefix)
+    print(f"Saved conversation prefix {prefix.id}: {len(transcript)} messages of {scenario.name}")
+    return _prefix_summary(prefix)
+
+
+async def _generate_prefix(scenario, turns):
+    """The first `turns` messages of a fresh conversation (run to length, no early stop)"""
+    persona_a = scenario.persona_a
+    persona_b = scenario.persona_b
+    state = ConversationState(scenario.context)
+    transcript = []
+
+    with call_context(persona_id=scenario.persona_a_id):
+        async for event in run_conversation(
+            f"{CONCISE_INSTRUCTION}\n\n{persona_a.system_prompt}",
+            f"{CONCISE_INSTRUCTION}\n\n{persona_b.system_prompt}",
+            scenario.context,
+            scenario.max_turns,
+            persona_a=persona_a.name,
+            persona_b=persona_b.name,
+            voice_a=persona_a.voice_id,
+            voice_b=persona_b.voice_id,
+            max_tokens=150,
+            early_stop=False,
+            state=state,
+            max_messages=turns,
+            persona_a_id=persona_a.id,
+            persona_b_id=persona_b.id
+        ):
+            if event["type"] == "turn":
+                transcript.append(event["turn"])
+            elif event["type"] == "turn_audio":
+                transcript[event["index"]]["audio"] = event["audio"]
+
+    return transcript, state
+
+
+@router.post("/prefixes/{prefix_id}/fork")
+async def fork_prefix(prefix_id: int, request: schemas.ForkCreate, db: Session = Depends(get_db)):
+    """
+    Fork runs that all continue the same prefix, one per variant (agent prompt and/or
+    seed) and repeat. They run as a simulation batch; compare them with GET /prefixes/{prefix_id}.
+    """
+    prefix = db.query(models.ConversationPrefix).filter(models.ConversationPrefix.id == prefix_id).first()
+    if not prefix:
+        raise HTTPException(status_code=404, detail="Conversation prefix not found")
+    parallelism = _batch_parallelism(request.parallelism)
+    if not request.variants or any(variant.repeat < 1 for variant in request.variants):
+        raise HTTPException(status_code=400, detail="Give at least one variant, each with repeat >= 1")
+
+    batch = models.SimulationBatch(
+        status="pending",
+        parallelism=parallelism,
+        total_runs=sum(variant.repeat for variant in request.variants)
+    )
+    db.add(batch)
+    db.flush()
+
+    for variant in request.variants:
+        for i in range(variant.repeat):
+            db.add(models.SimulationRun(
+                scenario_id=prefix.scenario_id,
+                batch_id=batch.id,
+                prefix_id=prefix.id,
+                agent_prompt=variant.agent_prompt,
+                seed=variant.seed + i if variant.seed is not None else None,
+                status="pending"
+            ))
+    db.commit()
+    db.refresh(batch)
+
+    job = jobs.enqueue(db, "simulation_batch", {"batch_id": batch.id})
+    print(f"\n=== Forked {batch.total_runs} runs from prefix {prefix.id} (batch {batch.id}) ===")
+    return {**_batch_summary(batch), "prefix_id": prefix.id, "job_id": job.id}
+
+
+@router.get("/prefixes/{prefix_id}")
+def get_prefix(prefix_id: int, db: Session = Depends(get_db)):
+    """The prefix and its forked runs, grouped by agent prompt variant"""
+    prefix = db.query(models.ConversationPrefix).filter(models.ConversationPrefix.id == prefix_id).first()
+    if not prefix:
+        raise HTTPException(status_code=404, detail="Conversation prefix not found")
+    return {**_prefix_summary(prefix), "transcript": prefix.transcript}
+
+
+def _prefix_summary(prefix):
+    variants = {}
+    for run in prefix.runs:
+        variant = variants.setdefault(run.agent_prompt, {"agent_prompt": run.agent_prompt, "runs": []})
+        variant["runs"].append({
+            "run_id": run.id,
+            "seed": run.seed,
+            "status": run.status,
+            "stop_reason": run.stop_reason,
+            "messages": len(run.transcript or []),
+            "overall_score": run.evaluation.overall_score if run.evaluation else None,
+        })
+    for variant in variants.values():
+        scores = [r["overall_score"] for r in variant["runs"] if r["overall_score"] is not None]
+        variant["avg_overall_score"] = sum(scores) / len(scores) if scores else None
+
+    return {
+        "prefix_id": prefix.id,
+        "scenario_id": prefix.scenario_id,
+        "source_run_id": prefix.source_run_id,
+        "turns": len(prefix.transcript),
+        "created_at": prefix.created_at,
+        "variants": list(variants.values()),
+    }
+
+
+@router.get("/batch/{batch_id}")
+def get_simulation_batch(batch_id: int, db: Session = Depends(get_db)):
+    """Aggregate progress and per-run status for a batch"""
+    batch = db.query(models.SimulationBatch).filter(models.SimulationBatch.id == batch_id).first()
+    if not batch:
+        raise HTTPException(status_code=404, detail="Simulation batch not found")
+    return _batch_summary(batch)
+
+
+def _batch_summary(batch):
+    runs = sorted(batch.runs, key=lambda run: run.id)
+    counts = {status: 0 for status in ["pending", "running", "completed", "failed"]}
+    for run in runs:
+        counts[run.status] = counts.get(run.status, 0) + 1
+
+    scores = [run.evaluation.overall_score for run in runs if run.evaluation]
+    finished = counts["completed"] + counts["failed"]
+    return {
+        "batch_id": batch.id,
+        "status": batch.status,
+        "parallelism": batch.parallelism,
+        "total_runs": batch.total_runs,
+        "counts": counts,
+        "progress": finished / batch.total_runs if batch.total_runs else 1.0,
+        "avg_overall_score": sum(scores) / len(scores) if scores else None,
+        "created_at": batch.created_at,
+        "completed_at": batch.completed_at,
+        "runs": [
+            {
+                "run_id": run.id,
+                "scenario_id": run.scenario_id,
+                "status": run.status,
+                "duration_seconds": run.duration_seconds,
+                "overall_score": run.evaluation.overall_score if run.evaluation else None,
+            }
+            for run in runs
+        ],
+    }
+
+
+async def _run_batch(params, progress):
+    """
+    Job handler: run a batch's pending simulations, at most batch.parallelism at a time.
+    Runs left "running" by an interrupted attempt resume from their last checkpoint.
+    """
+    batch_id = params["batch_id"]
+    db = SessionLocal()
+    try:
+        batch = db.query(models.SimulationBatch).filter(models.SimulationBatch.id == batch_id).first()
+        if not batch:
+            raise ValueError(f"Batch {batch_id} not found")
+        for run in batch.runs:
+            if run.status == "running":
+                run.status = "pending"
+        run_ids = [run.id for run in batch.runs if run.status == "pending"]
+        finished = batch.total_runs - len(run_ids)
+        batch.status = "running"
+        db.commit()
+
+        progress("simulations", finished, batch.total_runs)
+        semaphore = asyncio.Semaphore(batch.parallelism)
+
+        async def run_item(run_id):
+            nonlocal finished
+            await _run_batch_item(run_id, semaphore)
+            finished += 1
+            progress("simulations", finished, batch.total_runs, f"Run {run_id} finished")
+
+        await asyncio.gather(*[run_item(run_id) for run_id in run_ids])
+        await pipeline.wait(run_ids)
+        db.expire_all()
+        batch = db.query(models.SimulationBatch).filter(models.SimulationBatch.id == batch_id).first()
+        if not batch:
+            raise ValueError(f"Batch {batch_id} was deleted while running")
+
+        batch.status = "completed"
+        batch.completed_at = datetime.utcnow()
+        db.commit()
+        print(f"\n=== Simulation Batch {batch_id} Complete ===")
+        return _batch_summary(batch)
+    finally:
+        db.close()
+
+
+async def _run_batch_item(run_id, semaphore):
+    async with semaphore:
+        # Each concurrent simulation gets its own session
+        db = SessionLocal()
+        simulation_run = db.query(models.SimulationRun).filter(models.SimulationRun.id == run_id).first()
+        if not simulation_run:
+            print(f"Batch simulation run {run_id} no longer exists, skipping it")
+            db.close()
+            return
+        try:
+            simulation_run.status = "running"
+            db.commit()
+            async for _ in _simulate(simulation_run.scenario, simulation_run, db):
+                pass
+        except Exception as e:
+            print(f"Batch simulation run {run_id} failed: {e}")
+            db.rollback()
+            simulation_run.status = "failed"
+            db.commit()
+        finally:
+            db.close()
+
+
+@router.get("/termination")
+def get_termination_stats(scenario_id: Optional[int] = None, db: Session = Depends(get_db)):
+    """
+    How completed runs ended, and how many messages early termination saved
+    against each scenario's max_turns
+    """
+    query = db.query(
+        models.SimulationRun.stop_reason,
+        models.SimulationRun.transcript,
+        models.ConversationPrefix.transcript,
+        models.Scenario.max_turns
+    ).join(models.Scenario, models.SimulationRun.scenario_id == models.Scenario.id).outerjoin(
+        models.ConversationPrefix, models.SimulationRun.prefix_id == models.ConversationPrefix.id
+    ).filter(
+        models.SimulationRun.status == "completed",
+        models.SimulationRun.stop_reason.isnot(None)
+    )
+    if scenario_id:
+        query = query.filter(models.SimulationRun.scenario_id == scenario_id)
+
+    by_reason = {}
+    for stop_reason, transcript, prefix, max_turns in query.all():
+        messages = len(prefix or []) + len(transcript or [])
+        stats = by_reason.setdefault(stop_reason, {"runs": 0, "messages": 0, "messages_saved": 0})
+        stats["runs"] += 1
+        stats["messages"] += messages
+        stats["messages_saved"] += max(0, max_turns * 2 - messages)
+
+    for stats in by_reason.values():
+        stats["avg_messages"] = round(stats["messages"] / stats["runs"], 1)
+    runs = sum(stats["runs"] for stats in by_reason.values())
+    messages = sum(stats["messages"] for stats in by_reason.values())
+    saved = sum(stats["messages_saved"] for stats in by_reason.values())
+    return {
+        "runs": runs,
+        "early_stops": runs - by_reason.get("max_turns", {}).get("runs", 0),
+        "messages": messages,
+        "messages_saved": saved,
+        "saved_fraction": round(saved / (messages + saved), 3) if messages + saved else None,
+        "by_reason": by_reason,
+    }
+
+
+async def _run_simulation_job(params, progress):
+    """Job handler: one simulation in its own session (see POST /api/jobs/simulation)"""
+    db = SessionLocal()
+    try:
+        scenario = db.query(models.Scenario).filter(models.Scenario.id == params["scenario_id"]).first()
+        if not scenario:
+            raise ValueError("Scenario not found")
+
+        simulation_run = _create_run(scenario.id, db)
+        total_turns = scenario.max_turns * 2
+        try:
+            async for event in _simulate(scenario, simulation_run, db):
+                if event["type"] == "turn":
+                    progress("conversation", event["index"] + 1, total_turns)
+        except Exception:
+            simulation_run.status = "failed"
+            db.commit()
+            raise
+
+        progress("evaluation")
+        await pipeline.wait([simulation_run.id])
+        db.refresh(simulation_run)
+        evaluation = simulation_run.evaluation
+        return {
+            "run_id": simulation_run.id,
+            "overall_score": evaluation.overall_score if evaluation else None,
+            "evaluation_status": simulation_run.evaluation_status,
+        }
+    finally:
+        db.close()
+
+
+jobs.register_handler("simulation", _run_simulation_job)
+jobs.register_handler("simulation_batch", _run_batch)
+
+
+def fail_interrupted_runs():
+    """
+    On startup, mark stand-alone runs left "running" by a restart as failed
+    (POST /{run_id}/resume picks them up again from their last turn).
+    Batch runs are left alone: their batch job re-queues and resumes them.
+    """
+    db = SessionLocal()
+    try:
+        count = db.query(models.SimulationRun).filter(
+            models.SimulationRun.status == "running",
+            models.SimulationRun.batch_id.is_(None)
+        ).update({"status": "failed"}, synchronize_session=False)
+        db.commit()
+        if count:
+            print(f"Marked {count} interrupted simulation runs as failed")
+    finally:
+        db.close()
 
 
 @router.get("/{run_id}", response_model=schemas.SimulationRun)
@@ -28,14 +506,7 @@ def get_simulation(run_id: int, db: Session = Depends(get_db)):
     return run
 
 
-@router.post("/run")
-def run_simulation(scenario_id: int, db: Session = Depends(get_db)):
-    """Execute a simulation from a scenario and store the result"""
-    # Get scenario with personas
-    scenario = db.query(models.Scenario).filter(models.Scenario.id == scenario_id).first()
-    if not scenario:
-        raise HTTPException(status_code=404, detail="Scenario not found")
-
+def _create_run(scenario_id, db):
     # Create simulation run record
     simulation_run = models.SimulationRun(
         scenario_id=scenario_id,
@@ -44,121 +515,196 @@ def run_simulation(scenario_id: int, db: Session = Depends(get_db)):
     db.add(simulation_run)
     db.commit()
     db.refresh(simulation_run)
+    return simulation_run
+
+
+def _serialize_run(simulation_run):
+    return schemas.SimulationRun.model_validate(simulation_run).model_dump(mode="json")
+
 
+async def _simulate(scenario, simulation_run, db, stream=False):
+    """
+    Run the conversation for a simulation run, store it and queue it for evaluation and
+    indexing (see services/pipeline.py). Yields the conversation events from
+    run_conversation, then "stored" once the transcript is saved.
+    Every event is also published to the run's live watchers. The pipeline follows with
+    "evaluation" (or "evaluation_failed"), "indexed" and the final run ("completed", with
+    an "error" if the evaluation failed); a failed conversation ends the stream with
+    "failed" instead.
+    LLM calls made along the way are logged against the run and the agent persona
+    (customer replies against the customer persona).
+    """
+    final = {"type": "failed", "run_id": simulation_run.id, "error": "Simulation cancelled"}
     try:
-        start_time = datetime.utcnow()
-
-        # Get personas
-        persona_a = scenario.persona_a
-        persona_b = scenario.persona_b
-
-        print(f"\n=== Starting Simulation: {scenario.name} ===")
-        print(f"Persona A: {persona_a.name}")
-        print(f"Persona B: {persona_b.name}")
-        print(f"Max turns: {scenario.max_turns}\n")
-
-        # Run conversation with concise responses
-        transcript = []
-        messages_a = [{"role": "user", "content": scenario.context}]
-        messages_b = []
-
-        # Conciseness instruction for natural dialogue
-        concise_instruction = """IMPORTANT: Keep responses SHORT and NATURAL (1-3 sentences max).
-Speak directly as your character without stage directions, labels, or parenthetical notes.
-Act like a real conversation, not a script."""
-
-        for turn in range(scenario.max_turns):
-            # Agent A speaks
-            print(f"Turn {turn + 1}: Agent A ({persona_a.name}) generating response...")
-            enhanced_prompt_a = f"{concise_instruction}\n\n{persona_a.system_prompt}"
-            response_a = get_llm_response(enhanced_prompt_a, messages_a, max_tokens=150)
-            print(f"Turn {turn + 1}: Agent A ({persona_a.name}) response complete")
-            audio_a = text_to_speech(response_a, persona_a.voice_id)
-            if audio_a:
-                print(f"Turn {turn + 1}: Agent A ({persona_a.name}) audio generated")
-
-            transcript.append({
-                "agent": "A",
-                "persona": persona_a.name,
-                "text": response_a,
-                "audio": audio_a
-            })
-            messages_a.append({"role": "assistant", "content": response_a})
-            messages_b.append({"role": "user", "content": response_a})
-
-            # Agent B responds
-            print(f"Turn {turn + 1}: Agent B ({persona_b.name}) generating response...")
-            enhanced_prompt_b = f"{concise_instruction}\n\n{persona_b.system_prompt}"
-            response_b = get_llm_response(enhanced_prompt_b, messages_b, max_tokens=150)
-            print(f"Turn {turn + 1}: Agent B ({persona_b.name}) response complete")
-            audio_b = text_to_speech(response_b, persona_b.voice_id)
-            if audio_b:
-                print(f"Turn {turn + 1}: Agent B ({persona_b.name}) audio generated")
-
-            transcript.append({
-                "agent": "B",
-                "persona": persona_b.name,
-                "text": response_b,
-                "audio": audio_b
-            })
-            messages_b.append({"role": "assistant", "content": response_b})
-            messages_a.append({"role": "user", "content": response_b})
-
-        # Calculate duration
-        end_time = datetime.utcnow()
-        duration = (end_time - start_time).total_seconds()
-
-        print(f"\n=== Simulation Complete ===")
-        print(f"Duration: {duration:.2f}s")
-        print(f"Total turns: {len(transcript)} messages\n")
-
-        # Update simulation run
-        simulation_run.transcript = transcript
-        simulation_run.status = "completed"
-        simulation_run.duration_seconds = duration
-        db.commit()
-        db.refresh(simulation_run)
+        with call_context(run_id=simulation_run.id, persona_id=scenario.persona_a_id):
+            async for event in _simulate_run(scenario, simulation_run, db, stream):
+                live.publish(simulation_run.id, event)
+                yield event
+        final = None
+    except Exception as e:
+        final["error"] = f"Simulation failed: {str(e)}"
+        raise
+    finally:
+        if final:
+            live.publish(simulation_run.id, final)
+
+
+async def _simulate_run(scenario, simulation_run, db, stream):
+    start_time = datetime.utcnow()
+
+    # Get personas
+    persona_a = scenario.persona_a
+    persona_b = scenario.persona_b
+
+    print(f"\n=== Starting Simulation: {scenario.name} ===")
+    print(f"Persona A: {persona_a.name}")
+    print(f"Persona B: {persona_b.name}")
+    print(f"Max turns: {scenario.max_turns}\n")
+
+    # Each turn is checkpointed as it completes: the transcript plus both personas'
+    # message histories. A run with a checkpoint continues from its last turn.
+    # Forked runs start after their shared prefix, which is kept out of the saved transcript.
+    transcript, state, elapsed = _restore_checkpoint(scenario, simulation_run)
+    stop_reason = simulation_run.stop_reason
+    prefix_len = len(simulation_run.prefix.transcript) if simulation_run.prefix else 0
+    if prefix_len:
+        print(f"Forked from prefix {simulation_run.prefix_id} ({prefix_len} messages), seed {simulation_run.seed}\n")
+    if len(transcript) > prefix_len:
+        print(f"Resuming from checkpoint after {len(transcript)} messages\n")
+        yield {"type": "resumed", "index": len(transcript)}
+    agent_prompt = simulation_run.agent_prompt or persona_a.system_prompt
+
+    # Run conversation with concise responses. TTS finishes in the background,
+    # so the duration covers conversation generation only (up to the last turn).
+    end_time = start_time
+    attempts = 0
+    with sampling_seed(simulation_run.seed):
+        while not stop_reason:
+            try:
+                async for event in run_conversation(
+                    f"{CONCISE_INSTRUCTION}\n\n{agent_prompt}",
+                    f"{CONCISE_INSTRUCTION}\n\n{persona_b.system_prompt}",
+                    scenario.context,
+                    scenario.max_turns,
+                    persona_a=persona_a.name,
+                    persona_b=persona_b.name,
+                    voice_a=persona_a.voice_id,
+                    voice_b=persona_b.voice_id,
+                    max_tokens=150,
+                    stream=stream,
+                    state=state,
+                    goal=scenario.goal or "Complete conversation",
+                    persona_a_id=persona_a.id,
+                    persona_b_id=persona_b.id
+                ):
+                    if event["type"] == "turn":
+                        transcript.append(event["turn"])
+                        end_time = datetime.utcnow()
+                        await _save_checkpoint(simulation_run, transcript[prefix_len:], state,
+                                               elapsed + (end_time - start_time).total_seconds())
+                    elif event["type"] == "turn_audio":
+                        transcript[event["index"]]["audio"] = event["audio"]
+                    elif event["type"] == "end":
+                        stop_reason = event["reason"]
+                    yield event
+                break
+            except Exception as e:
+                # A failed turn costs only that turn: pick up again from the last checkpoint
+                if attempts >= SIMULATION_RESUME_ATTEMPTS:
+                    raise
+                attempts += 1
+                print(f"Turn {len(transcript) + 1} failed ({type(e).__name__}: {e}), resuming from checkpoint")
+                transcript, state, elapsed = _restore_checkpoint(scenario, simulation_run)
+                yield {"type": "resumed", "index": len(transcript), "error": str(e)}
+
+    # Calculate duration
+    duration = elapsed + (end_time - start_time).total_seconds()
+
+    print(f"\n=== Simulation Complete ===")
+    print(f"Duration: {duration:.2f}s")
+    print(f"Total turns: {len(transcript)} messages (ended: {stop_reason})\n")
+
+    # Update simulation run
+    simulation_run.transcript = transcript[prefix_len:]
+    simulation_run.audio_paths = [turn["audio"] for turn in transcript[prefix_len:] if turn.get("audio")]
+    simulation_run.status = "completed"
+    simulation_run.duration_seconds = duration
+    simulation_run.stop_reason = stop_reason
+    simulation_run.checkpoint = None
+    if state and state.turn_evaluation["windows"]:
+        # Windows judged during the conversation, merged by the final evaluation
+        simulation_run.turn_evaluation = state.turn_evaluation
+    simulation_run.evaluation_status = pipeline.PENDING
+    simulation_run.index_status = pipeline.PENDING
+    simulation_run.postprocess_error = None
+    db.commit()
+    db.refresh(simulation_run)
+
+    # Judging and indexing run in the post-processing pipeline, which also sends
+    # the live watchers their final "completed" event
+    pipeline.submit(simulation_run.id)
+    yield {"type": "stored", "run_id": simulation_run.id}
 
-        # Auto-evaluate simulation
-        print(f"\n=== Evaluating Simulation ===")
-        scores = evaluate_conversation(transcript, scenario.goal or "Complete conversation")
-
-        # Calculate overall score (average of 4 metrics - now includes adaptation_quality)
-        num_metrics = 4  # goal_completion, conversational_quality, compliance, adaptation_quality
-        overall = (
-            scores.get("goal_completion", 5) + 
-            scores.get("conversational_quality", 5) + 
-            scores.get("compliance", 5) + 
-            scores.get("adaptation_quality", 5)
-        ) / num_metrics
-
-        # Create evaluation record
-        evaluation = models.Evaluation(
-            run_id=simulation_run.id,
-            scores=scores,
-            overall_score=overall,
-            feedback=scores.get("feedback", "")
+
+async def _save_checkpoint(simulation_run, transcript, state, elapsed):
+    """
+    Store the run's progress. The write goes through its own session in a worker thread,
+    so committing a growing transcript never blocks the event loop (other conversations
+    keep running); the run object is then updated without being marked dirty.
+    """
+    values = {
+        # Copies, so later audio updates to the same turns are not written through
+        "transcript": [dict(turn) for turn in transcript],
+        "checkpoint": {**state.to_dict(), "elapsed": elapsed},
+        "duration_seconds": elapsed,
+    }
+    await asyncio.to_thread(_write_checkpoint, simulation_run.id, values)
+    for key, value in values.items():
+        set_committed_value(simulation_run, key, value)
+
+
+def _write_checkpoint(run_id, values):
+    db = SessionLocal()
+    try:
+        db.query(models.SimulationRun).filter(models.SimulationRun.id == run_id).update(
+            values, synchronize_session=False
         )
-        db.add(evaluation)
         db.commit()
-        print(f"Evaluation complete - Overall: {overall:.1f}/10 (adaptation: {scores.get('adaptation_quality', 'N/A')}/10)")
-
-        # Add to vector store for future search
-        print(f"Adding conversation to vector store...")
-        add_conversation(
-            run_id=simulation_run.id,
-            transcript=transcript,
-            metadata={
-                "persona_a": persona_a.name,
-                "persona_b": persona_b.name,
-                "scenario": scenario.name,
-                "overall_score": overall,
-                "goal_completion": scores["goal_completion"],
-                "conversational_quality": scores["conversational_quality"],
-                "compliance": scores["compliance"]
-            }
-        )
+    finally:
+        db.close()
+
+
+def _restore_checkpoint(scenario, simulation_run):
+    """(transcript, ConversationState, seconds elapsed) from the run's last checkpoint, or a fresh start"""
+    checkpoint = simulation_run.checkpoint
+    prefix = simulation_run.prefix
+    transcript = [dict(turn) for turn in simulation_run.full_transcript]
+    if checkpoint:
+        state = ConversationState.from_dict(checkpoint, transcript, scenario.context)
+        return transcript, state, checkpoint.get("elapsed", 0.0)
+    if simulation_run.stop_reason:  # The conversation itself had finished
+        return transcript, None, simulation_run.duration_seconds or 0.0
+    if prefix:
+        return transcript, ConversationState.from_dict(prefix.state, transcript, scenario.context), 0.0
+    return [], ConversationState(scenario.context), 0.0
+
+
+@router.post("/run", response_model=schemas.SimulationRun)
+async def run_simulation(scenario_id: int, db: Session = Depends(get_db)):
+    """
+    Execute a simulation from a scenario and store the result. Returns once the transcript
+    is stored; evaluation_status and index_status show when the scores are ready.
+    """
+    # Get scenario with personas
+    scenario = db.query(models.Scenario).filter(models.Scenario.id == scenario_id).first()
+    if not scenario:
+        raise HTTPException(status_code=404, detail="Scenario not found")
+
+    simulation_run = _create_run(scenario_id, db)
 
+    try:
+        async for _ in _simulate(scenario, simulation_run, db):
+            pass
         return simulation_run
 
     except Exception as e:
@@ -168,6 +714,157 @@ Act like a real conversation, not a script."""
         raise HTTPException(status_code=500, detail=f"Simulation failed: {str(e)}")
 
 
+@router.post("/{run_id}/resume")
+async def resume_simulation(run_id: int, db: Session = Depends(get_db)):
+    """
+    Pick a failed or interrupted run back up from its last completed turn, with the same
+    message histories, then evaluate and index it as usual. For a completed run whose
+    evaluation or indexing failed, only the failed post-processing is queued again.
+    """
+    simulation_run = db.query(models.SimulationRun).filter(models.SimulationRun.id == run_id).first()
+    if not simulation_run:
+        raise HTTPException(status_code=404, detail="Simulation run not found")
+    if simulation_run.status == "completed" and pipeline.FAILED in (
+            simulation_run.evaluation_status, simulation_run.index_status):
+        simulation_run.evaluation_status = pipeline.PENDING
+        simulation_run.index_status = pipeline.PENDING
+        simulation_run.postprocess_error = None
+        db.commit()
+        pipeline.submit(run_id)
+        return _serialize_run(simulation_run)
+    if simulation_run.status != "failed":
+        raise HTTPException(status_code=400, detail=f"Only failed runs can be resumed (run is {simulation_run.status})")
+
+    simulation_run.status = "running"
+    db.commit()
+
+    try:
+        async for _ in _simulate(simulation_run.scenario, simulation_run, db):
+            pass
+        return _serialize_run(simulation_run)
+
+    except Exception as e:
+        simulation_run.status = "failed"
+        db.commit()
+        raise HTTPException(status_code=500, detail=f"Simulation failed: {str(e)}")
+
+
+@router.post("/run/stream")
+async def run_simulation_stream(scenario_id: int):
+    """
+    Execute a simulation, streaming it as Server-Sent Events:
+    partial reply text ("delta"), first-sentence audio ("audio"), finished turns ("turn"),
+    turn audio ("turn_audio"), the saved transcript ("stored"), the evaluation, the
+    vector-store write ("indexed"), and finally the run ("completed") or an error ("failed").
+    The simulation runs in the background, so it finishes even if this client disconnects;
+    others can follow it from GET /{run_id}/live.
+    """
+    # The simulation outlives the request handler, so it owns its session
+    db = SessionLocal()
+    scenario = db.query(models.Scenario).filter(models.Scenario.id == scenario_id).first()
+    if not scenario:
+        db.close()
+        raise HTTPException(status_code=404, detail="Scenario not found")
+
+    simulation_run = _create_run(scenario_id, db)
+    # Subscribe before starting, so this client also gets the first deltas
+    events = _watch(simulation_run, db)
+
+    task = asyncio.create_task(_run_detached(scenario, simulation_run, db))
+    _stream_tasks.add(task)
+    task.add_done_callback(_stream_tasks.discard)
+
+    return StreamingResponse(_sse(events), media_type="text/event-stream")
+
+
+async def _run_detached(scenario, simulation_run, db):
+    try:
+        async for _ in _simulate(scenario, simulation_run, db, stream=True):
+            pass
+    except Exception as e:
+        print(f"Simulation run {simulation_run.id} failed: {e}")
+        db.rollback()
+        simulation_run.status = "failed"
+        db.commit()
+    finally:
+        db.close()
+
+
+@router.get("/{run_id}/live")
+async def watch_simulation(run_id: int, db: Session = Depends(get_db)):
+    """
+    Follow a simulation as Server-Sent Events, from any number of clients at once.
+    Mid-run, the events so far are replayed first; then live events up to "completed" or
+    "failed". A finished run sends just its stored result. Watchers that fall too far
+    behind get "lagged" and should reconnect.
+    """
+    run = db.query(models.SimulationRun).filter(models.SimulationRun.id == run_id).first()
+    if not run:
+        raise HTTPException(status_code=404, detail="Simulation run not found")
+    return StreamingResponse(_sse(_watch(run, db)), media_type="text/event-stream")
+
+
+@router.websocket("/{run_id}/ws")
+async def watch_simulation_ws(websocket: WebSocket, run_id: int):
+    """Same events as GET /{run_id}/live, as JSON WebSocket messages"""
+    db = SessionLocal()
+    try:
+        run = db.query(models.SimulationRun).filter(models.SimulationRun.id == run_id).first()
+        events = _watch(run, db) if run else None
+    finally:
+        db.close()
+    if events is None:
+        await websocket.close(code=1008, reason="Simulation run not found")
+        return
+
+    await websocket.accept()
+    try:
+        async for event in events:
+            await websocket.send_text(json.dumps(event or {"type": "keepalive"}, default=str))
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await events.aclose()
+
+
+def _watch(run, db):
+    """
+    Async generator of a run's events for one watcher (None = keepalive). Subscribes
+    immediately, so nothing published after this call is missed.
+    """
+    run_id = run.id
+    if not live.is_live(run_id) and run.status in ("completed", "failed"):
+        final = {"type": run.status, "run": _serialize_run(run)}
+        history, queue = [final], None
+    else:
+        history, queue = live.subscribe(run_id)
+
+    async def events():
+        try:
+            for event in history:
+                yield event
+            while queue is not None:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=LIVE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                yield event
+                if event["type"] in live.FINAL_EVENTS or event["type"] == "lagged":
+                    return
+        finally:
+            if queue is not None:
+                live.unsubscribe(run_id, queue)
+
+    return events()
+
+
+async def _sse(events):
+    async for event in events:
+        yield format_sse(event) if event else ": keepalive\n\n"
+
+
 @router.delete("/{run_id}")
 def delete_simulation(run_id: int, db: Session = Depends(get_db)):
     """Delete a simulation run"""
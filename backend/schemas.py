@@ -70,6 +70,15 @@ class SimulationRunBase(BaseModel):
     audio_paths: Optional[List[str]] = None
     status: str = "pending"
     duration_seconds: Optional[float] = None
+    stop_reason: Optional[str] = None
+    batch_id: Optional[int] = None
+    prefix_id: Optional[int] = None  # Forked runs: transcript continues this shared prefix
+    agent_prompt: Optional[str] = None
+    seed: Optional[int] = None
+    turn_evaluation: Optional[dict] = None  # Windows judged while the conversation ran
+    evaluation_status: Optional[str] = None  # Judging after the transcript is stored
+    index_status: Optional[str] = None
+    postprocess_error: Optional[str] = None
 
 
 class SimulationRun(SimulationRunBase):
@@ -81,12 +90,64 @@ class SimulationRun(SimulationRunBase):
         from_attributes = True
 
 
+class SimulationRunListItem(BaseModel):
+    id: int
+    scenario_id: int
+    status: str
+    duration_seconds: Optional[float] = None
+    stop_reason: Optional[str] = None
+    batch_id: Optional[int] = None
+    prefix_id: Optional[int] = None
+    agent_prompt: Optional[str] = None
+    seed: Optional[int] = None
+    evaluation_status: Optional[str] = None
+    index_status: Optional[str] = None
+    created_at: datetime
+    evaluation: Optional["Evaluation"] = None
+    transcript: Optional[List[dict]] = None  # Only with fields=full
+    audio_paths: Optional[List[str]] = None  # Only with fields=full
+
+
+class SimulationRunPage(BaseModel):
+    items: List[SimulationRunListItem]
+    next_cursor: Optional[int] = None  # None on the last page
+
+
+class SimulationBatchItem(BaseModel):
+    scenario_id: int
+    repeat: int = 1
+
+
+class SimulationBatchCreate(BaseModel):
+    items: List[SimulationBatchItem]
+    parallelism: Optional[int] = None  # Default: SIMULATION_BATCH_PARALLELISM
+
+
+class ConversationPrefixCreate(BaseModel):
+    turns: int  # Messages in the prefix
+    scenario_id: Optional[int] = None  # Generate the prefix for this scenario...
+    source_run_id: Optional[int] = None  # ...or cut it from an existing run
+
+
+class ForkVariant(BaseModel):
+    agent_prompt: Optional[str] = None  # Default: persona A's current prompt
+    seed: Optional[int] = None  # Repeats use seed, seed + 1, ...
+    repeat: int = 1
+
+
+class ForkCreate(BaseModel):
+    variants: List[ForkVariant]
+    parallelism: Optional[int] = None  # Default: SIMULATION_BATCH_PARALLELISM
+
+
 # Evaluation Schemas
 class EvaluationBase(BaseModel):
     run_id: int
     scores: dict
     overall_score: float
     feedback: Optional[str] = None
+    score_variance: Optional[dict] = None
+    judge_count: Optional[int] = None
 
 
 class Evaluation(EvaluationBase):
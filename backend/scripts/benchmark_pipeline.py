@@ -0,0 +1,84 @@
+"""
+Benchmark the simulation pipeline end to end against a running backend.
+
+Meant to be used offline with the stub provider:
+    python stub_llm_server.py                        # terminal 1
+    LLM_PROVIDER=stub DISABLE_TTS=true uvicorn main:app   # terminal 2
+    python scripts/benchmark_pipeline.py --scenarios 1,2,3 --runs 10 --concurrency 5
+
+Reports wall-clock time, per-run latency percentiles and the backend's LLM stats.
+"""
+
+import sys
+import time
+import asyncio
+import argparse
+import httpx
+
+
+async def run_one(client, api_url, scenario_id, semaphore, results):
+    async with semaphore:
+        started = time.monotonic()
+        try:
+            response = await client.post(f"{api_url}/simulations/run", params={"scenario_id": scenario_id})
+            ok = response.status_code == 200
+        except httpx.HTTPError as e:
+            print(f"  Scenario {scenario_id}: {type(e).__name__}: {e}")
+            ok = False
+        elapsed = time.monotonic() - started
+        results.append((scenario_id, ok, elapsed))
+        print(f"  Scenario {scenario_id}: {'ok' if ok else 'FAILED'} in {elapsed:.2f}s")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p * len(values)))] if values else 0.0
+
+
+async def benchmark(api_url, scenario_ids, runs, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+
+    async with httpx.AsyncClient(timeout=None) as client:
+        print(f"Running {runs} simulations per scenario across {len(scenario_ids)} scenarios "
+              f"(concurrency {concurrency})...")
+        started = time.monotonic()
+        await asyncio.gather(*[
+            run_one(client, api_url, scenario_id, semaphore, results)
+            for scenario_id in scenario_ids
+            for _ in range(runs)
+        ])
+        wall = time.monotonic() - started
+
+        cache = (await client.get(f"{api_url}/llm/cache")).json()
+        routing = (await client.get(f"{api_url}/llm/routing")).json()
+
+    durations = [elapsed for _, ok, elapsed in results if ok]
+    failures = sum(1 for _, ok, _ in results if not ok)
+
+    print("\n" + "=" * 60)
+    print(f"Simulations: {len(results)} ({failures} failed)")
+    print(f"Wall clock: {wall:.2f}s ({len(results) / wall:.2f} sims/s)")
+    print(f"Per-run p50: {percentile(durations, 0.5):.2f}s  p95: {percentile(durations, 0.95):.2f}s  "
+          f"max: {max(durations, default=0):.2f}s")
+    print(f"LLM cache hit rate: {cache.get('hit_rate', 0):.1%}")
+    for provider, stats in routing.get("providers", {}).items():
+        print(f"{provider}: p50 {stats['p50_seconds']}s  p95 {stats['p95_seconds']}s  ({stats['samples']} samples)")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the simulation pipeline")
+    parser.add_argument("--api-url", default="http://localhost:8000/api")
+    parser.add_argument("--scenarios", default="1", help="Comma-separated scenario IDs")
+    parser.add_argument("--runs", type=int, default=5, help="Simulations per scenario")
+    parser.add_argument("--concurrency", type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        scenario_ids = [int(s) for s in args.scenarios.split(",")]
+    except ValueError:
+        print("[ERROR] --scenarios must be comma-separated integers")
+        sys.exit(1)
+
+    asyncio.run(benchmark(args.api_url, scenario_ids, args.runs, args.concurrency))
@@ -0,0 +1,89 @@
+"""
+Benchmark the local pre-scorer (services/prescore.py) against stored judge scores.
+
+For every completed run with an LLM-judged Evaluation, runs the local checks on
+the transcript and reports how many judge calls would be skipped or narrowed, and
+how closely each locally fixed metric agrees with what the judge gave.
+No LLM calls are made.
+
+Run: python scripts/benchmark_prescore.py [--scenario 3] [--limit 500] [--confidence 0.85]
+"""
+
+import sys
+import os
+import argparse
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import SessionLocal
+import models
+from services.evaluation import SCORE_METRICS, overall_score
+from services.prescore import PRESCORE_CONFIDENCE, prescore, fixed_metrics
+
+AGREEMENT_TOLERANCE = 2  # points on the 1-10 scale
+
+
+def benchmark(scenario_id=None, limit=None, confidence=PRESCORE_CONFIDENCE):
+    db = SessionLocal()
+
+    try:
+        query = db.query(models.SimulationRun).join(models.SimulationRun.evaluation).filter(
+            models.SimulationRun.status == "completed"
+        )
+        if scenario_id:
+            query = query.filter(models.SimulationRun.scenario_id == scenario_id)
+        query = query.order_by(models.SimulationRun.id.desc())
+        if limit:
+            query = query.limit(limit)
+        # Only judge-scored evaluations are ground truth
+        runs = [run for run in query.all() if run.evaluation.scores.get("source") != "prescore"]
+
+        if not runs:
+            print("No judged runs to benchmark against")
+            return
+
+        skipped, narrowed = [], 0
+        errors = {metric: [] for metric in SCORE_METRICS}
+        for run in runs:
+            judged = run.evaluation.scores
+            fixed = fixed_metrics(prescore(run.full_transcript), confidence)
+            for metric, (score, _) in fixed.items():
+                if isinstance(judged.get(metric), (int, float)) and metric not in judged.get("prescored", []):
+                    errors[metric].append(abs(score - judged[metric]))
+            if all(metric in fixed for metric in SCORE_METRICS):
+                local = {metric: score for metric, (score, _) in fixed.items()}
+                skipped.append(abs(overall_score(local) - run.evaluation.overall_score))
+            elif fixed:
+                narrowed += 1
+
+        print(f"\n{'=' * 60}")
+        print(f"Runs with judge scores: {len(runs)} (confidence threshold {confidence})")
+        print(f"Judge calls saved:  {len(skipped)} ({len(skipped) / len(runs):.0%})")
+        print(f"Judge calls narrowed (some metrics fixed locally): {narrowed} ({narrowed / len(runs):.0%})")
+        if skipped:
+            print(f"Skipped runs, overall score vs judge: mean abs error {sum(skipped) / len(skipped):.2f}")
+
+        print(f"\n{'Metric':<25}{'Fixed':>8}{'MAE':>8}{'Within ' + str(AGREEMENT_TOLERANCE):>12}")
+        for metric in SCORE_METRICS:
+            metric_errors = errors[metric]
+            if metric_errors:
+                within = sum(1 for error in metric_errors if error <= AGREEMENT_TOLERANCE) / len(metric_errors)
+                print(f"{metric:<25}{len(metric_errors):>8}{sum(metric_errors) / len(metric_errors):>8.2f}{within:>12.0%}")
+            else:
+                print(f"{metric:<25}{0:>8}{'-':>8}{'-':>12}")
+        print("=" * 60)
+
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the local pre-scorer against stored judge scores")
+    parser.add_argument("--scenario", type=int, help="Only runs of this scenario")
+    parser.add_argument("--limit", type=int, help="Max runs (most recent first)")
+    parser.add_argument("--confidence", type=float, default=PRESCORE_CONFIDENCE,
+                        help="Confidence at which a local estimate replaces the judge's")
+    args = parser.parse_args()
+
+    benchmark(args.scenario, args.limit, args.confidence)
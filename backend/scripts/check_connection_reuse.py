@@ -0,0 +1,101 @@
+"""
+Check that LLM calls reuse pooled provider clients and their HTTP connections.
+
+Runs sync and async calls against the stub LLM server and fails unless there is one
+client per provider and the stub saw a bounded number of connections (keep-alive
+reuse) rather than one per call.
+
+Meant to be used offline with the stub provider:
+    python stub_llm_server.py                        # terminal 1
+    python scripts/check_connection_reuse.py --calls 200 --concurrency 20
+
+Exits non-zero if a check fails.
+"""
+
+import sys
+import os
+import asyncio
+import argparse
+
+# Point services/llm.py at the stub before it is imported; no caching or call logging
+os.environ.update(LLM_PROVIDER="stub", LLM_FALLBACK_PROVIDERS="", LLM_HEDGE_ENABLED="false",
+                  LLM_CACHE_ENABLED="false", LLM_LOG_ENABLED="false")
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from services import llm
+
+
+def stub_connections(stats_url):
+    return httpx.get(stats_url).json()["connections"]
+
+
+def call(index):
+    return llm.get_llm_response("You are a customer.", [{"role": "user", "content": f"Hello ({index})"}],
+                                max_tokens=20, use_cache=False)
+
+
+async def call_async(index, semaphore):
+    async with semaphore:
+        return await llm.get_llm_response_async("You are a customer.",
+                                                [{"role": "user", "content": f"Hello ({index})"}],
+                                                max_tokens=20, use_cache=False)
+
+
+async def run_async(calls, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    await asyncio.gather(*[call_async(index, semaphore) for index in range(calls)])
+    clients = len(llm._async_clients)
+    await llm.close_async_clients()
+    return clients
+
+
+def check(calls, concurrency):
+    stats_url = llm.PROVIDERS["stub"]["base_url"].rstrip("/").removesuffix("/v1") + "/stats"
+    failures = []
+
+    before = stub_connections(stats_url)
+    for index in range(calls):
+        call(index)
+    sync_connections = stub_connections(stats_url) - before
+    print(f"Sync:  {calls} calls over {sync_connections} connection(s)")
+    if llm.get_client("stub") is not llm.get_client("stub") or len(llm._clients) != 1:
+        failures.append(f"expected one sync client, found {len(llm._clients)}")
+    if sync_connections > 1:
+        failures.append(f"sync calls opened {sync_connections} connections (expected 1)")
+
+    before = stub_connections(stats_url)
+    async_clients = asyncio.run(run_async(calls, concurrency))
+    async_connections = stub_connections(stats_url) - before
+    print(f"Async: {calls} calls (concurrency {concurrency}) over {async_connections} connection(s)")
+    if async_clients != 1:
+        failures.append(f"expected one async client, found {async_clients}")
+    # Each concurrent call needs at most one connection of its own
+    bound = min(concurrency, llm.LLM_MAX_CONCURRENCY, llm.LLM_MAX_CONNECTIONS)
+    if async_connections > bound:
+        failures.append(f"async calls opened {async_connections} connections (expected at most {bound})")
+
+    llm.close_clients()
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check LLM client and connection reuse against the stub")
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    try:
+        failures = check(args.calls, args.concurrency)
+    except httpx.HTTPError as e:
+        print(f"[ERROR] Stub LLM server not reachable at {llm.PROVIDERS['stub']['base_url']}: {e}")
+        sys.exit(1)
+
+    print("\n" + "=" * 60)
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    print("Connection reuse OK" if not failures else f"{len(failures)} check(s) failed")
+    print("=" * 60)
+    sys.exit(1 if failures else 0)
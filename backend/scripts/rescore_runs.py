@@ -0,0 +1,111 @@
+"""
+Re-score stored simulation transcripts with the current judge prompt.
+
+Transcripts are judged in bulk through LLMBatch: one provider batch job per chunk
+when the provider has a batch API (e.g. Groq), otherwise a local fan-out at batch
+priority. Only judge cache misses are sent, so after a backfill or restart just the
+transcripts not yet judged under the current rubric cost a judge call (--force
+re-judges everything). Each run's Evaluation is updated in place (or created if missing);
+runs whose judge call fails keep their stored evaluation and are listed as failed.
+
+Run: python scripts/rescore_runs.py [--scenario 3] [--limit 500] [--mode auto|provider|local] [--force]
+"""
+
+import sys
+import os
+import argparse
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import SessionLocal, engine
+import models
+from services.evaluation import evaluate_conversations_batch, overall_score, judge_variance, RUBRIC_VERSION
+from services import judge_cache
+
+models.Base.metadata.create_all(bind=engine)
+
+
+def rescore(scenario_id=None, limit=None, chunk_size=1000, mode=None, force=False):
+    db = SessionLocal()
+
+    try:
+        query = db.query(models.SimulationRun).filter(
+            models.SimulationRun.status == "completed",
+            models.SimulationRun.transcript.isnot(None)
+        )
+        if scenario_id:
+            query = query.filter(models.SimulationRun.scenario_id == scenario_id)
+        query = query.order_by(models.SimulationRun.id)
+        if limit:
+            query = query.limit(limit)
+        runs = [run for run in query.all() if run.full_transcript]
+
+        print(f"Re-scoring {len(runs)} simulation runs (chunks of {chunk_size}, rubric {RUBRIC_VERSION})...")
+        changes = []
+        failed = []
+
+        for start in range(0, len(runs), chunk_size):
+            chunk = runs[start:start + chunk_size]
+            print(f"\nChunk {start // chunk_size + 1}: runs {chunk[0].id}-{chunk[-1].id}")
+
+            results = evaluate_conversations_batch([
+                {
+                    "transcript": run.full_transcript,
+                    "goal": (run.scenario.goal if run.scenario else None) or "Complete conversation",
+                    "run_id": run.id,
+                }
+                for run in chunk
+            ], mode=mode, use_cache=not force)
+
+            for run, scores in zip(chunk, results):
+                if scores.get("judge_failed"):
+                    # Neutral placeholder scores: never replace a real judgment with them
+                    failed.append((run.id, scores.get("feedback")))
+                    continue
+                overall = overall_score(scores)
+                evaluation = run.evaluation
+                if evaluation is None:
+                    evaluation = models.Evaluation(run_id=run.id)
+                    db.add(evaluation)
+                    previous = None
+                else:
+                    previous = evaluation.overall_score
+                evaluation.scores = scores
+                evaluation.overall_score = overall
+                evaluation.feedback = scores.get("feedback", "")
+                evaluation.score_variance, evaluation.judge_count = judge_variance(scores)
+                changes.append((run.id, previous, overall))
+
+            db.commit()
+
+        rescored = [(old, new) for _, old, new in changes if old is not None]
+        cache = judge_cache.get_stats(RUBRIC_VERSION)
+        print(f"\n{'=' * 60}")
+        print(f"Re-scored {len(changes)} runs ({len(changes) - len(rescored)} had no evaluation)")
+        if failed:
+            print(f"Judge failed for {len(failed)} runs (evaluations left unchanged):")
+            for run_id, error in failed:
+                print(f"  Run {run_id}: {error}")
+        print(f"Judge cache: {cache['memory_hits'] + cache['disk_hits']} hits, {cache['misses']} misses "
+              f"({cache['hit_rate']:.0%} hit rate)")
+        if rescored:
+            old_avg = sum(old for old, _ in rescored) / len(rescored)
+            new_avg = sum(new for _, new in rescored) / len(rescored)
+            print(f"Average overall score: {old_avg:.2f} -> {new_avg:.2f}")
+        print("=" * 60)
+
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score stored simulation transcripts")
+    parser.add_argument("--scenario", type=int, help="Only runs of this scenario")
+    parser.add_argument("--limit", type=int, help="Max runs to re-score")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Runs per batch submission")
+    parser.add_argument("--mode", choices=["auto", "provider", "local"], help="Default: LLM_BATCH_MODE")
+    parser.add_argument("--force", action="store_true", help="Re-judge cached transcripts too")
+    args = parser.parse_args()
+
+    rescore(args.scenario, args.limit, args.chunk_size, args.mode, args.force)
@@ -1,6 +1,9 @@
 """
-Upgrade database schema to add mutation_attempts table and baseline_score column
-Run this ONCE to upgrade existing database
+Upgrade database schema to add mutation_attempts table, baseline_score column
+and simulation_runs.batch_id / stop_reason / checkpoint / prefix_id / agent_prompt / seed /
+evaluation_status / index_status / postprocess_error / turn_evaluation, evaluations.score_variance / judge_count, llm_calls.cached_tokens,
+and indexes for filtering simulation runs and joining their evaluations
+Run this after pulling schema changes (safe to re-run)
 """
 import sqlite3
 import os
@@ -48,6 +51,101 @@ def upgrade_schema():
         else:
             raise
 
+    # Add batch_id column to simulation_runs (simulation_batches itself is created by the app)
+    try:
+        cursor.execute("ALTER TABLE simulation_runs ADD COLUMN batch_id INTEGER REFERENCES simulation_batches(id)")
+        print("[OK] Added batch_id column to simulation_runs")
+    except sqlite3.OperationalError as e:
+        if "duplicate column name" in str(e).lower():
+            print("[SKIP] batch_id column already exists")
+        else:
+            raise
+
+    # Add stop_reason column to simulation_runs (why the conversation ended)
+    try:
+        cursor.execute("ALTER TABLE simulation_runs ADD COLUMN stop_reason VARCHAR")
+        print("[OK] Added stop_reason column to simulation_runs")
+    except sqlite3.OperationalError as e:
+        if "duplicate column name" in str(e).lower():
+            print("[SKIP] stop_reason column already exists")
+        else:
+            raise
+
+    # Add checkpoint column to simulation_runs (per-turn resume state)
+    try:
+        cursor.execute("ALTER TABLE simulation_runs ADD COLUMN checkpoint JSON")
+        print("[OK] Added checkpoint column to simulation_runs")
+    except sqlite3.OperationalError as e:
+        if "duplicate column name" in str(e).lower():
+            print("[SKIP] checkpoint column already exists")
+        else:
+            raise
+
+    # Forked runs: shared prefix, agent prompt variant and seed (conversation_prefixes is created by the app)
+    for column, definition in [
+        ("prefix_id", "INTEGER REFERENCES conversation_prefixes(id)"),
+        ("agent_prompt", "VARCHAR"),
+        ("seed", "INTEGER"),
+    ]:
+        try:
+            cursor.execute(f"ALTER TABLE simulation_runs ADD COLUMN {column} {definition}")
+            print(f"[OK] Added {column} column to simulation_runs")
+        except sqlite3.OperationalError as e:
+            if "duplicate column name" in str(e).lower():
+                print(f"[SKIP] {column} column already exists")
+            else:
+                raise
+
+    # Post-processing status (evaluation and indexing run after the transcript is stored)
+    # and the turn-level evaluation windows judged during the conversation
+    for column, definition in [
+        ("evaluation_status", "VARCHAR"),
+        ("index_status", "VARCHAR"),
+        ("postprocess_error", "VARCHAR"),
+        ("turn_evaluation", "JSON"),
+    ]:
+        try:
+            cursor.execute(f"ALTER TABLE simulation_runs ADD COLUMN {column} {definition}")
+            print(f"[OK] Added {column} column to simulation_runs")
+        except sqlite3.OperationalError as e:
+            if "duplicate column name" in str(e).lower():
+                print(f"[SKIP] {column} column already exists")
+            else:
+                raise
+
+    # Judge ensemble spread (per-metric variance and how many judges scored the run)
+    for column, definition in [("score_variance", "JSON"), ("judge_count", "INTEGER DEFAULT 1")]:
+        try:
+            cursor.execute(f"ALTER TABLE evaluations ADD COLUMN {column} {definition}")
+            print(f"[OK] Added {column} column to evaluations")
+        except sqlite3.OperationalError as e:
+            if "duplicate column name" in str(e).lower():
+                print(f"[SKIP] {column} column already exists")
+            else:
+                raise
+
+    # Prompt tokens served from the provider's prefix cache (llm_calls itself is created by the app)
+    try:
+        cursor.execute("ALTER TABLE llm_calls ADD COLUMN cached_tokens INTEGER")
+        print("[OK] Added cached_tokens column to llm_calls")
+    except sqlite3.OperationalError as e:
+        if "duplicate column name" in str(e).lower():
+            print("[SKIP] cached_tokens column already exists")
+        elif "no such table" in str(e).lower():
+            print("[SKIP] llm_calls table not created yet")
+        else:
+            raise
+
+    # Indexes for the simulation listing filters and the evaluation join (same names create_all uses)
+    for table, column in [
+        ("simulation_runs", "scenario_id"),
+        ("simulation_runs", "status"),
+        ("simulation_runs", "batch_id"),
+        ("evaluations", "run_id"),
+    ]:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})")
+        print(f"[OK] Index on {table}.{column}")
+
     conn.commit()
     conn.close()
 
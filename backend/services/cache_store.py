@@ -0,0 +1,270 @@
+"""
+Keyed two-tier cache store shared by the LLM response and judge score caches.
+
+Values (text) live in an in-memory LRU in front of a SQLite table. Entries can
+expire after a TTL, the table can be held under a size budget by evicting the
+least recently used rows, and each entry can carry a tag (e.g. the rubric
+version) so a whole generation can be counted or dropped at once.
+
+Only disk reads ever block the caller. Writes and last-access updates go to the
+memory tier at once and are written to SQLite in batches by a background thread,
+and async callers read the disk tier through get_async (in a worker thread).
+"""
+import time
+import atexit
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+
+COLUMNS = {"key", "tag", "value", "size", "created_at", "accessed_at"}
+TOUCH_BATCH = 200  # last-access updates held before the writer is woken for them alone
+
+
+class CacheStore:
+    """
+    One cache: name (for log messages), SQLite file path and table, the number of
+    entries kept in memory, and optionally ttl (seconds) and max_bytes for the table.
+    Thread-safe: the memory tier has its own lock, never held during disk I/O.
+    """
+
+    def __init__(self, name, path, table, memory_items, ttl=None, max_bytes=None):
+        self.name = name
+        self.path = path
+        self.table = table
+        self.memory_items = memory_items
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._memory_lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (value, created_at, tag)
+        self._pending = {}  # key -> (value, created_at, tag) not yet written
+        self._touched = {}  # key -> last access, not yet written
+        self._conn = None
+        self._total_bytes = 0  # size of the table's values, kept up to date by the writer
+        self._writer = None
+        self._wake = threading.Event()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def _get_conn(self):
+        """The SQLite connection (call with the disk lock held)"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({self.table})")}
+            if columns and not COLUMNS - {"tag"} <= columns:
+                # Written by an older layout: it is only a cache, so start it over
+                print(f"{self.name}: rebuilding {self.table} in the current layout")
+                conn.execute(f"DROP TABLE {self.table}")
+            elif columns and "tag" not in columns:
+                conn.execute(f"ALTER TABLE {self.table} ADD COLUMN tag TEXT")
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    key TEXT PRIMARY KEY,
+                    tag TEXT,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_accessed ON {self.table} (accessed_at)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_created ON {self.table} (created_at)")
+            conn.commit()
+            self._total_bytes = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _expired(self, created_at, now):
+        return self.ttl is not None and now - created_at >= self.ttl
+
+    def _remember(self, key, value, created_at, tag):
+        self._memory[key] = (value, created_at, tag)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _memory_get(self, key, now):
+        """The value from memory (or waiting to be written), or None; never touches the disk"""
+        with self._memory_lock:
+            entry = self._memory.get(key) or self._pending.get(key)
+            if entry is None or self._expired(entry[1], now):
+                return None
+            if key in self._memory:
+                self._memory.move_to_end(key)
+            self._touched[key] = now
+            self._stats["memory_hits"] += 1
+            touched = len(self._touched)
+        if touched >= TOUCH_BATCH:
+            self._wake_writer()
+        return entry[0]
+
+    def _disk_get(self, key, now):
+        try:
+            with self._disk_lock:
+                row = self._get_conn().execute(
+                    f"SELECT value, created_at, tag FROM {self.table} WHERE key = ? AND created_at > ?",
+                    (key, now - self.ttl if self.ttl is not None else float("-inf"))
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"{self.name} read failed: {e}")
+            row = None
+
+        with self._memory_lock:
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._remember(key, *row)
+            self._touched[key] = now
+            self._stats["disk_hits"] += 1
+            touched = len(self._touched)
+        if touched >= TOUCH_BATCH:
+            self._wake_writer()
+        return row[0]
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss (may block on a disk read)"""
+        if key is None:
+            return None
+        now = time.time()
+        value = self._memory_get(key, now)
+        return value if value is not None else self._disk_get(key, now)
+
+    async def get_async(self, key):
+        """get() for the event loop: the disk tier is read in a worker thread"""
+        if key is None:
+            return None
+        now = time.time()
+        value = self._memory_get(key, now)
+        return value if value is not None else await asyncio.to_thread(self._disk_get, key, now)
+
+    def put(self, key, value, tag=None):
+        """Store a value under key: in memory at once, on disk shortly after (never blocks)"""
+        if key is None or value is None:
+            return
+        now = time.time()
+        with self._memory_lock:
+            self._remember(key, value, now, tag)
+            self._pending[key] = (value, now, tag)
+        self._wake_writer()
+
+    def _wake_writer(self):
+        if self._writer is None:
+            with self._memory_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name=f"{self.table}-writer",
+                                                    daemon=True)
+                    self._writer.start()
+                    atexit.register(self.flush)  # scripts exit without waiting for the writer
+        self._wake.set()
+
+    def _write_loop(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write pending entries and last-access times now, then evict (blocking)"""
+        with self._disk_lock:
+            with self._memory_lock:
+                pending, self._pending = self._pending, {}
+                touched, self._touched = self._touched, {}
+            if not pending and not touched:
+                return
+            now = time.time()
+            try:
+                conn = self._get_conn()
+                for key, (value, created_at, tag) in pending.items():
+                    size = len(value.encode("utf-8"))
+                    old = conn.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                    conn.execute(
+                        f"INSERT OR REPLACE INTO {self.table} (key, tag, value, size, created_at, accessed_at) "
+                        f"VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, tag, value, size, created_at, created_at)
+                    )
+                    self._total_bytes += size - (old[0] if old else 0)
+                if touched:
+                    conn.executemany(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?",
+                                     [(accessed_at, key) for key, accessed_at in touched.items()])
+                self._evict(conn, now)
+                conn.commit()
+                with self._memory_lock:
+                    self._stats["writes"] += len(pending)
+            except sqlite3.Error as e:
+                print(f"{self.name} write failed ({len(pending)} entries): {e}")
+
+    def _evict(self, conn, now):
+        """Drop expired rows, then least-recently-used rows until under max_bytes (disk lock held)"""
+        evicted = []
+        if self.ttl is not None:
+            cutoff = now - self.ttl
+            count, size = conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table} WHERE created_at <= ?", (cutoff,)
+            ).fetchone()
+            if count:
+                conn.execute(f"DELETE FROM {self.table} WHERE created_at <= ?", (cutoff,))
+                self._total_bytes -= size
+                with self._memory_lock:
+                    self._stats["evictions"] += count
+
+        while self.max_bytes is not None and self._total_bytes > self.max_bytes:
+            rows = conn.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed_at LIMIT 100").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                evicted.append(key)
+                self._total_bytes -= size
+                if self._total_bytes <= self.max_bytes:
+                    break
+
+        if evicted:
+            with self._memory_lock:
+                for key in evicted:
+                    self._memory.pop(key, None)
+                self._stats["evictions"] += len(evicted)
+
+    def clear(self, keep_tag=None):
+        """Empty both tiers, or only drop entries tagged other than keep_tag. Returns rows deleted."""
+        with self._disk_lock:
+            with self._memory_lock:
+                for entries in (self._memory, self._pending):
+                    for key in [key for key, entry in entries.items() if keep_tag is None or entry[2] != keep_tag]:
+                        del entries[key]
+                self._touched.clear()
+            try:
+                conn = self._get_conn()
+                if keep_tag is None:
+                    deleted = conn.execute(f"DELETE FROM {self.table}").rowcount
+                else:
+                    deleted = conn.execute(
+                        f"DELETE FROM {self.table} WHERE tag IS NULL OR tag != ?", (keep_tag,)
+                    ).rowcount
+                conn.commit()
+                self._total_bytes = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+                return deleted
+            except sqlite3.Error as e:
+                print(f"{self.name} clear failed: {e}")
+                return 0
+
+    def get_stats(self, tag=None):
+        """Hit/miss counters and entries stored (in total, and tagged tag as current_items)"""
+        self.flush()
+        with self._memory_lock:
+            stats = dict(self._stats)
+            stats["memory_items"] = len(self._memory)
+        with self._disk_lock:
+            try:
+                conn = self._get_conn()
+                stats["disk_items"] = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+                stats["disk_bytes"] = self._total_bytes
+                if tag is not None:
+                    stats["current_items"] = conn.execute(
+                        f"SELECT COUNT(*) FROM {self.table} WHERE tag = ?", (tag,)
+                    ).fetchone()[0]
+            except sqlite3.Error:
+                stats["disk_items"], stats["disk_bytes"] = None, None
+
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
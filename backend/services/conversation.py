@@ -0,0 +1,322 @@
+import os
+import re
+import json
+import asyncio
+from contextlib import nullcontext
+from services.llm import get_llm_response_async, stream_llm_response_async
+from services.rate_limit import estimate_prompt_tokens
+from services.tts import submit_speech, concat_audio
+from services.llm_log import AGENT_TURN, CUSTOMER_TURN, CONTEXT_SUMMARY, call_context
+from services.termination import TerminationDetector, TERMINATION_ENABLED, MAX_TURNS
+from services.turn_evaluation import RollingEvaluator, TURN_EVAL_ENABLED, new_record
+
+# Conciseness instruction for natural dialogue
+CONCISE_INSTRUCTION = """IMPORTANT: Keep responses SHORT and NATURAL (1-3 sentences max).
+Speak directly as your character without stage directions, labels, or parenthetical notes.
+Act like a real conversation, not a script."""
+
+# End of a sentence (including the Hindi danda) followed by whitespace
+SENTENCE_END = re.compile(r"[.!?।](?=\s)")
+
+# Context management: each persona's history is capped at CONTEXT_TOKEN_BUDGET (approx.
+# tokens, 0 = unlimited). Over budget, all but the last CONTEXT_WINDOW_MESSAGES messages
+# are folded into a rolling summary, so long scenarios cost roughly linear tokens.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+CONTEXT_WINDOW_MESSAGES = int(os.getenv("CONTEXT_WINDOW_MESSAGES", "6"))
+SUMMARY_MAX_TOKENS = 200
+
+SUMMARY_INSTRUCTION = """Summarize this phone conversation so far for the speaker labelled "You".
+Keep every fact that matters for continuing the call: names, amounts, dates, offers made,
+commitments or refusals, objections raised, and how the other person is feeling.
+Write 3-6 short sentences in the conversation's language. Return only the summary."""
+
+
+def format_sse(event):
+    """Encode an event dict as a Server-Sent Events message"""
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+def first_sentence_end(text):
+    """Index just past the first complete sentence in text, or None"""
+    match = SENTENCE_END.search(text)
+    return match.end() if match else None
+
+
+class ContextWindow:
+    """
+    One persona's view of the conversation: the opening context, a rolling summary
+    of older turns, and the most recent messages verbatim. Under budget it sends
+    the full history, exactly as before.
+    """
+
+    def __init__(self, opening=None, budget=CONTEXT_TOKEN_BUDGET, window=CONTEXT_WINDOW_MESSAGES):
+        self.opening = opening  # scenario context, always kept
+        self.budget = budget
+        self.window = window
+        self.summary = None
+        self.recent = []  # messages not yet folded into the summary
+
+    def append(self, role, content):
+        self.recent.append({"role": role, "content": content})
+
+    def to_dict(self):
+        return {"summary": self.summary, "recent": list(self.recent)}
+
+    @classmethod
+    def from_dict(cls, data, opening=None, budget=CONTEXT_TOKEN_BUDGET):
+        window = cls(opening=opening, budget=budget)
+        window.summary = data.get("summary")
+        window.recent = list(data.get("recent", []))
+        return window
+
+    async def messages(self):
+        """Messages to send for the next reply, folding older turns into the summary if over budget"""
+        if self.budget and estimate_prompt_tokens(self.recent) > self.budget:
+            await self._fold()
+
+        if self.summary is None:
+            opening = [{"role": "user", "content": self.opening}] if self.opening else []
+            return opening + self.recent
+
+        header = f"{self.opening}\n\n" if self.opening else ""
+        header += f"Summary of the conversation so far:\n{self.summary}"
+        return [{"role": "user", "content": header}] + self.recent
+
+    async def _fold(self):
+        # Keep the last `window` messages, starting on one of our own replies so roles still alternate
+        split = max(0, len(self.recent) - self.window)
+        while split < len(self.recent) and self.recent[split]["role"] != "assistant":
+            split += 1
+        if split >= len(self.recent):
+            split = max(0, len(self.recent) - self.window)
+        if split == 0:
+            return
+
+        older, self.recent = self.recent[:split], self.recent[split:]
+        lines = "\n".join(
+            f"{'You' if m['role'] == 'assistant' else 'Them'}: {m['content']}" for m in older
+        )
+        previous = f"Earlier summary:\n{self.summary}\n\n" if self.summary else ""
+
+        try:
+            self.summary = (await get_llm_response_async(
+                SUMMARY_INSTRUCTION,
+                [{"role": "user", "content": f"{previous}Conversation:\n{lines}"}],
+                max_tokens=SUMMARY_MAX_TOKENS,
+                use_cache=False,
+                call_site=CONTEXT_SUMMARY
+            )).strip()
+        except Exception as e:
+            # Keep the earlier summary and the older messages verbatim (over budget until
+            # the next turn's fold succeeds) rather than losing them or failing the simulation
+            self.recent = older + self.recent
+            print(f"Context summary failed, keeping {len(older)} older messages verbatim: {e}")
+
+
+class ConversationState:
+    """
+    Where a conversation stands after its last completed turn: both personas' context
+    windows, the (agent, text) turns so far and the turn-level evaluation windows judged
+    so far. Pass one to run_conversation to checkpoint after every turn (to_dict), or
+    rebuild one to resume (from_dict).
+    """
+
+    def __init__(self, context=None, budget=CONTEXT_TOKEN_BUDGET):
+        self.context_a = ContextWindow(opening=context, budget=budget)
+        self.context_b = ContextWindow(budget=budget)
+        self.turns = []
+        self.turn_evaluation = new_record()
+
+    def to_dict(self):
+        """Checkpoint of the message histories (the turns themselves live in the transcript)"""
+        return {"context_a": self.context_a.to_dict(), "context_b": self.context_b.to_dict(),
+                "turn_evaluation": self.turn_evaluation}
+
+    @classmethod
+    def from_dict(cls, data, transcript, context=None, budget=CONTEXT_TOKEN_BUDGET):
+        state = cls(context, budget)
+        state.context_a = ContextWindow.from_dict(data["context_a"], opening=context, budget=budget)
+        state.context_b = ContextWindow.from_dict(data["context_b"], budget=budget)
+        state.turns = [(turn["agent"], turn["text"]) for turn in transcript]
+        state.turn_evaluation = data.get("turn_evaluation") or new_record()
+        return state
+
+    @classmethod
+    def from_transcript(cls, transcript, context=None, budget=CONTEXT_TOKEN_BUDGET):
+        """State after replaying a stored transcript (full histories; folded on the next turn if over budget)"""
+        state = cls(context, budget)
+        for turn in transcript:
+            own, other = (state.context_a, state.context_b) if turn["agent"] == "A" else (state.context_b, state.context_a)
+            own.append("assistant", turn["text"])
+            other.append("user", turn["text"])
+            state.turns.append((turn["agent"], turn["text"]))
+        return state
+
+
+async def _stream_reply(agent, prompt, messages, voice_id, max_tokens, use_cache, call_site):
+    """
+    Stream one reply, yielding delta events. TTS for the first sentence starts as
+    soon as that sentence is complete; an "audio" event is sent if its clip is ready
+    before the reply ends. Ends with an internal "reply" event carrying the full text
+    and a pending TTS job for the whole reply (never awaited here).
+    """
+    text = ""
+    first_end = None
+    first_audio = None
+    first_audio_sent = False
+
+    async for delta in stream_llm_response_async(prompt, messages, max_tokens=max_tokens, use_cache=use_cache,
+                                                 call_site=call_site):
+        text += delta
+        yield {"type": "delta", "agent": agent, "text": delta}
+
+        if first_audio is None:
+            first_end = first_sentence_end(text)
+            if first_end:
+                first_audio = asyncio.wrap_future(submit_speech(text[:first_end].strip(), voice_id))
+        elif not first_audio_sent and first_audio.done() and first_audio.result():
+            first_audio_sent = True
+            yield {"type": "audio", "agent": agent, "audio": first_audio.result()}
+
+    if first_audio is None:
+        audio_job = _speak(text, voice_id)
+    else:
+        if not first_audio_sent and first_audio.done() and first_audio.result():
+            yield {"type": "audio", "agent": agent, "audio": first_audio.result()}
+        audio_job = _speak_rest(first_audio, text[first_end:].strip(), voice_id)
+
+    yield {"type": "reply", "text": text, "audio_job": asyncio.ensure_future(audio_job)}
+
+
+async def _speak(text, voice_id):
+    return await asyncio.wrap_future(submit_speech(text, voice_id))
+
+
+async def _speak_rest(first_audio, rest, voice_id):
+    """Audio for a reply whose first sentence is already being spoken: first clip + the rest"""
+    rest_audio = asyncio.wrap_future(submit_speech(rest, voice_id)) if rest else None
+    first_path = await first_audio
+    rest_path = await rest_audio if rest_audio else None
+    return concat_audio([first_path, rest_path])
+
+
+def _finished_audio(audio_jobs):
+    """Pop finished TTS jobs as "turn_audio" events"""
+    events = []
+    for index, (agent, job) in list(audio_jobs.items()):
+        if job.done():
+            del audio_jobs[index]
+            events.append({"type": "turn_audio", "index": index, "agent": agent, "audio": job.result()})
+    return events
+
+
+async def run_conversation(prompt_a, prompt_b, context, max_turns, persona_a=None, persona_b=None,
+                           voice_a=None, voice_b=None, max_tokens=None, stream=False,
+                           context_budget=CONTEXT_TOKEN_BUDGET, early_stop=TERMINATION_ENABLED, state=None,
+                           max_messages=None, goal=None, turn_eval=TURN_EVAL_ENABLED,
+                           persona_a_id=None, persona_b_id=None):
+    """
+    Run a conversation between two personas as an async generator of events:
+        {"type": "turn", "index": n, "turn": {"agent", "persona", "text", "audio"}}
+        {"type": "turn_audio", "index": n, "agent": "A", "audio": path}
+    TTS runs on a background worker pool and never holds up the next turn: "turn"
+    events carry audio None, and each clip follows as a "turn_audio" event once ready
+    (the last ones after the final turn). audio is None if TTS failed or is disabled.
+    With stream=True, replies are streamed and these are interleaved:
+        {"type": "delta", "agent": "A", "text": "..."}   partial reply text
+        {"type": "audio", "agent": "A", "audio": path}   first-sentence clip, before the reply ends
+    Each persona's history is kept under context_budget tokens (see ContextWindow).
+    With early_stop, the call ends as soon as it reaches a terminal state (see
+    TerminationDetector). With turn_eval and a goal, windows of turns are judged in the
+    background as the conversation runs (see RollingEvaluator), each followed by
+        {"type": "turn_evaluation", "from": i, "to": j, "scores": {...}, "running": {...}, ...}
+    and a hopeless or already successful call ends early. The last event is always
+        {"type": "end", "reason": "commitment"|"refusal"|"hang_up"|"loop"|"max_turns"
+                                  |"succeeded"|"hopeless"|"violation", "turns": n}
+    With a ConversationState, the conversation continues from that state's last turn and
+    the state is kept up to date, so it can be checkpointed on every "turn" event.
+    max_messages stops after that many messages in total instead of max_turns rounds.
+    LLM calls for each side's replies are logged against persona_a_id / persona_b_id.
+    """
+    state = state or ConversationState(context, context_budget)
+    speakers = {
+        "A": (prompt_a, persona_a, voice_a, state.context_a, state.context_b),
+        "B": (prompt_b, persona_b, voice_b, state.context_b, state.context_a),
+    }
+    persona_ids = {"A": persona_a_id, "B": persona_b_id}
+    index = len(state.turns)
+    audio_jobs = {}  # turn index -> (agent, pending TTS task)
+    detector = TerminationDetector() if early_stop else None
+    stop_reason = await detector.restore(state.turns) if detector and state.turns else None
+    evaluator = RollingEvaluator(goal, state.turn_evaluation) if turn_eval and goal else None
+
+    limit = max_messages or max_turns * 2
+    while index < limit and not stop_reason:
+        turn, agent = index // 2, "AB"[index % 2]
+        prompt, persona, voice_id, own_context, other_context = speakers[agent]
+        label = f"Agent {agent} ({persona})" if persona else f"Agent {agent}"
+        print(f"Turn {turn + 1}: {label} generating response...")
+
+        # Only the opening line is cached; later turns must vary between runs
+        use_cache = turn == 0 and agent == "A"
+        call_site = AGENT_TURN if agent == "A" else CUSTOMER_TURN
+        speaker = call_context(persona_id=persona_ids[agent]) if persona_ids[agent] else nullcontext()
+
+        with speaker:
+            own_messages = await own_context.messages()
+            if stream:
+                async for event in _stream_reply(agent, prompt, own_messages, voice_id, max_tokens, use_cache,
+                                                 call_site):
+                    if event["type"] == "reply":
+                        text, audio_job = event["text"], event["audio_job"]
+                    else:
+                        yield event
+            else:
+                text = await get_llm_response_async(prompt, own_messages, max_tokens=max_tokens,
+                                                    use_cache=use_cache, call_site=call_site)
+                audio_job = asyncio.ensure_future(_speak(text, voice_id))
+
+        print(f"Turn {turn + 1}: {label} response complete")
+
+        entry = {"agent": agent}
+        if persona:
+            entry["persona"] = persona
+        entry["text"] = text
+        entry["audio"] = None  # Filled in by the turn_audio event
+
+        own_context.append("assistant", text)
+        other_context.append("user", text)
+        state.turns.append((agent, text))
+
+        audio_jobs[index] = (agent, audio_job)
+        yield {"type": "turn", "index": index, "turn": entry}
+        index += 1
+
+        for event in _finished_audio(audio_jobs):
+            yield event
+
+        if detector:
+            stop_reason = await detector.observe(agent, text)
+            if stop_reason:
+                print(f"Turn {turn + 1}: conversation ended early ({stop_reason})")
+
+        if evaluator:
+            evaluator.observe(state.turns)
+            for event in evaluator.poll():
+                yield event
+            if not stop_reason and evaluator.stop_reason:
+                stop_reason = evaluator.stop_reason
+                print(f"Turn {turn + 1}: conversation ended early by turn-level evaluation ({stop_reason})")
+
+    # Keep the window still being judged, so the final evaluation need not judge it again
+    if evaluator:
+        for event in await evaluator.drain():
+            yield event
+
+    # Conversation is done; wait only for the clips still being generated
+    if audio_jobs:
+        await asyncio.wait([job for _, job in audio_jobs.values()])
+        for event in _finished_audio(audio_jobs):
+            yield event
+
+    yield {"type": "end", "reason": stop_reason or MAX_TURNS, "turns": index}
@@ -1,9 +1,37 @@
+import os
 import re
 import json
-from services.llm import get_llm_response
+import asyncio
+import hashlib
+import statistics
+from services.llm import get_llm_response_async, run_sync, LLMBatch, sampling_seed, cacheable_prompt
+from services.llm_log import JUDGE, JUDGE_MULTI, call_context
+from services.prescore import PRESCORE_ENABLED, PRESCORE_CONFIDENCE, PRESCORE_VERSION, prescore, fixed_metrics, local_scores
+from services import judge_cache
 
+# Metrics averaged into overall_score
+SCORE_METRICS = ["goal_completion", "conversational_quality", "compliance", "adaptation_quality"]
 
-def evaluate_conversation(transcript, goal):
+# Multi-transcript judging: transcripts packed into one judge request share the rubric
+JUDGE_PACK_TOKEN_BUDGET = int(os.getenv("JUDGE_PACK_TOKEN_BUDGET", "12000"))  # estimated prompt tokens per request
+JUDGE_PACK_MAX_TRANSCRIPTS = int(os.getenv("JUDGE_PACK_MAX_TRANSCRIPTS", "6"))
+JUDGE_TOKENS_PER_TRANSCRIPT = 600  # response tokens allowed for each transcript's scores
+
+# Judge ensemble: each transcript is judged by K independent calls sent concurrently,
+# aggregated per metric (see aggregate_judgments). 1 = a single judge call.
+JUDGE_ENSEMBLE_SIZE = max(1, int(os.getenv("JUDGE_ENSEMBLE_SIZE", "1")))
+# Providers the ensemble members take in turn (e.g. "nvidia,groq"); empty = LLM_PROVIDER for all
+JUDGE_ENSEMBLE_PROVIDERS = [p.strip().lower() for p in os.getenv("JUDGE_ENSEMBLE_PROVIDERS", "").split(",") if p.strip()]
+JUDGE_ENSEMBLE_AGGREGATE = os.getenv("JUDGE_ENSEMBLE_AGGREGATE", "median")  # "median" or "trimmed_mean"
+JUDGE_ENSEMBLE_TRIM = 0.2  # share of judgments trimmed_mean drops at each end (at least one once there are 3)
+
+
+def evaluate_conversation(transcript, goal, use_cache=True):
+    """Blocking wrapper around evaluate_conversation_async (not for use inside an event loop)"""
+    return run_sync(evaluate_conversation_async(transcript, goal, use_cache))
+
+
+async def evaluate_conversation_async(transcript, goal, use_cache=True):
     """
     Evaluate conversation using LLM-as-judge pattern
     Returns: {
@@ -20,27 +48,285 @@ def evaluate_conversation(transcript, goal):
     - conversational_quality: Repetitions, hallucinations, tone match
     - compliance: Avoid threats, illegal phrasing, harassment
     - adaptation_quality: Did agent detect and respond to emotional cues appropriately?
+
+    Scores already judged for the same transcript, goal and rubric come from the judge
+    cache (use_cache=False re-judges). Local checks run next (see services/prescore.py):
+    metrics they are sure of are fixed, and the judge is skipped when they are sure of all four.
+    With JUDGE_ENSEMBLE_SIZE > 1 the judge is asked that many times concurrently and the
+    scores carry an "ensemble" entry with the per-metric variance.
     """
-    # Format transcript for readability
-    formatted_transcript = "\n".join([
-        f"{turn['persona']} ({turn['agent']}): {turn['text']}"
-        for turn in transcript
-    ])
+    key, cached = await _cache_lookup_async(transcript, goal, use_cache)
+    if cached:
+        return cached
+    return await _evaluate_uncached_async(key, transcript, goal, use_cache)
 
-    # Check if conversation is in Hindi (simple heuristic)
-    is_hindi = any("हिंदी" in turn['text'] or any(ord(c) >= 0x0900 and ord(c) <= 0x097F for c in turn['text']) for turn in transcript if 'text' in turn)
 
-    language_note = ""
-    if is_hindi:
-        language_note = "\n\nNOTE: This conversation is conducted in Hindi (Devanagari script). Evaluate naturalness based on Hindi language norms and cultural appropriateness for Indian debt collection context."
+async def _evaluate_uncached_async(key, transcript, goal, use_cache=True):
+    local, fixed = _prescore(transcript)
+    if local:
+        return local
+    prompt = build_evaluation_prompt(transcript, goal, fixed)
 
-    prompt = f"""Evaluate this debt collection conversation:
+    try:
+        responses = await _ask_judges_async(prompt, 600, JUDGE, use_cache)
+        return _judged(key, responses, fixed)
+    except Exception as e:
+        print(f"Evaluation failed: {e}")
+        return _apply_fixed(default_scores(f"Error: {str(e)}"), fixed)
 
-{formatted_transcript}
 
-Scenario Goal: {goal}{language_note}
+def evaluate_conversations_batch(items, mode=None, use_cache=True):
+    """
+    Judge many stored conversations in one bulk submission (see LLMBatch).
+    Only judge cache misses are submitted (one request per ensemble member).
+    items: dicts with "transcript", "goal" and optionally "run_id" (used to tag the call log).
+    Returns scores in the same order; failed or unparseable judgments get default_scores.
+    """
+    batches = {}  # provider -> LLMBatch
+    results, pending = [], []
+    for index, item in enumerate(items):
+        key, cached = _cache_lookup(item["transcript"], item["goal"], use_cache)
+        local, fixed = (None, {}) if cached else _prescore(item["transcript"])
+        results.append(cached or local)
+        if results[index] is None:
+            prompt = build_evaluation_prompt(item["transcript"], item["goal"], fixed)
+            futures = []
+            for provider, seed in _ensemble_members():
+                if provider not in batches:
+                    batches[provider] = LLMBatch(provider=provider, mode=mode)
+                with call_context(run_id=item.get("run_id")), sampling_seed(seed):
+                    futures.append(batches[provider].submit(**prompt, max_tokens=600, use_cache=use_cache, call_site=JUDGE))
+            pending.append((index, key, fixed, futures))
+    for batch in batches.values():
+        batch.run()
+
+    for index, key, fixed, futures in pending:
+        responses = [future.result() for future in futures if future.exception() is None]
+        if responses:
+            results[index] = _judged(key, responses, fixed)
+        else:
+            print(f"Evaluation failed: {futures[0].exception()}")
+            results[index] = _apply_fixed(default_scores(f"Error: {str(futures[0].exception())}"), fixed)
+    return results
+
+
+def _cache_lookup(transcript, goal, use_cache=True):
+    """(judge cache key, cached scores or None)"""
+    key = judge_cache.make_key(_format_transcript(transcript), goal, RUBRIC_VERSION)
+    return key, judge_cache.get(key) if use_cache else None
+
+
+async def _cache_lookup_async(transcript, goal, use_cache=True):
+    """_cache_lookup without blocking the event loop on a disk read"""
+    key = judge_cache.make_key(_format_transcript(transcript), goal, RUBRIC_VERSION)
+    return key, await judge_cache.get_async(key) if use_cache else None
+
+
+def _judged(key, responses, fixed):
+    """Parse and aggregate the ensemble's responses; successful judgments are stored in the judge cache"""
+    judgments = []
+    for response in responses:
+        try:
+            scores = _parse_scores(response)
+        except ValueError:
+            scores = None
+        if scores is not None:
+            judgments.append(_apply_fixed(scores, fixed))
+    if not judgments:
+        return _apply_fixed(default_scores("Evaluation parse error"), fixed)
+    scores = aggregate_judgments(judgments)
+    judge_cache.put(key, scores)
+    return scores
+
+
+def _prescore(transcript):
+    """(scores without the judge or None, {metric: (score, reason)} fixed by local checks)"""
+    if not PRESCORE_ENABLED:
+        return None, {}
+    result = prescore(transcript)
+    fixed = fixed_metrics(result)
+    if all(metric in fixed for metric in SCORE_METRICS):
+        return local_scores(result, SCORE_METRICS), fixed
+    return None, fixed
+
+
+def _apply_fixed(scores, fixed):
+    """Overwrite the judge's scores with the locally fixed ones"""
+    if fixed:
+        scores.update({metric: score for metric, (score, _) in fixed.items()})
+        scores["prescored"] = sorted(fixed)
+    return scores
+
+
+async def evaluate_conversations_async(items):
+    """
+    Judge several conversations with as few judge calls as possible: transcripts are
+    packed into multi-transcript requests (within JUDGE_PACK_TOKEN_BUDGET), each
+    returning one score object per transcript. Any transcript whose object is missing
+    or invalid is judged again on its own. Judge cache hits and transcripts the local
+    checks fully score are not sent at all.
+    items: dicts with "transcript", "goal" and optionally "run_id" (used to tag the call log).
+    In ensemble mode every packed request is sent once per member.
+    Returns scores in the same order.
+    """
+    results = [None] * len(items)
+    keys = [None] * len(items)
+    fixed = [{}] * len(items)
+    for index, item in enumerate(items):
+        keys[index], results[index] = await _cache_lookup_async(item["transcript"], item["goal"])
+        if results[index] is None:
+            results[index], fixed[index] = _prescore(item["transcript"])
+    items = [{**item, "fixed": item_fixed} for item, item_fixed in zip(items, fixed)]
+    remaining = [index for index in range(len(items)) if results[index] is None]
+
+    async def judge_pack(indexes):
+        if len(indexes) > 1:
+            prompt = build_multi_evaluation_prompt([items[i] for i in indexes])
+            try:
+                with call_context(run_id=None):  # Covers several runs
+                    responses = await _ask_judges_async(prompt, JUDGE_TOKENS_PER_TRANSCRIPT * len(indexes), JUDGE_MULTI)
+                judgments = {index: [] for index in indexes}
+                for response in responses:
+                    for index, scores in zip(indexes, parse_multi_evaluation(response, len(indexes))):
+                        if scores:
+                            judgments[index].append(_apply_fixed(scores, fixed[index]))
+                for index in indexes:
+                    if judgments[index]:
+                        results[index] = aggregate_judgments(judgments[index])
+                        judge_cache.put(keys[index], results[index])
+            except Exception as e:
+                print(f"Multi-transcript evaluation failed, judging {len(indexes)} transcripts one by one: {e}")
+
+        retry = [index for index in indexes if results[index] is None]
+        if len(indexes) > 1 and retry:
+            print(f"Judging {len(retry)}/{len(indexes)} transcripts individually (missing or invalid in the packed response)")
+        scores = await asyncio.gather(*[_evaluate_item(keys[index], items[index]) for index in retry])
+        for index, result in zip(retry, scores):
+            results[index] = result
+
+    packs = [[remaining[i] for i in pack] for pack in pack_transcripts([items[index] for index in remaining])]
+    await asyncio.gather(*[judge_pack(indexes) for indexes in packs])
+    return results
+
+
+async def _evaluate_item(key, item):
+    with call_context(run_id=item.get("run_id")):
+        return await _evaluate_uncached_async(key, item["transcript"], item["goal"])
+
+
+def _ensemble_members():
+    """(provider, sampling seed) for each judge call; None = the defaults (a single, unseeded call)"""
+    if JUDGE_ENSEMBLE_SIZE == 1:
+        return [(JUDGE_ENSEMBLE_PROVIDERS[0] if JUDGE_ENSEMBLE_PROVIDERS else None, None)]
+    # Distinct seeds make the members independent samples (and distinct response cache entries)
+    return [
+        (JUDGE_ENSEMBLE_PROVIDERS[i % len(JUDGE_ENSEMBLE_PROVIDERS)] if JUDGE_ENSEMBLE_PROVIDERS else None, i + 1)
+        for i in range(JUDGE_ENSEMBLE_SIZE)
+    ]
+
+
+async def _ask_judges_async(prompt, max_tokens, call_site, use_cache=True):
+    """One response per ensemble member, requested concurrently. Raises only if every member fails."""
+    async def ask(provider, seed):
+        with sampling_seed(seed):
+            return await get_llm_response_async(**prompt, max_tokens=max_tokens, call_site=call_site,
+                                                use_cache=use_cache, provider=provider)
+
+    return _answers(await asyncio.gather(*[ask(*member) for member in _ensemble_members()], return_exceptions=True))
+
+
+def _answers(responses):
+    """The successful responses; the first error is raised if there are none"""
+    errors = [response for response in responses if isinstance(response, BaseException)]
+    if len(errors) == len(responses):
+        raise errors[0]
+    if errors:
+        print(f"{len(errors)}/{len(responses)} ensemble judge calls failed: {errors[0]!r}")
+    return [response for response in responses if not isinstance(response, BaseException)]
+
+
+def aggregate_judgments(judgments):
+    """
+    Combine ensemble judgments into one score object. Each metric is the median (or trimmed
+    mean, see JUDGE_ENSEMBLE_AGGREGATE) across judges; feedback and structured issues come
+    from the judgment closest to the result. A single judgment is returned unchanged.
+    The "ensemble" entry holds the judge count and the per-metric (and overall) variance.
+    """
+    if len(judgments) == 1:
+        return judgments[0]
+
+    aggregated, variance = {}, {}
+    for metric in SCORE_METRICS:
+        values = [judgment.get(metric, 5) for judgment in judgments]
+        aggregated[metric] = round(_aggregate(values), 2)
+        variance[metric] = round(statistics.variance(values), 3)
+    variance["overall"] = round(statistics.variance([overall_score(judgment) for judgment in judgments]), 3)
+
+    closest = min(judgments, key=lambda judgment: sum(
+        abs(judgment.get(metric, 5) - aggregated[metric]) for metric in SCORE_METRICS
+    ))
+    return {
+        **closest,
+        **aggregated,
+        "ensemble": {
+            "judges": len(judgments),
+            "aggregate": JUDGE_ENSEMBLE_AGGREGATE,
+            "variance": variance,
+            "scores": {metric: [judgment.get(metric, 5) for judgment in judgments] for metric in SCORE_METRICS},
+        },
+    }
+
+
+def _aggregate(values):
+    if JUDGE_ENSEMBLE_AGGREGATE == "trimmed_mean":
+        values = sorted(values)
+        cut = max(1, int(len(values) * JUDGE_ENSEMBLE_TRIM)) if len(values) >= 3 else 0
+        return statistics.mean(values[cut:len(values) - cut])
+    return statistics.median(values)
+
+
+def judge_variance(scores):
+    """(per-metric variance, number of judges) from ensemble scores; (None, 1) for a single judgment"""
+    ensemble = scores.get("ensemble") or {}
+    return ensemble.get("variance"), ensemble.get("judges", 1)
+
 
-Score 1-10 for each metric. Focus ONLY on the debt collector agent (Agent A / Marcus), not the customer:
+def pack_transcripts(items):
+    """Group item indexes into judge requests within the token budget (~4 characters per token)"""
+    overhead = (len(JUDGE_MULTI_SYSTEM) + len(HINDI_NOTE)) // 4 + 200
+    packs, current, used = [], [], overhead
+    for index, item in enumerate(items):
+        size = (len(_format_transcript(item["transcript"])) + len(item["goal"] or "")) // 4 + 20
+        if current and (used + size > JUDGE_PACK_TOKEN_BUDGET or len(current) >= JUDGE_PACK_MAX_TRANSCRIPTS):
+            packs.append(current)
+            current, used = [], overhead
+        current.append(index)
+        used += size
+    if current:
+        packs.append(current)
+    return packs
+
+
+def overall_score(scores):
+    """Average of the SCORE_METRICS (missing ones count as 5)"""
+    return sum(scores.get(metric, 5) for metric in SCORE_METRICS) / len(SCORE_METRICS)
+
+
+def default_scores(feedback):
+    """Neutral scores used when the judge fails or returns unparseable output (marked "judge_failed")"""
+    return {
+        "goal_completion": 5,
+        "conversational_quality": 5,
+        "compliance": 5,
+        "adaptation_quality": 5,
+        "feedback": feedback,
+        "structured_issues": {},
+        "judge_failed": True
+    }
+
+
+# Scoring instructions shared by the single and multi-transcript judge prompts
+RUBRIC = """Score 1-10 for each metric. Focus ONLY on the debt collector agent (Agent A / Marcus), not the customer:
 
 1. goal_completion: Did the borrower agree to make a payment or set up a payment plan?
    - 10: Customer agreed to pay full amount or reasonable payment plan
@@ -66,16 +352,15 @@ Score 1-10 for each metric. Focus ONLY on the debt collector agent (Agent A / Ma
    - 4-6: Ignored obvious emotional signals, used same approach regardless of customer behavior
    - 1-3: Completely misread the customer (pushed harder when they were hostile, was cold when they were cooperative)
 
-Also identify SPECIFIC ISSUES in categories for targeted improvement:
+Also identify SPECIFIC ISSUES in categories for targeted improvement:"""
 
-Return ONLY valid JSON in this exact format:
-{{
+SCORE_FORMAT = """{
     "goal_completion": X,
     "conversational_quality": X,
     "compliance": X,
     "adaptation_quality": X,
     "feedback": "brief overall explanation",
-    "structured_issues": {{
+    "structured_issues": {
         "opening": "issue with opening/disclosure or null",
         "emotional_detection": "did agent correctly identify customer mood? describe any misses",
         "de_escalation": "if customer was hostile, how well did agent de-escalate? or null if not applicable",
@@ -84,45 +369,152 @@ Return ONLY valid JSON in this exact format:
         "closing": "did agent get specific commitment? what was missed?",
         "compliance_issues": "any specific compliance violations or concerns",
         "adaptation_moments": "specific turns where agent should have adapted differently"
-    }}
-}}"""
+    }
+}"""
+
+HINDI_NOTE = "NOTE: This conversation is conducted in Hindi (Devanagari script). Evaluate naturalness based on Hindi language norms and cultural appropriateness for Indian debt collection context."
+
+# Judge prompts are a static system message (the same on every call, so providers can serve
+# it from their prompt prefix cache) followed by the conversations as the user message.
+# Single and multi-transcript prompts share everything up to the output format.
+JUDGE_PREAMBLE = f"""You evaluate debt collection conversations between a collector agent and a customer.
+
+{RUBRIC}"""
+
+JUDGE_SYSTEM = f"""{JUDGE_PREAMBLE}
+
+Return ONLY valid JSON in this exact format:
+{SCORE_FORMAT}"""
+
+JUDGE_MULTI_SYSTEM = f"""{JUDGE_PREAMBLE}
+
+Several conversations are given, each marked "=== Conversation N ===". Evaluate EACH one independently.
+Return ONLY valid JSON: an object with an "evaluations" list holding one entry per conversation, in order,
+each with its "conversation" number and the scores in this exact format:
+{{"evaluations": [{{"conversation": 1, ...scores}}, {{"conversation": 2, ...scores}}]}}
+Scores format:
+{SCORE_FORMAT}"""
+
+
+# Bump for judging changes the templates above don't show (prompt builders, parsing)
+JUDGE_REVISION = 2
+
+# Cached judge scores are only reused under the same rubric: editing the templates,
+# the pre-scoring rules or their threshold, or the ensemble settings invalidates them
+# (see services/judge_cache.py)
+RUBRIC_VERSION = f"{JUDGE_REVISION}-" + hashlib.sha256("\n".join([
+    JUDGE_SYSTEM, JUDGE_MULTI_SYSTEM, HINDI_NOTE, str(PRESCORE_ENABLED), str(PRESCORE_CONFIDENCE), str(PRESCORE_VERSION)
+] + ([str(JUDGE_ENSEMBLE_SIZE), ",".join(JUDGE_ENSEMBLE_PROVIDERS), JUDGE_ENSEMBLE_AGGREGATE]
+     if JUDGE_ENSEMBLE_SIZE > 1 else [])).encode("utf-8")).hexdigest()[:12]
+
+
+def _format_transcript(transcript):
+    return "\n".join([
+        f"{turn['persona']} ({turn['agent']}): {turn['text']}"
+        for turn in transcript
+    ])
+
+
+def _is_hindi(transcript):
+    """Simple heuristic: any Devanagari in the conversation"""
+    return any("हिंदी" in turn['text'] or any(ord(c) >= 0x0900 and ord(c) <= 0x097F for c in turn['text']) for turn in transcript if 'text' in turn)
+
 
+def _fixed_note(fixed):
+    """Tells the judge which metrics local checks already scored, so it focuses on the rest"""
+    if not fixed:
+        return ""
+    lines = "\n".join(f"- {metric}: {score} ({reason})" for metric, (score, reason) in sorted(fixed.items()))
+    return f"\n\nAutomated checks already scored these metrics. Use these scores as given and focus on the others:\n{lines}"
+
+
+def build_evaluation_prompt(transcript, goal, fixed=None):
+    """
+    Build the LLM-as-judge prompt for a transcript (fixed: metrics already scored locally).
+    Returns cacheable_prompt arguments: the static JUDGE_SYSTEM, then the conversation.
+    """
+    # Format transcript for readability
+    formatted_transcript = _format_transcript(transcript)
+
+    # Check if conversation is in Hindi
+    language_note = f"\n\n{HINDI_NOTE}" if _is_hindi(transcript) else ""
+
+    return cacheable_prompt(JUDGE_SYSTEM, f"""Evaluate this debt collection conversation:
+
+{formatted_transcript}
+
+Scenario Goal: {goal}{language_note}{_fixed_note(fixed)}""")
+
+
+def build_multi_evaluation_prompt(items):
+    """Judge prompt for several transcripts at once: the static JUDGE_MULTI_SYSTEM, then each conversation with its goal"""
+    sections = []
+    for number, item in enumerate(items, 1):
+        language_note = f"\n{HINDI_NOTE}" if _is_hindi(item["transcript"]) else ""
+        sections.append(f"""=== Conversation {number} ===
+{_format_transcript(item["transcript"])}
+
+Scenario Goal: {item["goal"]}{language_note}{_fixed_note(item.get("fixed"))}""")
+    conversations = "\n\n".join(sections)
+
+    return cacheable_prompt(JUDGE_MULTI_SYSTEM, f"""Evaluate each of these {len(items)} debt collection conversations independently:
+
+{conversations}""")
+
+
+def parse_multi_evaluation(response, count):
+    """
+    Score objects from a multi-transcript judge response, one per conversation in order.
+    Entries that are missing or fail validation are None (to be judged again singly).
+    """
+    results = [None] * count
+    json_match = re.search(r'\{.*\}', response, re.DOTALL)
+    if not json_match:
+        return results
     try:
-        response = get_llm_response(prompt, max_tokens=600)
-
-        # Extract JSON from response (handles markdown code blocks)
-        json_match = re.search(r'\{.*\}', response, re.DOTALL)
-        if json_match:
-            scores = json.loads(json_match.group())
-
-            # Validate required fields (support both old and new format)
-            required = ["goal_completion", "conversational_quality", "compliance", "feedback"]
-            if all(k in scores for k in required):
-                # Ensure adaptation_quality exists (default to 5 if not)
-                if "adaptation_quality" not in scores:
-                    scores["adaptation_quality"] = 5
-                # Ensure structured_issues exists
-                if "structured_issues" not in scores:
-                    scores["structured_issues"] = {}
-                return scores
-
-        # Fallback if parsing fails
-        return {
-            "goal_completion": 5,
-            "conversational_quality": 5,
-            "compliance": 5,
-            "adaptation_quality": 5,
-            "feedback": "Evaluation parse error",
-            "structured_issues": {}
-        }
+        evaluations = json.loads(json_match.group()).get("evaluations")
+    except (ValueError, AttributeError):
+        return results
+    if not isinstance(evaluations, list):
+        return results
 
-    except Exception as e:
-        print(f"Evaluation failed: {e}")
-        return {
-            "goal_completion": 5,
-            "conversational_quality": 5,
-            "compliance": 5,
-            "adaptation_quality": 5,
-            "feedback": f"Error: {str(e)}",
-            "structured_issues": {}
-        }
+    for position, scores in enumerate(evaluations):
+        if not isinstance(scores, dict):
+            continue
+        number = scores.pop("conversation", position + 1)
+        if not isinstance(number, int) or not 1 <= number <= count or results[number - 1] is not None:
+            continue
+        if all(isinstance(scores.get(metric), (int, float)) and 1 <= scores[metric] <= 10
+               for metric in ["goal_completion", "conversational_quality", "compliance"]):
+            results[number - 1] = _complete_scores(scores)
+    return results
+
+
+def _complete_scores(scores):
+    """The scores with optional fields filled in, or None if required fields are missing"""
+    # Validate required fields (support both old and new format)
+    required = ["goal_completion", "conversational_quality", "compliance", "feedback"]
+    if not all(k in scores for k in required):
+        return None
+    # Ensure adaptation_quality exists (default to 5 if not)
+    if "adaptation_quality" not in scores:
+        scores["adaptation_quality"] = 5
+    # Ensure structured_issues exists
+    if "structured_issues" not in scores:
+        scores["structured_issues"] = {}
+    return scores
+
+
+def parse_evaluation(response):
+    """Extract the judge's JSON scores from a raw LLM response"""
+    # Fallback if parsing fails
+    return _parse_scores(response) or default_scores("Evaluation parse error")
+
+
+def _parse_scores(response):
+    """The judge's scores, or None if the response holds no valid score object"""
+    # Extract JSON from response (handles markdown code blocks)
+    json_match = re.search(r'\{.*\}', response, re.DOTALL)
+    if json_match:
+        return _complete_scores(json.loads(json_match.group()))
+    return None
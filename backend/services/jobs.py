@@ -0,0 +1,218 @@
+"""
+In-process background job executor.
+
+Long-running work (evolution cycles, simulations, simulation batches) is stored
+as a row in the jobs table and run as an asyncio task, at most JOB_CONCURRENCY
+at a time. Handlers report progress by phase; every update is pushed to SSE
+subscribers, and saved on the job when the phase changes or at most once per
+JOB_PROGRESS_INTERVAL seconds within a phase. Jobs still queued or running when
+the server stopped are re-queued on startup and run again from the beginning.
+"""
+import os
+import json
+import asyncio
+from datetime import datetime
+from database import SessionLocal
+import models
+
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))  # restarts before a job is given up on
+JOB_PROGRESS_INTERVAL = float(os.getenv("JOB_PROGRESS_INTERVAL", "1.0"))  # seconds between progress saves in a phase
+
+# kind -> async handler(params, progress) returning a JSON-serializable result
+_handlers = {}
+
+# job id -> set of asyncio.Queue, one per SSE subscriber
+_subscribers = {}
+
+_tasks = set()
+_semaphore = None
+
+
+def register_handler(kind, handler):
+    """Register the coroutine function that runs jobs of this kind"""
+    _handlers[kind] = handler
+
+
+def serialize(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "params": job.params,
+        "status": job.status,
+        "phase": job.phase,
+        "progress": job.progress or {},
+        "result": job.result,
+        "error": job.error,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def enqueue(db, kind, params):
+    """Store a new job and start it as soon as a slot is free (call from the event loop)"""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = models.Job(kind=kind, params=params, status="queued", progress={}, attempts=0)
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _start(job.id)
+    print(f"Queued {kind} job {job.id}")
+    return job
+
+
+def requeue_unfinished():
+    """Re-queue jobs interrupted by a restart (called on startup, inside the event loop)"""
+    db = SessionLocal()
+    try:
+        to_start = []
+        jobs = db.query(models.Job).filter(models.Job.status.in_(["queued", "running"])).order_by(models.Job.id).all()
+        for job in jobs:
+            if job.kind not in _handlers:
+                job.status, job.error = "failed", f"Unknown job kind: {job.kind}"
+            elif job.attempts >= JOB_MAX_ATTEMPTS:
+                job.status, job.error = "failed", f"Interrupted {job.attempts} times, giving up"
+            else:
+                job.status = "queued"
+                to_start.append(job.id)
+            if job.status == "failed":
+                job.finished_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+    for job_id in to_start:
+        _start(job_id)
+    if to_start:
+        print(f"Re-queued {len(to_start)} unfinished jobs: {to_start}")
+
+
+def subscribe(job_id):
+    """Queue receiving this job's events until unsubscribe()"""
+    queue = asyncio.Queue()
+    _subscribers.setdefault(job_id, set()).add(queue)
+    return queue
+
+
+def unsubscribe(job_id, queue):
+    queues = _subscribers.get(job_id)
+    if queues is not None:
+        queues.discard(queue)
+        if not queues:
+            del _subscribers[job_id]
+
+
+def _publish(job_id, event):
+    for queue in _subscribers.get(job_id, ()):
+        queue.put_nowait(event)
+
+
+def _update(job_id, **fields):
+    """Save fields on a job and return its serialized state"""
+    db = SessionLocal()
+    try:
+        job = db.query(models.Job).filter(models.Job.id == job_id).first()
+        for field, value in fields.items():
+            setattr(job, field, value)
+        db.commit()
+        db.refresh(job)
+        return serialize(job)
+    finally:
+        db.close()
+
+
+class _ProgressWriter:
+    """
+    Saves a job's latest progress from a background task, off the event loop:
+    at once when the phase changes, otherwise at most every JOB_PROGRESS_INTERVAL.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.phase = None
+        self.pending = None  # latest unsaved {"phase", "progress"}
+        self.saved_at = 0.0
+        self.task = None
+        self.wake = asyncio.Event()
+
+    def __call__(self, phase, completed=None, total=None, message=None):
+        details = {"completed": completed, "total": total, "message": message}
+        self.pending = {"phase": phase, "progress": details}
+        if phase != self.phase:
+            self.wake.set()
+        if self.task is None:
+            self.task = asyncio.create_task(self._save())
+        _publish(self.job_id, {"type": "progress", "job_id": self.job_id, "phase": phase, **details})
+
+    async def _save(self):
+        loop = asyncio.get_running_loop()
+        while self.pending is not None:
+            wait = self.saved_at + JOB_PROGRESS_INTERVAL - loop.time()
+            if wait > 0 and not self.wake.is_set():
+                try:
+                    await asyncio.wait_for(self.wake.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            self.wake.clear()
+            fields, self.pending = self.pending, None
+            self.phase, self.saved_at = fields["phase"], loop.time()
+            try:
+                await asyncio.to_thread(_update, self.job_id, **fields)
+            except Exception as e:
+                print(f"Saving progress of job {self.job_id} failed: {e}")
+        self.task = None
+
+    async def flush(self):
+        """Save the latest progress now (before the job's final update)"""
+        if self.task is not None:
+            self.wake.set()
+            await self.task
+
+
+def _start(job_id):
+    task = asyncio.create_task(_execute(job_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(JOB_CONCURRENCY)
+    return _semaphore
+
+
+async def _execute(job_id):
+    async with _get_semaphore():
+        db = SessionLocal()
+        try:
+            job = db.query(models.Job).filter(models.Job.id == job_id).first()
+            kind, params, attempts = job.kind, job.params or {}, job.attempts or 0
+        finally:
+            db.close()
+
+        snapshot = await asyncio.to_thread(_update, job_id, status="running", phase=None, progress={},
+                                           attempts=attempts + 1, started_at=datetime.utcnow())
+        _publish(job_id, {"type": "running", "job": snapshot})
+        print(f"Running {kind} job {job_id} (attempt {attempts + 1})")
+
+        progress = _ProgressWriter(job_id)
+        try:
+            result = await _handlers[kind](params, progress)
+            # Store exactly what the SSE stream and GET endpoint will return
+            result = json.loads(json.dumps(result, default=str))
+            await progress.flush()
+            snapshot = await asyncio.to_thread(_update, job_id, status="completed", result=result,
+                                               finished_at=datetime.utcnow())
+            _publish(job_id, {"type": "completed", "job": snapshot})
+            print(f"{kind} job {job_id} completed")
+        except Exception as e:
+            error = getattr(e, "detail", None) or f"{type(e).__name__}: {e}"
+            await progress.flush()
+            snapshot = await asyncio.to_thread(_update, job_id, status="failed", error=str(error),
+                                               finished_at=datetime.utcnow())
+            _publish(job_id, {"type": "failed", "job": snapshot})
+            print(f"{kind} job {job_id} failed: {error}")
@@ -0,0 +1,63 @@
+"""
+Persistent cache of judge scores.
+
+Re-evaluating a transcript the judge has already scored (a backfill, a restarted
+pipeline, forks or replays that produce the same conversation) is answered from
+here instead of calling the judge again. Keys hash the normalized formatted
+transcript, the scenario goal and the rubric version, so editing the judge prompt
+invalidates every entry. Unlike the LLM response cache there is no TTL: scores
+stay valid until the rubric changes.
+"""
+import os
+import json
+import hashlib
+from dotenv import load_dotenv
+from services.cache_store import CacheStore
+
+load_dotenv()
+
+JUDGE_CACHE_ENABLED = os.getenv("JUDGE_CACHE_ENABLED", "true").lower() == "true"
+JUDGE_CACHE_PATH = os.getenv("JUDGE_CACHE_PATH", "./judge_cache.db")
+JUDGE_CACHE_MEMORY_ITEMS = int(os.getenv("JUDGE_CACHE_MEMORY_ITEMS", "1024"))
+
+# Entries are tagged with their rubric version
+_store = CacheStore("Judge cache", JUDGE_CACHE_PATH, "judge_cache", JUDGE_CACHE_MEMORY_ITEMS)
+
+
+def make_key(formatted_transcript, goal, rubric_version):
+    """Hash a judge request into a cache key (None when caching is disabled)"""
+    if not JUDGE_CACHE_ENABLED:
+        return None
+    # Whitespace differences don't change what the judge reads
+    normalized = "\n".join(" ".join(line.split()) for line in formatted_transcript.strip().splitlines())
+    payload = json.dumps([normalized, " ".join((goal or "").split()), rubric_version], ensure_ascii=False)
+    return f"{rubric_version}:{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+def get(key):
+    """Return a copy of the cached scores for key, or None on a miss"""
+    value = _store.get(key)
+    return json.loads(value) if value is not None else None
+
+
+async def get_async(key):
+    """get() for async callers (a disk lookup runs in a worker thread)"""
+    value = await _store.get_async(key)
+    return json.loads(value) if value is not None else None
+
+
+def put(key, scores):
+    """Store a successful judgment under key (written to disk in the background)"""
+    if key is None or scores is None:
+        return
+    _store.put(key, json.dumps(scores, ensure_ascii=False), tag=key.split(":", 1)[0])
+
+
+def clear(keep_version=None):
+    """Empty the cache, or only drop entries from rubric versions other than keep_version"""
+    return _store.clear(keep_tag=keep_version)
+
+
+def get_stats(rubric_version=None):
+    """Hit/miss counters and entries stored (in total and for rubric_version)"""
+    return {**_store.get_stats(rubric_version), "enabled": JUDGE_CACHE_ENABLED, "rubric_version": rubric_version}
@@ -0,0 +1,74 @@
+"""
+Live fan-out of simulation events.
+
+Each running simulation publishes its events once to a channel; any number of
+watchers (SSE or WebSocket) subscribe to it instead of polling the run. A watcher
+joining mid-run first gets the turns so far, then live events. Partial reply text
+("delta") is only sent live, never replayed.
+"""
+import os
+import asyncio
+
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "1000"))  # events buffered per watcher before it is dropped
+
+# Events that end a run's stream
+FINAL_EVENTS = ("completed", "failed")
+
+# Not kept for replay
+LIVE_ONLY_EVENTS = ("delta", "audio")
+
+# run id -> Channel
+_channels = {}
+
+
+class Channel:
+    """One run's event history (for late joiners) and its watchers' queues"""
+
+    def __init__(self):
+        self.history = []
+        self.subscribers = set()
+
+
+def subscribe(run_id):
+    """
+    Watch a run: returns (events so far, queue of live events). The channel is created if the
+    run hasn't started yet, so watchers can attach to pending (e.g. batch) runs.
+    """
+    channel = _channels.setdefault(run_id, Channel())
+    queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+    channel.subscribers.add(queue)
+    return list(channel.history), queue
+
+
+def unsubscribe(run_id, queue):
+    channel = _channels.get(run_id)
+    if channel is not None:
+        channel.subscribers.discard(queue)
+        if not channel.subscribers and not channel.history:
+            del _channels[run_id]  # last watcher of a run that never started
+
+
+def is_live(run_id):
+    """True while the run is publishing (or has watchers waiting for it to start)"""
+    return run_id in _channels
+
+
+def publish(run_id, event):
+    """Send an event to every watcher of the run; a final event closes the channel"""
+    channel = _channels.setdefault(run_id, Channel())
+    if event["type"] not in LIVE_ONLY_EVENTS:
+        channel.history.append(event)
+
+    for queue in list(channel.subscribers):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too far behind: drop the watcher rather than buffer without limit.
+            # It can reconnect and replay the history.
+            channel.subscribers.discard(queue)
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"type": "lagged", "run_id": run_id})
+
+    if event["type"] in FINAL_EVENTS:
+        del _channels[run_id]
@@ -1,46 +1,282 @@
 import os
-from groq import Groq
-from cerebras.cloud.sdk import Cerebras
-from openai import OpenAI
+import json
+import time
+import inspect
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+import httpx
+from groq import Groq, AsyncGroq
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
+from services import llm_cache, llm_log
+from services.rate_limit import get_rate_limiter, estimate_tokens, LLM_MAX_RETRIES, CONNECTION_ERRORS, PRIORITY_BATCH
 
 load_dotenv()
 
 # ===== CONFIGURATION: Change this to switch LLM provider =====
-PROVIDER = "nvidia"  # Options: "groq", "cerebras", or "nvidia"
+PROVIDER = os.getenv("LLM_PROVIDER", "nvidia")  # Options: "groq", "cerebras", "nvidia", or "stub" (stub_llm_server.py)
 # ==============================================================
 
+# Backup providers for failover and hedging, in order (e.g. "groq,cerebras").
+# Providers without an API key set are skipped.
+FALLBACK_PROVIDERS = [p.strip().lower() for p in os.getenv("LLM_FALLBACK_PROVIDERS", "").split(",") if p.strip()]
 
-def get_llm_response(system_prompt, messages=[], max_tokens=None):
-    """Get LLM response from Groq, Cerebras, or NVIDIA"""
-    provider = PROVIDER.lower()
+# Hedging: once the primary has been slower than this latency percentile,
+# send a duplicate request to the first fallback and take whichever answers first
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "15.0"))  # seconds, until enough samples
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
 
-    if provider == "groq":
-        if not os.getenv("GROQ_API_KEY"):
-            raise ValueError("GROQ_API_KEY not set")
-        client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        model = "llama-3.3-70b-versatile"
-    elif provider == "cerebras":
-        if not os.getenv("CEREBRAS_API_KEY"):
-            raise ValueError("CEREBRAS_API_KEY not set")
-        client = Cerebras(api_key=os.getenv("CEREBRAS_API_KEY"))
-        model = "llama-3.3-70b"
-    elif provider == "nvidia":
-        if not os.getenv("NVIDIA_API_KEY"):
-            raise ValueError("NVIDIA_API_KEY not set")
-        client = OpenAI(
-            base_url="https://integrate.api.nvidia.com/v1",
-            api_key=os.getenv("NVIDIA_API_KEY")
-        )
-        model = "qwen/qwen3-235b-a22b"
-    else:
-        raise ValueError(f"Invalid PROVIDER: {provider}. Use 'groq', 'cerebras', or 'nvidia'")
+# Per-provider settings: API key env var, model, base URL (None = SDK default),
+# whether it has an OpenAI-style batch API (files + batches endpoints),
+# and an optional default key for providers that don't need a real one
+PROVIDERS = {
+    "groq": {
+        "api_key_env": "GROQ_API_KEY",
+        "model": "llama-3.3-70b-versatile",
+        "base_url": None,
+        "batch_api": True,
+    },
+    "cerebras": {
+        "api_key_env": "CEREBRAS_API_KEY",
+        "model": "llama-3.3-70b",
+        "base_url": None,
+        "batch_api": False,
+    },
+    "nvidia": {
+        "api_key_env": "NVIDIA_API_KEY",
+        "model": "qwen/qwen3-235b-a22b",
+        "base_url": "https://integrate.api.nvidia.com/v1",
+        "batch_api": False,
+    },
+    "stub": {
+        "api_key_env": "STUB_API_KEY",
+        "model": "stub-model",
+        "base_url": os.getenv("STUB_LLM_URL", "http://127.0.0.1:8001/v1"),
+        "batch_api": True,
+        "default_api_key": "stub",
+    },
+}
+
+CLIENT_CLASSES = {
+    "groq": Groq,
+    "cerebras": Cerebras,
+    "nvidia": OpenAI,
+    "stub": OpenAI,
+}
+
+ASYNC_CLIENT_CLASSES = {
+    "groq": AsyncGroq,
+    "cerebras": AsyncCerebras,
+    "nvidia": AsyncOpenAI,
+    "stub": AsyncOpenAI,
+}
+
+# HTTP connection pool settings (one keep-alive pool per provider, shared by all calls)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+
+# Max in-flight async requests per provider (process-wide)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+
+# Bulk submission (LLMBatch): "auto" uses the provider's batch API for large enough batches,
+# "provider" always does, "local" always fans out over a thread pool
+LLM_BATCH_MODE = os.getenv("LLM_BATCH_MODE", "auto")
+LLM_BATCH_MIN_SIZE = int(os.getenv("LLM_BATCH_MIN_SIZE", "20"))  # smaller batches fan out locally in auto mode
+LLM_BATCH_COMPLETION_WINDOW = os.getenv("LLM_BATCH_COMPLETION_WINDOW", "24h")
+LLM_BATCH_POLL_INTERVAL = float(os.getenv("LLM_BATCH_POLL_INTERVAL", "30"))  # seconds
+LLM_BATCH_TIMEOUT = float(os.getenv("LLM_BATCH_TIMEOUT", str(24 * 3600)))
+LLM_BATCH_LOCAL_CONCURRENCY = int(os.getenv("LLM_BATCH_LOCAL_CONCURRENCY", "8"))
+
+# Client registries: provider name -> long-lived SDK client
+# (async clients and semaphores are bound to an event loop, so those are keyed by (loop, provider))
+_clients = {}
+_async_clients = {}
+_clients_lock = threading.Lock()
+
+# (loop, provider) -> asyncio.Semaphore limiting concurrent async calls
+_semaphores = {}
+
+# Recent streaming call metrics (time-to-first-token, tokens/sec)
+_stream_metrics = deque(maxlen=500)
+
+# Provider name -> recent successful call latencies (seconds)
+_latencies = {}
+_routing_stats = {"hedges": 0, "hedge_wins": 0, "failovers": 0}
+
+
+def get_provider_config(provider):
+    """Return the settings for a provider, raising on unknown names"""
+    config = PROVIDERS.get(provider)
+    if config is None:
+        raise ValueError(f"Invalid PROVIDER: {provider}. Use one of: {', '.join(PROVIDERS)}")
+    return config
+
+
+def get_api_key(provider):
+    """API key for a provider from its env var, or its default key (None if neither)"""
+    config = get_provider_config(provider)
+    return os.getenv(config["api_key_env"]) or config.get("default_api_key")
+
+
+def _http_limits():
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+    )
+
+
+def _http_timeout():
+    return httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT)
+
+
+def _create_client(provider, client_classes, http_client):
+    config = get_provider_config(provider)
+    api_key = get_api_key(provider)
+    if not api_key:
+        raise ValueError(f"{config['api_key_env']} not set")
+
+    # SDK retries are disabled: the rate scheduler owns retries and backoff
+    kwargs = {"api_key": api_key, "http_client": http_client, "max_retries": 0}
+    if config["base_url"]:
+        kwargs["base_url"] = config["base_url"]
+    return client_classes[provider](**kwargs)
+
+
+def get_client(provider=None):
+    """
+    Get the process-wide client for a provider, creating it on first use.
+    The client keeps its HTTP connection pool alive between calls, so
+    simulation turns reuse connections instead of paying a TLS handshake each time.
+    """
+    provider = (provider or PROVIDER).lower()
+    get_provider_config(provider)
+
+    client = _clients.get(provider)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(provider)
+        if client is None:
+            http_client = httpx.Client(limits=_http_limits(), timeout=_http_timeout())
+            client = _create_client(provider, CLIENT_CLASSES, http_client)
+            _clients[provider] = client
+    return client
+
+
+def get_async_client(provider=None):
+    """Async counterpart of get_client (one pooled async client per provider and event loop)"""
+    provider = (provider or PROVIDER).lower()
+    get_provider_config(provider)
+    key = (asyncio.get_running_loop(), provider)
+
+    client = _async_clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _async_clients.get(key)
+        if client is None:
+            http_client = httpx.AsyncClient(limits=_http_limits(), timeout=_http_timeout())
+            client = _create_client(provider, ASYNC_CLIENT_CLASSES, http_client)
+            _async_clients[key] = client
+    return client
+
+
+def _get_semaphore(provider):
+    key = (asyncio.get_running_loop(), provider)
+    semaphore = _semaphores.get(key)
+    if semaphore is None:
+        semaphore = _semaphores.setdefault(key, asyncio.Semaphore(LLM_MAX_CONCURRENCY))
+    return semaphore
+
+
+def close_clients():
+    """Close all pooled sync clients (called on app shutdown)"""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+async def close_async_clients():
+    """Close the pooled async clients of the running event loop (called on app shutdown)"""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        keys = [key for key in _async_clients if key[0] is loop]
+        clients = [_async_clients.pop(key) for key in keys]
+        for key in [key for key in _semaphores if key[0] is loop]:
+            del _semaphores[key]
+    for client in clients:
+        await client.close()
 
+
+def run_sync(coro):
+    """
+    Run an async LLM coroutine to completion from sync code (scripts; not inside an
+    event loop). The async clients it opened are closed before returning.
+    """
+    async def main():
+        try:
+            return await coro
+        finally:
+            await close_async_clients()
+
+    return asyncio.run(main())
+
+
+# Sampling seed sent with LLM calls in the current context (e.g. one forked simulation), None = unseeded
+current_seed = contextvars.ContextVar("llm_seed", default=None)
+
+
+@contextmanager
+def sampling_seed(seed):
+    """
+    Send `seed` with LLM calls in this block (no-op for None). Restores by value,
+    so it is safe to hold across yields in async generators.
+    """
+    previous = current_seed.get()
+    current_seed.set(seed if seed is not None else previous)
+    try:
+        yield
+    finally:
+        current_seed.set(previous)
+
+
+def cacheable_prompt(static_prefix, variable_suffix):
+    """
+    Call arguments for a prompt split into a static prefix (instructions, rubric, output
+    format) and a variable suffix (the inputs for this call). The prefix is the whole system
+    message, so it is byte-identical on every call and providers can serve it from their
+    prompt prefix cache; the suffix follows as the user message.
+    Use as get_llm_response(**prompt, max_tokens=...).
+    """
+    return {"system_prompt": static_prefix, "messages": [{"role": "user", "content": variable_suffix}]}
+
+
+def prompt_text(prompt):
+    """The full text of a cacheable_prompt (for storing or displaying it)"""
+    return "\n\n".join([prompt["system_prompt"]] + [message["content"] for message in prompt["messages"]])
+
+
+def _build_params(provider, system_prompt, messages, max_tokens):
     full_messages = [{"role": "system", "content": system_prompt}] + messages
 
     # Build parameters
     params = {
-        "model": model,
+        "model": get_provider_config(provider)["model"],
         "messages": full_messages
     }
 
@@ -54,11 +290,634 @@ def get_llm_response(system_prompt, messages=[], max_tokens=None):
     elif max_tokens:
         params["max_tokens"] = max_tokens
 
+    seed = current_seed.get()
+    if seed is not None:
+        params["seed"] = seed
+
+    return params
+
+
+def _log_error(provider, model, e):
+    print(f"\n!!! LLM API ERROR !!!")
+    print(f"Provider: {provider}, Model: {model}")
+    print(f"Error: {type(e).__name__}: {str(e)}")
+
+
+def _usage_tokens(response):
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage else None
+
+
+def _usage_split(response):
+    """(prompt_tokens, completion_tokens, cached_tokens) reported by the provider, or Nones"""
+    usage = getattr(response, "usage", None)
+    if not usage:
+        return None, None, None
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None), _cached_tokens(usage)
+
+
+def _cached_tokens(usage):
+    """Prompt tokens the provider served from its prefix cache (usage.prompt_tokens_details.cached_tokens)"""
+    details = usage.get("prompt_tokens_details") if isinstance(usage, dict) else getattr(usage, "prompt_tokens_details", None)
+    if not details:
+        return None
+    return details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", None)
+
+
+def _record_error(call_site, provider, model, started, e, streamed=False):
+    llm_log.record_call(call_site, provider, model, "error", time.monotonic() - started,
+                        streamed=streamed, error=f"{type(e).__name__}: {str(e)[:200]}")
+
+
+def _record_cache_hit(call_site, provider, streamed=False):
+    llm_log.record_call(call_site, provider, get_provider_config(provider)["model"], "cached", 0.0, streamed=streamed)
+
+
+def _record_latency(provider, seconds):
+    samples = _latencies.get(provider)
+    if samples is None:
+        samples = _latencies.setdefault(provider, deque(maxlen=200))
+    samples.append(seconds)
+
+
+def latency_percentile(provider, percentile):
+    """Observed latency percentile for a provider (None until there are samples)"""
+    samples = sorted(_latencies.get(provider, ()))
+    if not samples:
+        return None
+    index = min(len(samples) - 1, int(percentile * len(samples)))
+    return samples[index]
+
+
+def hedge_delay(provider):
+    """How long to wait on a provider before firing a hedge request"""
+    if len(_latencies.get(provider, ())) < LLM_HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_DEFAULT_DELAY
+    return max(LLM_HEDGE_MIN_DELAY, latency_percentile(provider, LLM_HEDGE_PERCENTILE))
+
+
+def get_routing_stats():
+    """Per-provider latency percentiles plus hedge/failover counters"""
+    return {
+        "primary": PROVIDER.lower(),
+        "fallbacks": FALLBACK_PROVIDERS,
+        "hedge_enabled": LLM_HEDGE_ENABLED,
+        **_routing_stats,
+        "providers": {
+            provider: {
+                "samples": len(samples),
+                "p50_seconds": latency_percentile(provider, 0.5),
+                "p95_seconds": latency_percentile(provider, 0.95),
+                "p99_seconds": latency_percentile(provider, 0.99),
+                "hedge_delay_seconds": hedge_delay(provider),
+            }
+            for provider, samples in list(_latencies.items())
+        },
+    }
+
+
+def _route(primary=None):
+    """Providers to try for a call: the primary (default PROVIDER), then configured fallbacks that have keys"""
+    providers = [(primary or PROVIDER).lower()]
+    for provider in FALLBACK_PROVIDERS:
+        if provider in PROVIDERS and provider not in providers and get_api_key(provider):
+            providers.append(provider)
+    return providers
+
+
+def _should_failover(error):
+    """Errors another provider could succeed on: connection failures, 429s and 5xx"""
+    status = getattr(error, "status_code", None)
+    return isinstance(error, CONNECTION_ERRORS) or status == 429 or (status is not None and status >= 500)
+
+
+def _call_provider(provider, system_prompt, messages, max_tokens, priority, call_site, failover):
+    """One provider, with rate limiting and retries. With failover, connection errors are raised at once."""
+    client = get_client(provider)
+    params = _build_params(provider, system_prompt, messages, max_tokens)
+    limiter = get_rate_limiter(provider)
+    estimated = estimate_tokens(params)
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        limiter.acquire(estimated, priority)
+        started = time.monotonic()
+        try:
+            raw = client.chat.completions.with_raw_response.create(**params)
+            latency = time.monotonic() - started
+            _record_latency(provider, latency)
+            limiter.update_from_headers(raw.headers)
+            response = raw.parse()
+            limiter.record_success(estimated, _usage_tokens(response))
+            llm_log.record_call(call_site, provider, params["model"], "ok", latency, *_usage_split(response))
+            return response.choices[0].message.content
+        except Exception as e:
+            _record_error(call_site, provider, params["model"], started, e)
+            delay = limiter.on_error(e, attempt)
+            if delay is None or attempt == LLM_MAX_RETRIES or (failover and isinstance(e, CONNECTION_ERRORS)):
+                _log_error(provider, params["model"], e)
+                raise
+            print(f"LLM call to {provider} failed ({type(e).__name__}), retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{LLM_MAX_RETRIES})")
+            time.sleep(delay)
+
+
+async def _call_provider_async(provider, system_prompt, messages, max_tokens, priority, call_site, failover,
+                               sent=None):
+    """Async version of _call_provider. sent (an asyncio.Event) is set once the request goes out."""
+    client = get_async_client(provider)
+    params = _build_params(provider, system_prompt, messages, max_tokens)
+    limiter = get_rate_limiter(provider)
+    estimated = estimate_tokens(params)
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        # Wait for rate budget before taking a concurrency slot
+        await limiter.acquire_async(estimated, priority)
+        started = time.monotonic()
+        try:
+            async with _get_semaphore(provider):
+                started = time.monotonic()
+                if sent:
+                    sent.set()
+                raw = await client.chat.completions.with_raw_response.create(**params)
+                latency = time.monotonic() - started
+                _record_latency(provider, latency)
+            limiter.update_from_headers(raw.headers)
+            response = raw.parse()
+            if inspect.isawaitable(response):  # Groq/Cerebras async raw responses parse asynchronously
+                response = await response
+            limiter.record_success(estimated, _usage_tokens(response))
+            llm_log.record_call(call_site, provider, params["model"], "ok", latency, *_usage_split(response))
+            return response.choices[0].message.content
+        except Exception as e:
+            _record_error(call_site, provider, params["model"], started, e)
+            delay = limiter.on_error(e, attempt)
+            if delay is None or attempt == LLM_MAX_RETRIES or (failover and isinstance(e, CONNECTION_ERRORS)):
+                _log_error(provider, params["model"], e)
+                raise
+            print(f"LLM call to {provider} failed ({type(e).__name__}), retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{LLM_MAX_RETRIES})")
+            await asyncio.sleep(delay)
+
+
+def _call_with_failover(providers, *args):
+    for i, provider in enumerate(providers):
+        is_last = i == len(providers) - 1
+        try:
+            return _call_provider(provider, *args, failover=not is_last)
+        except Exception as e:
+            if is_last or not _should_failover(e):
+                raise
+            _routing_stats["failovers"] += 1
+            print(f"Failing over from {provider} to {providers[i + 1]}")
+
+
+async def _call_with_failover_async(providers, *args):
+    for i, provider in enumerate(providers):
+        is_last = i == len(providers) - 1
+        try:
+            return await _call_provider_async(provider, *args, failover=not is_last)
+        except Exception as e:
+            if is_last or not _should_failover(e):
+                raise
+            _routing_stats["failovers"] += 1
+            print(f"Failing over from {provider} to {providers[i + 1]}")
+
+
+async def _call_hedged_async(providers, *args):
+    """
+    Call the primary; if it has not answered within its hedge delay, also call the
+    first fallback. The first successful answer wins and the other call is cancelled.
+    The delay counts from when the primary request goes out, so waiting locally for
+    rate budget or a concurrency slot never triggers a hedge.
+    """
+    sent = asyncio.Event()
+    primary = asyncio.create_task(_call_provider_async(providers[0], *args, failover=True, sent=sent))
+    waiter = asyncio.create_task(sent.wait())
+    tasks = [primary]
+    started = None
     try:
-        response = client.chat.completions.create(**params)
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"\n!!! LLM API ERROR !!!")
-        print(f"Provider: {provider}, Model: {model}")
-        print(f"Error: {type(e).__name__}: {str(e)}")
-        raise
+        await asyncio.wait({primary, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        started = time.monotonic()
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay(providers[0]))
+        if done:
+            error = primary.exception()
+            if error is None:
+                return primary.result()
+            if not _should_failover(error):
+                raise error
+            _routing_stats["failovers"] += 1
+            print(f"Failing over from {providers[0]} to {providers[1]}")
+            return await _call_with_failover_async(providers[1:], *args)
+
+        _routing_stats["hedges"] += 1
+        print(f"Hedging slow {providers[0]} call with {providers[1]}")
+        hedge = asyncio.create_task(_call_provider_async(providers[1], *args, failover=False))
+        tasks.append(hedge)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        _routing_stats["hedge_wins"] += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        # Also runs when the caller is cancelled, so no call is left running unowned
+        waiter.cancel()
+        if sent.is_set() and started is not None and not primary.done():
+            # Count the abandoned call as at least this slow so the threshold reflects it
+            _record_latency(providers[0], time.monotonic() - started)
+        for task in tasks:
+            task.cancel()
+
+
+def get_llm_response(system_prompt, messages=[], max_tokens=None, use_cache=True, priority=None,
+                     call_site=None, provider=None):
+    """
+    Get LLM response from Groq, Cerebras, or NVIDIA.
+    Identical requests are served from the response cache unless use_cache=False.
+    Calls wait for the provider's rate budget (at the given priority, default from
+    the calling context) and are retried with backoff on 429s and transient errors.
+    If the primary provider keeps failing, FALLBACK_PROVIDERS are tried in order.
+    provider overrides the primary (LLM_PROVIDER) for this call.
+    """
+    provider = (provider or PROVIDER).lower()
+    cache_key = None
+    if use_cache:
+        cache_key = llm_cache.make_key(provider, _build_params(provider, system_prompt, messages, max_tokens))
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        _record_cache_hit(call_site, provider)
+        return cached
+
+    content = _call_with_failover(_route(provider), system_prompt, messages, max_tokens, priority, call_site)
+    llm_cache.put(cache_key, content)
+    return content
+
+
+async def get_llm_response_async(system_prompt, messages=[], max_tokens=None, use_cache=True, priority=None,
+                                 call_site=None, provider=None):
+    """
+    Async version of get_llm_response.
+    Calls are limited per provider by a process-wide semaphore (LLM_MAX_CONCURRENCY),
+    so many conversations can share one event loop without flooding the provider.
+    With a fallback provider configured, slow calls are hedged (see hedge_delay).
+    """
+    provider = (provider or PROVIDER).lower()
+    cache_key = None
+    if use_cache:
+        cache_key = llm_cache.make_key(provider, _build_params(provider, system_prompt, messages, max_tokens))
+    cached = await llm_cache.get_async(cache_key)
+    if cached is not None:
+        _record_cache_hit(call_site, provider)
+        return cached
+
+    providers = _route(provider)
+    if LLM_HEDGE_ENABLED and len(providers) > 1:
+        content = await _call_hedged_async(providers, system_prompt, messages, max_tokens, priority, call_site)
+    else:
+        content = await _call_with_failover_async(providers, system_prompt, messages, max_tokens, priority, call_site)
+    llm_cache.put(cache_key, content)
+    return content
+
+
+def _record_stream_metrics(provider, model, started, first_token_at, chunks):
+    finished = time.monotonic()
+    ttft = (first_token_at - started) if first_token_at else None
+    generation_time = (finished - first_token_at) if first_token_at else None
+    metrics = {
+        "provider": provider,
+        "model": model,
+        "ttft_seconds": ttft,
+        "total_seconds": finished - started,
+        "tokens": chunks,  # one content delta per token (approximate)
+        "tokens_per_second": chunks / generation_time if generation_time else None,
+    }
+    _stream_metrics.append(metrics)
+    return metrics
+
+
+def get_stream_stats():
+    """Averages over recent streaming calls"""
+    metrics = list(_stream_metrics)
+    ttfts = [m["ttft_seconds"] for m in metrics if m["ttft_seconds"] is not None]
+    rates = [m["tokens_per_second"] for m in metrics if m["tokens_per_second"] is not None]
+    return {
+        "calls": len(metrics),
+        "avg_ttft_seconds": sum(ttfts) / len(ttfts) if ttfts else None,
+        "max_ttft_seconds": max(ttfts) if ttfts else None,
+        "avg_tokens_per_second": sum(rates) / len(rates) if rates else None,
+        "recent": metrics[-10:],
+    }
+
+
+def _chunk_text(chunk):
+    if not chunk.choices:
+        return None
+    return chunk.choices[0].delta.content
+
+
+def _record_stream_call(call_site, provider, params, usage, chunks, metrics):
+    """Log a finished stream; without a usage chunk, tokens are estimated (prompt chars / 4, one per delta)"""
+    prompt_tokens, completion_tokens, cached_tokens = usage
+    if prompt_tokens is None:
+        prompt_tokens = sum(len(m.get("content") or "") for m in params["messages"]) // 4
+    if completion_tokens is None:
+        completion_tokens = chunks
+    llm_log.record_call(call_site, provider, params["model"], "ok", metrics["total_seconds"],
+                        prompt_tokens, completion_tokens, cached_tokens, streamed=True)
+
+
+def _stream_provider(provider, system_prompt, messages, max_tokens, priority, call_site, failover):
+    """Stream from one provider with rate limiting; retries only before any text is yielded"""
+    client = get_client(provider)
+    params = _build_params(provider, system_prompt, messages, max_tokens)
+    params["stream"] = True
+    limiter = get_rate_limiter(provider)
+    estimated = estimate_tokens(params)
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        limiter.acquire(estimated, priority)
+        started = time.monotonic()
+        first_token_at = None
+        chunks = 0
+        usage = (None, None, None)
+        try:
+            for chunk in client.chat.completions.create(**params):
+                if getattr(chunk, "usage", None):
+                    usage = _usage_split(chunk)
+                delta = _chunk_text(chunk)
+                if delta:
+                    if first_token_at is None:
+                        first_token_at = time.monotonic()
+                    chunks += 1
+                    yield delta
+            limiter.record_success(estimated)
+            metrics = _record_stream_metrics(provider, params["model"], started, first_token_at, chunks)
+            _record_stream_call(call_site, provider, params, usage, chunks, metrics)
+            return
+        except Exception as e:
+            _record_error(call_site, provider, params["model"], started, e, streamed=True)
+            # Once text has been yielded a retry would duplicate it
+            delay = limiter.on_error(e, attempt)
+            if chunks or delay is None or attempt == LLM_MAX_RETRIES or (failover and isinstance(e, CONNECTION_ERRORS)):
+                _log_error(provider, params["model"], e)
+                raise
+            print(f"LLM stream to {provider} failed ({type(e).__name__}), retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{LLM_MAX_RETRIES})")
+            time.sleep(delay)
+
+
+async def _stream_provider_async(provider, system_prompt, messages, max_tokens, priority, call_site, failover):
+    """Async version of _stream_provider"""
+    client = get_async_client(provider)
+    params = _build_params(provider, system_prompt, messages, max_tokens)
+    params["stream"] = True
+    limiter = get_rate_limiter(provider)
+    estimated = estimate_tokens(params)
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        await limiter.acquire_async(estimated, priority)
+        started = time.monotonic()
+        first_token_at = None
+        chunks = 0
+        usage = (None, None, None)
+        try:
+            async with _get_semaphore(provider):
+                stream = await client.chat.completions.create(**params)
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        usage = _usage_split(chunk)
+                    delta = _chunk_text(chunk)
+                    if delta:
+                        if first_token_at is None:
+                            first_token_at = time.monotonic()
+                        chunks += 1
+                        yield delta
+            limiter.record_success(estimated)
+            metrics = _record_stream_metrics(provider, params["model"], started, first_token_at, chunks)
+            _record_stream_call(call_site, provider, params, usage, chunks, metrics)
+            return
+        except Exception as e:
+            _record_error(call_site, provider, params["model"], started, e, streamed=True)
+            delay = limiter.on_error(e, attempt)
+            if chunks or delay is None or attempt == LLM_MAX_RETRIES or (failover and isinstance(e, CONNECTION_ERRORS)):
+                _log_error(provider, params["model"], e)
+                raise
+            print(f"LLM stream to {provider} failed ({type(e).__name__}), retrying in {delay:.1f}s "
+                  f"(attempt {attempt + 1}/{LLM_MAX_RETRIES})")
+            await asyncio.sleep(delay)
+
+
+def stream_llm_response(system_prompt, messages=[], max_tokens=None, use_cache=True, priority=None,
+                        call_site=None):
+    """
+    Streaming variant of get_llm_response: yields text deltas as they arrive.
+    Records time-to-first-token and tokens/sec for each call (see get_stream_stats).
+    A cache hit is yielded as a single chunk. Fails over to FALLBACK_PROVIDERS only
+    if the failing provider has not produced any text yet.
+    """
+    provider = PROVIDER.lower()
+    cache_key = None
+    if use_cache:
+        cache_key = llm_cache.make_key(provider, _build_params(provider, system_prompt, messages, max_tokens))
+    cached = llm_cache.get(cache_key)
+    if cached is not None:
+        _record_cache_hit(call_site, provider, streamed=True)
+        yield cached
+        return
+
+    providers = _route()
+    parts = []
+    for i, provider in enumerate(providers):
+        is_last = i == len(providers) - 1
+        try:
+            for delta in _stream_provider(provider, system_prompt, messages, max_tokens, priority, call_site,
+                                          failover=not is_last):
+                parts.append(delta)
+                yield delta
+            break
+        except Exception as e:
+            if parts or is_last or not _should_failover(e):
+                raise
+            _routing_stats["failovers"] += 1
+            print(f"Failing over stream from {provider} to {providers[i + 1]}")
+
+    llm_cache.put(cache_key, "".join(parts))
+
+
+async def stream_llm_response_async(system_prompt, messages=[], max_tokens=None, use_cache=True, priority=None,
+                                    call_site=None):
+    """Async version of stream_llm_response (async generator of text deltas)"""
+    provider = PROVIDER.lower()
+    cache_key = None
+    if use_cache:
+        cache_key = llm_cache.make_key(provider, _build_params(provider, system_prompt, messages, max_tokens))
+    cached = await llm_cache.get_async(cache_key)
+    if cached is not None:
+        _record_cache_hit(call_site, provider, streamed=True)
+        yield cached
+        return
+
+    providers = _route()
+    parts = []
+    for i, provider in enumerate(providers):
+        is_last = i == len(providers) - 1
+        try:
+            async for delta in _stream_provider_async(provider, system_prompt, messages, max_tokens, priority, call_site,
+                                                      failover=not is_last):
+                parts.append(delta)
+                yield delta
+            break
+        except Exception as e:
+            if parts or is_last or not _should_failover(e):
+                raise
+            _routing_stats["failovers"] += 1
+            print(f"Failing over stream from {provider} to {providers[i + 1]}")
+
+    llm_cache.put(cache_key, "".join(parts))
+
+
+class LLMBatch:
+    """
+    Collects many independent, latency-insensitive requests (judging, pattern
+    extraction, re-scoring sweeps) and runs them together.
+
+        batch = LLMBatch()
+        futures = [batch.submit(prompt, max_tokens=600, call_site=JUDGE) for prompt in prompts]
+        batch.run()                      # blocks until every future is resolved
+        results = [f.result() for f in futures]
+
+    With a provider batch API (PROVIDERS[...]["batch_api"]) the requests go out as one
+    batch job that is polled until it finishes. Otherwise, and for any request the job
+    did not answer, they fan out locally over a thread pool at batch priority through the
+    normal rate limiter, retries and failover. Cache hits resolve at submit time; the
+    call context (run_id etc.) at submit time is used when logging each call.
+    """
+
+    def __init__(self, provider=None, mode=None):
+        self.provider = (provider or PROVIDER).lower()
+        self.mode = mode or LLM_BATCH_MODE
+        self.requests = []
+        self.stats = {"submitted": 0, "cached": 0, "provider_batch": 0, "local": 0, "failed": 0}
+
+    def submit(self, system_prompt, messages=[], max_tokens=None, use_cache=True, call_site=None):
+        """Queue a request; returns a concurrent.futures.Future for its text (await with asyncio.wrap_future)"""
+        future = Future()
+        params = _build_params(self.provider, system_prompt, messages, max_tokens)
+        cache_key = llm_cache.make_key(self.provider, params) if use_cache else None
+        self.stats["submitted"] += 1
+
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            _record_cache_hit(call_site, self.provider)
+            self.stats["cached"] += 1
+            future.set_result(cached)
+            return future
+
+        self.requests.append({
+            "args": (system_prompt, messages, max_tokens, PRIORITY_BATCH, call_site),
+            "params": params,
+            "cache_key": cache_key,
+            "call_site": call_site,
+            "context": contextvars.copy_context(),
+            "future": future,
+        })
+        return future
+
+    def run(self):
+        """Send everything submitted so far and block until all futures are resolved"""
+        pending, self.requests = self.requests, []
+        if not pending:
+            return self.stats
+
+        use_provider = get_provider_config(self.provider).get("batch_api") and (
+            self.mode == "provider" or (self.mode == "auto" and len(pending) >= LLM_BATCH_MIN_SIZE)
+        )
+        if use_provider:
+            try:
+                self._run_provider_batch(pending)
+            except Exception as e:
+                print(f"LLM batch job on {self.provider} failed ({type(e).__name__}: {e}), "
+                      f"falling back to local fan-out")
+            pending = [r for r in pending if not r["future"].done()]
+
+        if pending:
+            self._run_local(pending)
+        return self.stats
+
+    def _run_provider_batch(self, pending):
+        client = get_client(self.provider)
+        model = get_provider_config(self.provider)["model"]
+
+        lines = []
+        for i, request in enumerate(pending):
+            body = dict(request["params"])
+            body.pop("stream", None)
+            body.update(body.pop("extra_body", None) or {})
+            lines.append(json.dumps({"custom_id": str(i), "method": "POST", "url": "/v1/chat/completions", "body": body}))
+
+        input_file = client.files.create(file=("llm_batch.jsonl", "\n".join(lines).encode("utf-8")), purpose="batch")
+        job = client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=LLM_BATCH_COMPLETION_WINDOW
+        )
+        print(f"Submitted LLM batch job {job.id} to {self.provider} ({len(pending)} requests)")
+
+        started = time.monotonic()
+        while job.status not in ("completed", "failed", "expired", "cancelled"):
+            if time.monotonic() - started > LLM_BATCH_TIMEOUT:
+                client.batches.cancel(job.id)
+                raise TimeoutError(f"batch job {job.id} not finished after {LLM_BATCH_TIMEOUT:.0f}s")
+            time.sleep(LLM_BATCH_POLL_INTERVAL)
+            job = client.batches.retrieve(job.id)
+            counts = getattr(job, "request_counts", None)
+            if counts is not None:
+                print(f"LLM batch job {job.id}: {job.status} ({counts.completed}/{counts.total} done)")
+
+        print(f"LLM batch job {job.id} {job.status} after {time.monotonic() - started:.0f}s")
+        if not job.output_file_id:
+            return
+
+        output = client.files.content(job.output_file_id).read().decode("utf-8")
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            request = pending[int(item["custom_id"])]
+            response = item.get("response") or {}
+            if response.get("status_code") != 200:
+                continue  # retried locally
+
+            body = response["body"]
+            content = body["choices"][0]["message"]["content"]
+            usage = body.get("usage") or {}
+            # No per-request latency for batch jobs
+            request["context"].run(
+                llm_log.record_call, request["call_site"], self.provider, model, "ok", None,
+                usage.get("prompt_tokens"), usage.get("completion_tokens"), _cached_tokens(usage)
+            )
+            llm_cache.put(request["cache_key"], content)
+            request["future"].set_result(content)
+            self.stats["provider_batch"] += 1
+
+    def _run_local(self, pending):
+        providers = [self.provider] + [p for p in _route() if p != self.provider]
+
+        def call(request):
+            try:
+                content = request["context"].run(_call_with_failover, providers, *request["args"])
+                llm_cache.put(request["cache_key"], content)
+                request["future"].set_result(content)
+                self.stats["local"] += 1
+            except Exception as e:
+                request["future"].set_exception(e)
+                self.stats["failed"] += 1
+
+        print(f"Running {len(pending)} LLM requests locally ({LLM_BATCH_LOCAL_CONCURRENCY} at a time)")
+        with ThreadPoolExecutor(max_workers=LLM_BATCH_LOCAL_CONCURRENCY) as pool:
+            list(pool.map(call, pending))
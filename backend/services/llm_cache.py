@@ -0,0 +1,56 @@
+"""
+Content-addressed cache for LLM responses.
+
+Identical requests (same provider, model, messages and sampling params) are
+answered from an in-memory LRU first, then from a SQLite file with TTL and
+size-based eviction. Callers opt out per call with use_cache=False.
+"""
+import os
+import json
+import hashlib
+from dotenv import load_dotenv
+from services.cache_store import CacheStore
+
+load_dotenv()
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./llm_cache.db")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "1024"))
+
+_store = CacheStore("LLM cache", LLM_CACHE_PATH, "llm_cache", LLM_CACHE_MEMORY_ITEMS,
+                    ttl=LLM_CACHE_TTL, max_bytes=LLM_CACHE_MAX_BYTES)
+
+
+def make_key(provider, params):
+    """Hash a request into a cache key (None when caching is disabled)"""
+    if not LLM_CACHE_ENABLED:
+        return None
+    payload = json.dumps({"provider": provider, **params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get(key):
+    """Return the cached response for key, or None on a miss"""
+    return _store.get(key)
+
+
+async def get_async(key):
+    """get() for async callers (a disk lookup runs in a worker thread)"""
+    return await _store.get_async(key)
+
+
+def put(key, value):
+    """Store a response under key in both tiers (written to disk in the background)"""
+    _store.put(key, value)
+
+
+def clear():
+    """Empty both cache tiers"""
+    _store.clear()
+
+
+def get_stats():
+    """Hit/miss counters and current cache size"""
+    return {**_store.get_stats(), "enabled": LLM_CACHE_ENABLED}
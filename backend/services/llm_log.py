@@ -0,0 +1,244 @@
+"""
+Per-call LLM accounting.
+
+Every LLM call (including cache hits and failed attempts) is recorded with its
+call site, provider, latency and token usage, tagged with the simulation run,
+evolution cycle and persona from the calling context. Records are queued and
+written in batches by a background thread to the append-only llm_calls table,
+so logging never adds a database round trip to the call path.
+"""
+import os
+import time
+import atexit
+import queue
+import threading
+import contextvars
+from datetime import datetime
+from contextlib import contextmanager
+from sqlalchemy import func
+from database import SessionLocal, engine
+import models
+
+LLM_LOG_ENABLED = os.getenv("LLM_LOG_ENABLED", "true").lower() == "true"
+LLM_LOG_BATCH_SIZE = int(os.getenv("LLM_LOG_BATCH_SIZE", "100"))
+LLM_LOG_FLUSH_INTERVAL = float(os.getenv("LLM_LOG_FLUSH_INTERVAL", "2.0"))  # seconds
+LLM_LOG_QUEUE_SIZE = 10000  # records beyond this are dropped rather than blocking calls
+
+# Call sites
+AGENT_TURN = "agent_turn"
+CUSTOMER_TURN = "customer_turn"
+JUDGE = "judge"
+PATTERN_EXTRACTION = "pattern_extraction"
+MUTATION = "mutation"
+CONTEXT_SUMMARY = "context_summary"
+TERMINATION_CHECK = "termination_check"
+JUDGE_MULTI = "judge_multi"  # several transcripts judged in one call
+TURN_JUDGE = "turn_judge"  # a window of turns judged while the conversation runs
+
+# run_id / evolution_id / persona_id for LLM calls made in the current context
+current_context = contextvars.ContextVar("llm_call_context", default={})
+
+_queue = queue.Queue(maxsize=LLM_LOG_QUEUE_SIZE)
+_writer = None
+_writer_lock = threading.Lock()
+_flush_requested = threading.Event()
+_stats = {"recorded": 0, "written": 0, "dropped": 0, "write_errors": 0}
+
+
+@contextmanager
+def call_context(**fields):
+    """
+    Tag LLM calls in this block (e.g. run_id=..., persona_id=..., evolution_id=...).
+    Nested blocks add to the outer context. Restores by value rather than token,
+    so it is safe to hold across yields in async generators.
+    """
+    previous = current_context.get()
+    current_context.set({**previous, **fields})
+    try:
+        yield
+    finally:
+        current_context.set(previous)
+
+
+def record_call(call_site, provider, model, status, latency, prompt_tokens=None, completion_tokens=None,
+                cached_tokens=None, streamed=False, error=None):
+    """Queue one call record (never blocks or raises)"""
+    if not LLM_LOG_ENABLED:
+        return
+    context = current_context.get()
+    row = {
+        "call_site": call_site,
+        "provider": provider,
+        "model": model,
+        "status": status,
+        "error": error,
+        "latency_seconds": latency,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_tokens": cached_tokens,
+        "streamed": streamed,
+        "run_id": context.get("run_id"),
+        "evolution_id": context.get("evolution_id"),
+        "persona_id": context.get("persona_id"),
+        "created_at": datetime.utcnow(),
+    }
+    _ensure_writer()
+    try:
+        _queue.put_nowait(row)
+        _stats["recorded"] += 1
+    except queue.Full:
+        _stats["dropped"] += 1
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            # The table may not exist yet when services are used outside the app (scripts)
+            models.LLMCall.__table__.create(bind=engine, checkfirst=True)
+            _writer = threading.Thread(target=_write_loop, name="llm-log-writer", daemon=True)
+            _writer.start()
+            atexit.register(flush)  # scripts exit without an app shutdown hook
+
+
+def _drain(batch, timeout):
+    """Collect up to LLM_LOG_BATCH_SIZE queued rows, waiting at most timeout (None = forever) for the first"""
+    try:
+        batch.append(_queue.get(timeout=timeout))
+    except queue.Empty:
+        return
+    while len(batch) < LLM_LOG_BATCH_SIZE:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            return
+
+
+def _write(batch):
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(models.LLMCall, batch)
+        db.commit()
+        _stats["written"] += len(batch)
+    except Exception as e:
+        db.rollback()
+        _stats["write_errors"] += 1
+        print(f"LLM call log write failed ({len(batch)} records): {e}")
+    finally:
+        db.close()
+
+
+def _write_loop():
+    while True:
+        batch = []
+        _drain(batch, None)  # sleep until there is something to write
+        # Then keep collecting for up to LLM_LOG_FLUSH_INTERVAL, unless a flush is waiting
+        deadline = time.monotonic() + LLM_LOG_FLUSH_INTERVAL
+        while len(batch) < LLM_LOG_BATCH_SIZE and not _flush_requested.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            _drain(batch, min(remaining, 0.1))
+        _write(batch)
+        for _ in batch:
+            _queue.task_done()
+
+
+def flush():
+    """
+    Block until everything recorded so far is written (on shutdown and script exit).
+    Blocking: call it from async code with asyncio.to_thread.
+    """
+    if _writer is None:
+        return
+    _flush_requested.set()
+    try:
+        _queue.join()
+    finally:
+        _flush_requested.clear()
+
+
+def get_stats():
+    """Queue/writer counters"""
+    return {**_stats, "queued": _queue.qsize(), "enabled": LLM_LOG_ENABLED}
+
+
+def _totals(query):
+    row = query.with_entities(
+        func.count(models.LLMCall.id),
+        func.sum(models.LLMCall.prompt_tokens),
+        func.sum(models.LLMCall.completion_tokens),
+        func.sum(models.LLMCall.cached_tokens),
+        func.sum(models.LLMCall.latency_seconds),
+    ).one()
+    calls, prompt_tokens, completion_tokens, cached_tokens, latency = row
+    return {
+        "calls": calls,
+        "prompt_tokens": prompt_tokens or 0,
+        "completion_tokens": completion_tokens or 0,
+        "cached_tokens": cached_tokens or 0,
+        "cached_share": round(cached_tokens / prompt_tokens, 3) if cached_tokens and prompt_tokens else 0.0,
+        "total_tokens": (prompt_tokens or 0) + (completion_tokens or 0),
+        "latency_seconds": round(latency or 0.0, 3),
+        "avg_latency_seconds": round(latency / calls, 3) if calls and latency else None,
+    }
+
+
+def summarize(db, **filters):
+    """
+    Token and latency totals for calls matching filters (run_id, evolution_id, persona_id),
+    overall and broken down by call site and status. Reads what the writer has committed;
+    the latest calls may still be queued (at most LLM_LOG_FLUSH_INTERVAL behind, see get_stats).
+    """
+    query = db.query(models.LLMCall)
+    for field, value in filters.items():
+        if value is not None:
+            query = query.filter(getattr(models.LLMCall, field) == value)
+
+    by_call_site = {}
+    for (call_site,) in query.with_entities(models.LLMCall.call_site).distinct().all():
+        site_query = query.filter(models.LLMCall.call_site.is_(None) if call_site is None
+                                  else models.LLMCall.call_site == call_site)
+        by_call_site[call_site or "unknown"] = _totals(site_query)
+
+    by_status = dict(
+        query.with_entities(models.LLMCall.status, func.count(models.LLMCall.id))
+        .group_by(models.LLMCall.status).all()
+    )
+
+    return {
+        **{field: value for field, value in filters.items() if value is not None},
+        **_totals(query),
+        "by_status": by_status,
+        "by_call_site": by_call_site,
+    }
+
+
+def summarize_by(db, field, limit=50):
+    """Totals grouped by run_id, evolution_id or persona_id, most tokens first (committed calls only)"""
+    column = getattr(models.LLMCall, field)
+    total_tokens = func.coalesce(func.sum(models.LLMCall.prompt_tokens), 0) + \
+        func.coalesce(func.sum(models.LLMCall.completion_tokens), 0)
+    rows = db.query(
+        column,
+        func.count(models.LLMCall.id),
+        func.sum(models.LLMCall.prompt_tokens),
+        func.sum(models.LLMCall.completion_tokens),
+        func.sum(models.LLMCall.cached_tokens),
+        func.sum(models.LLMCall.latency_seconds),
+    ).filter(column.isnot(None)).group_by(column).order_by(total_tokens.desc()).limit(limit).all()
+
+    return [
+        {
+            field: value,
+            "calls": calls,
+            "prompt_tokens": prompt_tokens or 0,
+            "completion_tokens": completion_tokens or 0,
+            "cached_tokens": cached_tokens or 0,
+            "total_tokens": (prompt_tokens or 0) + (completion_tokens or 0),
+            "latency_seconds": round(latency or 0.0, 3),
+        }
+        for value, calls, prompt_tokens, completion_tokens, cached_tokens, latency in rows
+    ]
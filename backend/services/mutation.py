@@ -1,13 +1,100 @@
+import re
 import json
-from services.llm import get_llm_response
+import asyncio
+from services.llm import get_llm_response_async, run_sync, cacheable_prompt, prompt_text
+from services.llm_log import PATTERN_EXTRACTION, MUTATION
 from services.vector_store import search_similar
 
+EMPTY_PATTERNS = {
+    "success_patterns": [],
+    "failure_patterns": [],
+    "key_insight": "Unable to extract patterns"
+}
+
+# Static instructions sent as the system message (identical on every call, so providers can
+# serve them from their prompt prefix cache); the evaluation data follows as the user message
+PATTERN_SYSTEM = """You analyze debt collection conversations to extract SPECIFIC PATTERNS.
+You will be given successful conversation excerpts (score >= 8), failed conversation excerpts (score < 5)
+and the specific issues evaluators identified.
+
+=== YOUR TASK ===
+Extract the TOP 5 specific behavioral patterns that differentiate success from failure:
+
+For each pattern, identify:
+1. What successful agents DO that failed agents DON'T
+2. What triggers this behavior (customer signal to watch for)
+3. Exact phrasing or approach that works
+
+Return a JSON object:
+{
+    "success_patterns": [
+        {
+            "pattern": "description of what works",
+            "trigger": "customer signal that should activate this",
+            "example_phrase": "actual words/approach to use"
+        }
+    ],
+    "failure_patterns": [
+        {
+            "pattern": "what to avoid",
+            "why_fails": "why this approach backfires"
+        }
+    ],
+    "key_insight": "single most important insight for improvement"
+}"""
+
+MUTATION_SYSTEM = """You are evolving an AI agent's system prompt to improve performance across MULTIPLE scenarios.
+You will be given the agent's name, its current prompt, the scenarios it was tested on, its performance data,
+patterns extracted from successful and failed conversations, and evaluator feedback.
+
+TASK:
+Generate an improved system prompt that:
+1. Keeps the core personality of the agent
+2. **EMBEDS the success patterns as explicit instructions**
+3. **INCLUDES warnings about failure patterns to avoid**
+4. Addresses the weaknesses shown in feedback
+5. **ADDS behavioral detection**: Agent should identify customer emotional state and adapt
+6. Maintains appropriate tone and role
+7. **CRITICAL: Must work well across ALL of the tested scenarios/contexts**
+8. **Include ADAPTIVE STRATEGIES**: Different approaches for hostile, evasive, desperate, cooperative customers
+9. **Be ROBUST and GENERALIZABLE, not optimized for just one situation**
+
+Return ONLY the new system prompt, nothing else. No explanations or meta-commentary."""
+
 
 def extract_patterns(evaluations, success_examples, failure_examples):
+    """Blocking wrapper around extract_patterns_async (not for use inside an event loop)"""
+    return run_sync(extract_patterns_async(evaluations, success_examples, failure_examples))
+
+
+async def extract_patterns_async(evaluations, success_examples, failure_examples):
     """
     NEW: Extract specific patterns that differentiate success from failure.
     This provides focused guidance for mutations instead of just showing examples.
     """
+    pattern_prompt = build_pattern_prompt(evaluations, success_examples, failure_examples)
+
+    try:
+        response = await get_llm_response_async(**pattern_prompt, max_tokens=600, call_site=PATTERN_EXTRACTION)
+        patterns = parse_patterns(response)
+        if patterns:
+            return patterns
+    except Exception as e:
+        print(f"Pattern extraction failed: {e}")
+
+    return dict(EMPTY_PATTERNS)
+
+
+def parse_patterns(response):
+    """Extract the pattern JSON from a raw LLM response (None if absent)"""
+    json_match = re.search(r'\{.*\}', response, re.DOTALL)
+    if json_match:
+        return json.loads(json_match.group())
+    return None
+
+
+def build_pattern_prompt(evaluations, success_examples, failure_examples):
+    """Build the pattern extraction prompt (cacheable_prompt arguments) from evaluations and vector-store examples"""
     # Aggregate structured issues from evaluations
     all_issues = {
         "opening": [],
@@ -26,10 +113,8 @@ def extract_patterns(evaluations, success_examples, failure_examples):
             if structured.get(key) and structured[key] != "null":
                 all_issues[key].append(structured[key])
     
-    # Build pattern extraction prompt
-    pattern_prompt = f"""Analyze these debt collection conversations to extract SPECIFIC PATTERNS.
-
-=== SUCCESSFUL CONVERSATION EXCERPTS (score >= 8) ===
+    # Build pattern extraction prompt: static task first, then this cycle's data
+    return cacheable_prompt(PATTERN_SYSTEM, f"""=== SUCCESSFUL CONVERSATION EXCERPTS (score >= 8) ===
 {success_examples}
 
 === FAILED CONVERSATION EXCERPTS (score < 5) ===
@@ -43,52 +128,26 @@ Empathy gaps: {'; '.join(all_issues['empathy'][:3]) or 'None noted'}
 Objection handling: {'; '.join(all_issues['objection_handling'][:3]) or 'None noted'}
 Closing issues: {'; '.join(all_issues['closing'][:3]) or 'None noted'}
 Compliance concerns: {'; '.join(all_issues['compliance_issues'][:3]) or 'None noted'}
-Adaptation failures: {'; '.join(all_issues['adaptation_moments'][:3]) or 'None noted'}
+Adaptation failures: {'; '.join(all_issues['adaptation_moments'][:3]) or 'None noted'}""")
 
-=== YOUR TASK ===
-Extract the TOP 5 specific behavioral patterns that differentiate success from failure:
 
-For each pattern, identify:
-1. What successful agents DO that failed agents DON'T
-2. What triggers this behavior (customer signal to watch for)
-3. Exact phrasing or approach that works
+async def analyze_history_async(persona_name, evaluations):
+    """
+    Success/failure examples from the vector store and the patterns extracted from them.
+    The same for every mutation of a cycle, so compute it once and pass it to each.
+    The vector search runs in a worker thread.
+    """
+    success_examples, failure_examples = await asyncio.to_thread(find_examples, persona_name)
+    patterns = await extract_patterns_async(evaluations, success_examples, failure_examples)
+    return {"success_examples": success_examples, "failure_examples": failure_examples, "patterns": patterns}
 
-Return a JSON object:
-{{
-    "success_patterns": [
-        {{
-            "pattern": "description of what works",
-            "trigger": "customer signal that should activate this",
-            "example_phrase": "actual words/approach to use"
-        }}
-    ],
-    "failure_patterns": [
-        {{
-            "pattern": "what to avoid",
-            "why_fails": "why this approach backfires"
-        }}
-    ],
-    "key_insight": "single most important insight for improvement"
-}}"""
 
-    try:
-        response = get_llm_response(pattern_prompt, max_tokens=600)
-        # Extract JSON
-        import re
-        json_match = re.search(r'\{.*\}', response, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
-    except Exception as e:
-        print(f"Pattern extraction failed: {e}")
-    
-    return {
-        "success_patterns": [],
-        "failure_patterns": [],
-        "key_insight": "Unable to extract patterns"
-    }
+def generate_mutation(current_prompt, persona_name, evaluations, scenario_names, analysis=None):
+    """Blocking wrapper around generate_mutation_async (not for use inside an event loop)"""
+    return run_sync(generate_mutation_async(current_prompt, persona_name, evaluations, scenario_names, analysis))
 
 
-def generate_mutation(current_prompt, persona_name, evaluations, scenario_names):
+async def generate_mutation_async(current_prompt, persona_name, evaluations, scenario_names, analysis=None):
     """
     Generate improved system prompt based on evaluation history across MULTIPLE scenarios.
     
@@ -99,6 +158,7 @@ def generate_mutation(current_prompt, persona_name, evaluations, scenario_names)
         persona_name: Name of persona (for vector search)
         evaluations: List of recent evaluations with scores/feedback
         scenario_names: List of scenario names tested (e.g., ["Angry Customer", "Evasive Customer"])
+        analysis: analyze_history_async() result shared by the cycle's mutations (computed here if None)
 
     Returns:
         dict with:
@@ -106,6 +166,33 @@ def generate_mutation(current_prompt, persona_name, evaluations, scenario_names)
             - metadata: Reasoning data (success/failure examples, feedback, scores, patterns)
             - reasoning_prompt: Full prompt sent to LLM
     """
+    avg_scores, overall_avg = average_scores(evaluations)
+
+    # NEW: Extract patterns from examples (chain-of-thought for evolution)
+    analysis = analysis or await analyze_history_async(persona_name, evaluations)
+    success_examples, failure_examples = analysis["success_examples"], analysis["failure_examples"]
+    patterns = analysis["patterns"]
+
+    # Aggregate feedback
+    all_feedback = [e.get('feedback', '') for e in evaluations if e.get('feedback')]
+
+    mutation_prompt = build_mutation_prompt(
+        current_prompt, persona_name, evaluations, scenario_names,
+        avg_scores, overall_avg, all_feedback, patterns
+    )
+
+    # Generate mutation
+    # Not cached: each call must produce a distinct variant for the same inputs
+    mutated_prompt = await get_llm_response_async(**mutation_prompt, max_tokens=800, use_cache=False, call_site=MUTATION)  # Increased for richer prompts
+
+    return package_mutation(
+        mutated_prompt, mutation_prompt, evaluations, scenario_names,
+        avg_scores, overall_avg, all_feedback, success_examples, failure_examples, patterns
+    )
+
+
+def average_scores(evaluations):
+    """Per-metric averages over evaluations, plus the overall average"""
     # Calculate average scores (now including adaptation_quality)
     avg_scores = {
         'goal_completion': sum(e.get('goal_completion', e.get('task_completion', 5)) for e in evaluations) / len(evaluations),
@@ -114,7 +201,11 @@ def generate_mutation(current_prompt, persona_name, evaluations, scenario_names)
         'adaptation_quality': sum(e.get('adaptation_quality', 5) for e in evaluations) / len(evaluations)
     }
     overall_avg = sum(avg_scores.values()) / len(avg_scores)
+    return avg_scores, overall_avg
+
 
+def find_examples(persona_name):
+    """Fetch formatted success (score >= 8) and failure (score < 5) examples from the vector store"""
     # Find successful examples from vector store (score >= 8)
     # Search broadly across ALL scenarios to find generalizable patterns
     try:
@@ -147,12 +238,12 @@ def generate_mutation(current_prompt, persona_name, evaluations, scenario_names)
         print(f"Error fetching failure examples: {e}")
         failure_examples = "No low-scoring examples found"
 
-    # Aggregate feedback
-    all_feedback = [e.get('feedback', '') for e in evaluations if e.get('feedback')]
-    
-    # NEW: Extract patterns from examples (chain-of-thought for evolution)
-    patterns = extract_patterns(evaluations, success_examples, failure_examples)
-    
+    return success_examples, failure_examples
+
+
+def build_mutation_prompt(current_prompt, persona_name, evaluations, scenario_names,
+                          avg_scores, overall_avg, all_feedback, patterns):
+    """Build the prompt (cacheable_prompt arguments) asking the LLM to rewrite the agent's system prompt"""
     # Format patterns for mutation prompt
     success_pattern_text = ""
     if patterns.get('success_patterns'):
@@ -168,8 +259,9 @@ def generate_mutation(current_prompt, persona_name, evaluations, scenario_names)
             for p in patterns['failure_patterns'][:3]
         ])
 
-    # Build mutation prompt with pattern-informed guidance
-    mutation_prompt = f"""You are evolving an AI agent's system prompt to improve performance across MULTIPLE scenarios.
+    # Build mutation prompt with pattern-informed guidance: static instructions first,
+    # then this cycle's data
+    return cacheable_prompt(MUTATION_SYSTEM, f"""AGENT: {persona_name}
 
 CURRENT PROMPT:
 {current_prompt}
@@ -194,25 +286,12 @@ PERFORMANCE DATA (last {len(evaluations)} simulations across these scenarios):
 {failure_pattern_text or 'No clear failure patterns found'}
 
 FEEDBACK FROM EVALUATIONS:
-{chr(10).join(f"- {fb}" for fb in all_feedback)}
+{chr(10).join(f"- {fb}" for fb in all_feedback)}""")
 
-TASK:
-Generate an improved system prompt that:
-1. Keeps the core personality of {persona_name}
-2. **EMBEDS the success patterns as explicit instructions**
-3. **INCLUDES warnings about failure patterns to avoid**
-4. Addresses the weaknesses shown in feedback
-5. **ADDS behavioral detection**: Agent should identify customer emotional state and adapt
-6. Maintains appropriate tone and role
-7. **CRITICAL: Must work well across ALL {len(scenario_names)} different scenarios/contexts**
-8. **Include ADAPTIVE STRATEGIES**: Different approaches for hostile, evasive, desperate, cooperative customers
-9. **Be ROBUST and GENERALIZABLE, not optimized for just one situation**
-
-Return ONLY the new system prompt, nothing else. No explanations or meta-commentary."""
-
-    # Generate mutation
-    mutated_prompt = get_llm_response(mutation_prompt, max_tokens=800)  # Increased for richer prompts
 
+def package_mutation(mutated_prompt, mutation_prompt, evaluations, scenario_names,
+                     avg_scores, overall_avg, all_feedback, success_examples, failure_examples, patterns):
+    """Bundle the mutated prompt with the reasoning metadata stored on MutationAttempt"""
     # Package metadata for visualization
     metadata = {
         'avg_scores': avg_scores,
@@ -228,5 +307,5 @@ Return ONLY the new system prompt, nothing else. No explanations or meta-comment
     return {
         'mutated_prompt': mutated_prompt.strip(),
         'metadata': metadata,
-        'reasoning_prompt': mutation_prompt
+        'reasoning_prompt': prompt_text(mutation_prompt)
     }
@@ -0,0 +1,284 @@
+"""
+Post-processing pipeline for finished simulation runs.
+
+Judging a transcript and embedding it in the vector store used to happen before a
+simulation returned. Now a run is returned as soon as its transcript is stored and
+submit() queues the rest: evaluation, then indexing, with at most
+PIPELINE_CONCURRENCY judge requests or index writes at a time. Each stage's status
+is saved on the run (evaluation_status, index_status) and pushed to its live
+watchers; callers that need the scores (evolution) await them with wait().
+
+Transcripts waiting to be judged are collected for up to JUDGE_PACK_WAIT seconds and
+judged together (see evaluate_conversations_async). Runs submitted inside deferred()
+wait for an explicit wait() instead, so a whole evolution round shares judge calls.
+"""
+import os
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from database import SessionLocal
+import models
+import schemas
+from services import live
+from services.evaluation import evaluate_conversations_async, overall_score, judge_variance, JUDGE_PACK_MAX_TRANSCRIPTS
+from services.turn_evaluation import finalize as finalize_turn_evaluation
+from services.vector_store import add_conversation
+from services.llm_log import call_context
+
+PIPELINE_CONCURRENCY = int(os.getenv("PIPELINE_CONCURRENCY", "4"))  # judge requests / index writes at once
+JUDGE_PACK_WAIT = float(os.getenv("JUDGE_PACK_WAIT", "2"))  # seconds a transcript waits for others to share its judge call
+
+# Statuses for evaluation_status / index_status
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+SKIPPED = "skipped"  # Indexing only: nothing to index without an evaluation
+
+# run id -> Future resolved once the run has been processed
+_pending = {}
+_tasks = set()
+_semaphore = None
+
+# Transcripts waiting for a judge call: (run id, item, future)
+_judge_queue = []
+_judge_timer = None
+_waiting = set()  # run ids someone is blocked on in wait()
+
+# Set by deferred(): judging waits for wait() rather than the JUDGE_PACK_WAIT timer
+_deferred = contextvars.ContextVar("pipeline_deferred", default=False)
+
+
+@contextmanager
+def deferred():
+    """
+    Hold the judging of runs submitted in this block until wait() is called for them,
+    so they are packed into as few judge calls as possible. Restores by value, like
+    llm_log.call_context.
+    """
+    previous = _deferred.get()
+    _deferred.set(True)
+    try:
+        yield
+    finally:
+        _deferred.set(previous)
+
+
+def submit(run_id):
+    """Queue a stored run for evaluation and indexing (call from the event loop)"""
+    if run_id not in _pending:
+        _pending[run_id] = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(_process(run_id))
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+    return _pending[run_id]
+
+
+async def wait(run_ids):
+    """Wait until these runs have been evaluated and indexed (returns at once for runs not queued)"""
+    futures = [_pending[run_id] for run_id in run_ids if run_id in _pending]
+    if not futures:
+        return
+    waiting = set(run_ids) - _waiting
+    _waiting.update(waiting)
+    try:
+        # Let just-submitted runs reach the judge queue, then judge everything queued now
+        await asyncio.sleep(0)
+        _flush_judge_queue()
+        await asyncio.gather(*[asyncio.shield(future) for future in futures])
+    finally:
+        _waiting.difference_update(waiting)
+
+
+def requeue_unfinished():
+    """Re-queue runs whose post-processing was interrupted by a restart (called on startup)"""
+    db = SessionLocal()
+    try:
+        run_ids = [run_id for (run_id,) in db.query(models.SimulationRun.id).filter(
+            models.SimulationRun.status == "completed",
+            (models.SimulationRun.evaluation_status.in_([PENDING, RUNNING])) |
+            (models.SimulationRun.index_status.in_([PENDING, RUNNING]))
+        ).all()]
+    finally:
+        db.close()
+
+    for run_id in run_ids:
+        submit(run_id)
+    if run_ids:
+        print(f"Re-queued post-processing for {len(run_ids)} runs")
+
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(PIPELINE_CONCURRENCY)
+    return _semaphore
+
+
+async def _process(run_id):
+    try:
+        db = SessionLocal()
+        try:
+            run = db.query(models.SimulationRun).filter(models.SimulationRun.id == run_id).first()
+            with call_context(run_id=run.id, persona_id=run.scenario.persona_a_id):
+                await _evaluate(run, db)
+            await _index(run, db)
+            event = {"type": "completed", "run": schemas.SimulationRun.model_validate(run).model_dump(mode="json")}
+            if run.evaluation_status == FAILED:
+                event["error"] = run.postprocess_error
+            live.publish(run_id, event)
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"Post-processing run {run_id} failed: {type(e).__name__}: {e}")
+        live.publish(run_id, {"type": "failed", "run_id": run_id, "error": f"Post-processing failed: {e}"})
+    finally:
+        _pending.pop(run_id).set_result(None)
+
+
+async def _evaluate(run, db):
+    if run.evaluation and not run.evaluation.scores.get("judge_failed"):
+        # Already judged (re-queued after only the indexing failed)
+        run.evaluation_status = COMPLETED
+        db.commit()
+        return
+    if run.evaluation:
+        # Neutral placeholder scores from a failed judge: judge again
+        db.delete(run.evaluation)
+        db.commit()
+        db.refresh(run)
+
+    run.evaluation_status = RUNNING
+    db.commit()
+    print(f"\n=== Evaluating Simulation {run.id} ===")
+    try:
+        scores = await _judge(run)
+        if not scores:
+            raise ValueError("the judge returned no scores")
+    except Exception as e:
+        print(f"Evaluation of run {run.id} failed: {e}")
+        run.evaluation_status = FAILED
+        run.postprocess_error = f"Evaluation failed: {e}"
+        db.commit()
+        live.publish(run.id, {"type": "evaluation_failed", "error": str(e)})
+        return
+
+    # Calculate overall score (average of 4 metrics - now includes adaptation_quality)
+    overall = overall_score(scores)
+    variance, judges = judge_variance(scores)
+
+    db.add(models.Evaluation(
+        run_id=run.id,
+        scores=scores,
+        overall_score=overall,
+        feedback=scores.get("feedback", ""),
+        score_variance=variance,
+        judge_count=judges
+    ))
+    if scores.get("judge_failed"):
+        # The neutral scores are stored so evolution can proceed, but the run is marked
+        # failed (and not indexed) so it can be told apart and retried with /resume
+        run.evaluation_status = FAILED
+        run.postprocess_error = f"Evaluation failed: {scores.get('feedback')}"
+        db.commit()
+        db.refresh(run)
+        print(f"Evaluation of run {run.id} failed, stored neutral scores: {scores.get('feedback')}")
+        live.publish(run.id, {"type": "evaluation_failed", "error": scores.get("feedback"), "scores": scores})
+        return
+
+    run.evaluation_status = COMPLETED
+    db.commit()
+    db.refresh(run)
+    print(f"Evaluation complete - Overall: {overall:.1f}/10 (adaptation: {scores.get('adaptation_quality', 'N/A')}/10)")
+    live.publish(run.id, {"type": "evaluation", "overall_score": overall, "scores": scores})
+
+
+async def _index(run, db):
+    evaluation = run.evaluation
+    if not evaluation or evaluation.scores.get("judge_failed"):
+        run.index_status = SKIPPED
+        db.commit()
+        return
+
+    run.index_status = RUNNING
+    db.commit()
+    scenario = run.scenario
+    try:
+        # Add to vector store for future search
+        async with _get_semaphore():
+            await asyncio.to_thread(
+                add_conversation,
+                run_id=run.id,
+                transcript=run.full_transcript,
+                metadata={
+                    "persona_a": scenario.persona_a.name,
+                    "persona_b": scenario.persona_b.name,
+                    "scenario": scenario.name,
+                    "overall_score": evaluation.overall_score,
+                    "goal_completion": evaluation.scores["goal_completion"],
+                    "conversational_quality": evaluation.scores["conversational_quality"],
+                    "compliance": evaluation.scores["compliance"]
+                }
+            )
+    except Exception as e:
+        print(f"Indexing run {run.id} failed: {e}")
+        run.index_status = FAILED
+        run.postprocess_error = f"Indexing failed: {e}"
+        db.commit()
+        return
+
+    run.index_status = COMPLETED
+    db.commit()
+    live.publish(run.id, {"type": "indexed", "run_id": run.id})
+
+
+async def _judge(run):
+    """
+    Merge the windows judged during the conversation (judging only the turns after the
+    last one), or queue the run's transcript for the next packed judge call and wait for its scores
+    """
+    global _judge_timer
+    scores = await finalize_turn_evaluation(run.full_transcript, run.scenario.goal or "Complete conversation",
+                                            run.turn_evaluation)
+    if scores:
+        return scores
+
+    future = asyncio.get_running_loop().create_future()
+    _judge_queue.append((run.id, {
+        "transcript": run.full_transcript,
+        "goal": run.scenario.goal or "Complete conversation",
+        "run_id": run.id
+    }, future))
+
+    if run.id in _waiting or len(_judge_queue) >= JUDGE_PACK_MAX_TRANSCRIPTS:
+        _flush_judge_queue()
+    elif _judge_timer is None and not _deferred.get():
+        _judge_timer = asyncio.get_running_loop().call_later(JUDGE_PACK_WAIT, _flush_judge_queue)
+    return await future
+
+
+def _flush_judge_queue():
+    global _judge_timer
+    if _judge_timer is not None:
+        _judge_timer.cancel()
+        _judge_timer = None
+    if not _judge_queue:
+        return
+    entries = list(_judge_queue)
+    _judge_queue.clear()
+    task = asyncio.create_task(_judge_entries(entries))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+async def _judge_entries(entries):
+    print(f"Judging {len(entries)} transcripts (runs {[run_id for run_id, _, _ in entries]})")
+    try:
+        async with _get_semaphore():
+            results = await evaluate_conversations_async([item for _, item, _ in entries])
+    except Exception as e:
+        for _, _, future in entries:
+            future.set_exception(e)
+        return
+    for (_, _, future), scores in zip(entries, results):
+        future.set_result(scores)
@@ -0,0 +1,178 @@
+"""
+Local heuristic pre-scoring of transcripts.
+
+Many conversations are obviously good or bad before any LLM reads them: the agent
+threatened the customer, repeated itself word for word, the customer side is empty
+or cut off, or the customer committed to a dated payment. prescore() runs those
+deterministic checks first and returns partial metric estimates with a confidence
+for each. Metrics at PRESCORE_CONFIDENCE or above are fixed and the judge is told
+so (or skipped entirely when all four are fixed). Only the near-certain rules reach
+the default threshold; check the rest with scripts/benchmark_prescore.py before
+lowering it.
+"""
+import os
+import re
+from difflib import SequenceMatcher
+from services.termination import REFUSAL_PHRASES, is_commitment, is_hang_up
+
+PRESCORE_ENABLED = os.getenv("PRESCORE_ENABLED", "true").lower() == "true"
+PRESCORE_CONFIDENCE = float(os.getenv("PRESCORE_CONFIDENCE", "0.95"))  # estimates at or above this replace the judge's
+PRESCORE_VERSION = 2  # Bump when the rules change (invalidates cached judge scores)
+REPEAT_SIMILARITY = 0.9  # agent line this similar to an earlier one counts as a verbatim repeat
+MIN_CUSTOMER_TURNS = 2  # fewer and the conversation is treated as truncated
+
+# Threats, harassment and abuse by the agent (English, Hindi and romanized Hindi)
+VIOLATION_PATTERNS = [
+    ("threat of arrest or jail", re.compile(
+        r"\b(you('ll| will| could| can) (be )?(arrested|go to (jail|prison))|we('ll| will) (have you )?arrest"
+        r"|(put|send|throw) you (in|to) (jail|prison)|call(ing)? the police|send (the )?police)"
+        r"|(जेल (भेज|हो|जा)|पुलिस (भेज|बुला)|गिरफ्तार|jail (bhej|ho ja|jaoge)|police (bhej|bula)|giraftar)"
+    )),
+    ("threat to seize property or wages", re.compile(
+        r"\b(garnish (your )?wages|seize your|take (away )?your (house|home|car|salary)|repossess your)"
+        r"|(घर (ज़ब्त|जब्त)|सामान उठा|ghar (zabt|jabt)|saman utha)"
+    )),
+    # "We'll tell your employer" is a threat, "you can contact your family for help" is not
+    ("threat to tell third parties", re.compile(
+        r"\b(we('ll| will| are going to| have to)|i('ll| will| am going to| have to)|i'm going to)"
+        r" (have to )?(tell|inform|call|contact) (your )?(employer|boss|family|wife|husband|neighbou?rs|relatives|colleagues)"
+        r"|(घरवालों को बता|ऑफिस में बता|gharwalon ko bata|office (mein|me) bata)"
+    )),
+    ("abusive language", re.compile(
+        r"\b(you('re| are) (a |such a )?(liar|thief|deadbeat|idiot|loser|stupid|pathetic)|shut up|shame on you)\b"
+        r"|(चोर|बेवकूफ|शर्म (नहीं|करो)|\bchor\b|bewa?koof|sharam (nahi|karo))"
+    )),
+]
+# "We won't call the police" is not a threat
+NEGATION = re.compile(r"\b(not|won't|will not|never|don't|do not|no one|nobody|नहीं|nahi)\b[^.!?]{0,25}$")
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", text.lower())).strip()
+
+
+def _is_repeat(text, previous):
+    return any(text == earlier or SequenceMatcher(None, text, earlier).ratio() >= REPEAT_SIMILARITY
+               for earlier in previous)
+
+
+def find_violations(text):
+    """Names of the compliance rules an agent line breaks"""
+    lowered = text.lower()
+    found = []
+    for name, pattern in VIOLATION_PATTERNS:
+        for match in pattern.finditer(lowered):
+            if not NEGATION.search(lowered[:match.start()]):
+                found.append(name)
+                break
+    return found
+
+
+def analyze(transcript):
+    """The raw signals the estimates are based on"""
+    agent_lines = [turn.get("text", "") for turn in transcript if turn.get("agent") == "A"]
+    customer_lines = [turn.get("text", "") for turn in transcript if turn.get("agent") == "B"]
+
+    normalized, repeats = [], 0
+    for line in agent_lines:
+        text = _normalize(line)
+        if text and _is_repeat(text, normalized):
+            repeats += 1
+        normalized.append(text)
+
+    violations = []
+    for index, turn in enumerate(transcript):
+        if turn.get("agent") == "A":
+            violations += [(index, name) for name in find_violations(turn.get("text", ""))]
+
+    # The customer's last word on payment: a dated commitment, a refusal or hanging up
+    outcome = None
+    for line in customer_lines:
+        lowered = line.lower()
+        if is_commitment(lowered):
+            outcome = "commitment"
+        elif REFUSAL_PHRASES.search(lowered):
+            outcome = "refusal"
+        elif is_hang_up(lowered) and outcome != "commitment":
+            outcome = "refusal"  # Hung up without committing (a goodbye after a commitment is fine)
+
+    return {
+        "agent_turns": len(agent_lines),
+        "customer_turns": sum(1 for line in customer_lines if line.strip()),
+        "repetition_ratio": round(repeats / len(agent_lines), 2) if agent_lines else 0.0,
+        "violations": violations,
+        "outcome": outcome,
+    }
+
+
+def prescore(transcript):
+    """
+    Partial metric estimates for a transcript.
+    Returns {"estimates": {metric: score}, "confidence": {metric: 0-1}, "reasons": {metric: str},
+    "signals": analyze(transcript)}. Metrics with no strong signal are left out.
+    """
+    signals = analyze(transcript)
+    estimates, confidence, reasons = {}, {}, {}
+
+    def estimate(metric, score, certainty, reason):
+        # The strongest signal wins when several apply
+        if certainty > confidence.get(metric, 0):
+            estimates[metric], confidence[metric], reasons[metric] = score, certainty, reason
+
+    violations = signals["violations"]
+    if len(violations) >= 2:
+        estimate("compliance", 1, 0.95, f"{len(violations)} violations: {', '.join(sorted({n for _, n in violations}))}")
+    elif violations:
+        estimate("compliance", 3, 0.7, f"{violations[0][1]} in turn {violations[0][0] + 1}")
+
+    repetition = signals["repetition_ratio"]
+    if signals["agent_turns"] >= 3 and repetition >= 0.5:
+        estimate("conversational_quality", 2, 0.9, f"{repetition:.0%} of agent lines repeat earlier ones")
+        estimate("adaptation_quality", 2, 0.85, "agent repeats the same lines regardless of the customer")
+    elif signals["agent_turns"] >= 3 and repetition >= 0.3:
+        estimate("conversational_quality", 4, 0.6, f"{repetition:.0%} of agent lines repeat earlier ones")
+
+    if signals["outcome"] == "commitment":
+        estimate("goal_completion", 9, 0.7, "customer committed to a dated or specific payment")
+    elif signals["outcome"] == "refusal":
+        estimate("goal_completion", 2, 0.75, "customer refused or hung up without committing")
+
+    if signals["customer_turns"] < MIN_CUSTOMER_TURNS and signals["outcome"] != "commitment":
+        # Empty or truncated customer side: nothing was achieved or adapted to
+        # (a call that ended early on a quick commitment is not truncated)
+        estimate("goal_completion", 1, 0.95, "customer side empty or truncated")
+        estimate("adaptation_quality", 1, 0.8, "no customer replies to adapt to")
+        estimate("conversational_quality", 2, 0.7, "conversation cut off")
+        if not violations:
+            estimate("compliance", 8, 0.6, "no violations in the turns that exist")
+
+    return {"estimates": estimates, "confidence": confidence, "reasons": reasons, "signals": signals}
+
+
+def fixed_metrics(result, threshold=None):
+    """The estimates confident enough to stand in for the judge's: {metric: (score, reason)}"""
+    threshold = PRESCORE_CONFIDENCE if threshold is None else threshold
+    return {
+        metric: (score, result["reasons"][metric])
+        for metric, score in result["estimates"].items()
+        if result["confidence"][metric] >= threshold
+    }
+
+
+def local_scores(result, metrics):
+    """
+    Full judge-format scores from the estimates alone, when every metric is fixed.
+    Marked with "source": "prescore" so benchmarks can tell them apart.
+    """
+    fixed = fixed_metrics(result)
+    violations = result["signals"]["violations"]
+    return {
+        **{metric: fixed[metric][0] for metric in metrics},
+        "feedback": "Scored by local checks: " + "; ".join(f"{metric}: {fixed[metric][1]}" for metric in metrics),
+        "structured_issues": {
+            "compliance_issues": ", ".join(f"turn {index + 1}: {name}" for index, name in violations) or None,
+            "adaptation_moments": fixed.get("adaptation_quality", (None, None))[1],
+            "closing": fixed.get("goal_completion", (None, None))[1],
+        },
+        "source": "prescore",
+    }
@@ -0,0 +1,266 @@
+"""
+Per-provider rate scheduling for LLM calls.
+
+Each provider gets a token-bucket limiter with a requests-per-minute and a
+tokens-per-minute budget. Budgets are tightened from the provider's
+x-ratelimit-* headers, 429s pause the whole provider with jittered
+exponential backoff, and batch work yields to interactive callers.
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+import groq
+import openai
+import cerebras.cloud.sdk as cerebras_sdk
+
+# Priorities: lower value is served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+# Priority for LLM calls made in the current context (set by evolution / batch jobs)
+current_priority = contextvars.ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+# Default budgets per provider (override with LLM_RPM_<PROVIDER> / LLM_TPM_<PROVIDER>, 0 = unlimited)
+DEFAULT_LIMITS = {
+    "groq": {"rpm": 30, "tpm": 12000},
+    "cerebras": {"rpm": 30, "tpm": 60000},
+    "nvidia": {"rpm": 40, "tpm": 0},
+    "stub": {"rpm": 0, "tpm": 0},
+}
+
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))  # seconds
+BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60.0"))
+BATCH_YIELD_DELAY = 0.05  # how long batch callers wait while interactive callers are queued
+
+CONNECTION_ERRORS = (openai.APIConnectionError, groq.APIConnectionError, cerebras_sdk.APIConnectionError)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+@contextmanager
+def batch_priority():
+    """Run LLM calls in this block at batch priority (yield to interactive calls)"""
+    token = current_priority.set(PRIORITY_BATCH)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def estimate_prompt_tokens(messages):
+    """Rough token count for chat messages (~4 chars per token)"""
+    return sum(len(m.get("content") or "") for m in messages) // 4
+
+
+def estimate_tokens(params):
+    """Rough token estimate for a request: the prompt plus the completion budget"""
+    return estimate_prompt_tokens(params.get("messages", [])) + (params.get("max_tokens") or 512)
+
+
+def _parse_duration(value):
+    """Parse rate-limit reset values like '1.5', '2s', '1m30s' or '250ms' into seconds"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    total, number = 0.0, ""
+    i = 0
+    while i < len(value):
+        ch = value[i]
+        if ch.isdigit() or ch == ".":
+            number += ch
+        elif value.startswith("ms", i):
+            total += float(number or 0) / 1000
+            number = ""
+            i += 1
+        elif ch in "hms":
+            total += float(number or 0) * {"h": 3600, "m": 60, "s": 1}[ch]
+            number = ""
+        else:
+            return None
+        i += 1
+    return total
+
+
+class RateLimiter:
+    """Token buckets (requests and tokens per minute) for a single provider"""
+
+    def __init__(self, provider, rpm, tpm):
+        self.provider = provider
+        self.rpm = rpm
+        self.tpm = tpm
+        self.lock = threading.Lock()
+        self.request_budget = float(rpm)
+        self.token_budget = float(tpm)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.consecutive_429s = 0
+        self.waiting = {PRIORITY_INTERACTIVE: 0, PRIORITY_BATCH: 0}
+        self.stats = {"requests": 0, "rate_limited": 0, "retries": 0, "wait_seconds": 0.0}
+
+    def _refill(self, now):
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        if self.rpm:
+            self.request_budget = min(self.rpm, self.request_budget + elapsed * self.rpm / 60)
+        if self.tpm:
+            self.token_budget = min(self.tpm, self.token_budget + elapsed * self.tpm / 60)
+
+    def _try_acquire(self, tokens, priority):
+        """Take budget for one request; returns 0 on success or seconds to wait"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if priority > PRIORITY_INTERACTIVE and self.waiting[PRIORITY_INTERACTIVE] > 0:
+                return BATCH_YIELD_DELAY
+
+            tokens = min(tokens, self.tpm) if self.tpm else tokens
+            wait = 0.0
+            if self.rpm and self.request_budget < 1:
+                wait = max(wait, (1 - self.request_budget) * 60 / self.rpm)
+            if self.tpm and self.token_budget < tokens:
+                wait = max(wait, (tokens - self.token_budget) * 60 / self.tpm)
+            if wait > 0:
+                return wait
+
+            if self.rpm:
+                self.request_budget -= 1
+            if self.tpm:
+                self.token_budget -= tokens
+            self.stats["requests"] += 1
+            return 0
+
+    def acquire(self, tokens, priority=None):
+        """Block until budget is available (sync callers)"""
+        priority = current_priority.get() if priority is None else priority
+        with self.lock:
+            self.waiting[priority] += 1
+        try:
+            while True:
+                wait = self._try_acquire(tokens, priority)
+                if not wait:
+                    return
+                self.stats["wait_seconds"] += wait
+                time.sleep(wait)
+        finally:
+            with self.lock:
+                self.waiting[priority] -= 1
+
+    async def acquire_async(self, tokens, priority=None):
+        """Wait until budget is available without blocking the event loop"""
+        priority = current_priority.get() if priority is None else priority
+        with self.lock:
+            self.waiting[priority] += 1
+        try:
+            while True:
+                wait = self._try_acquire(tokens, priority)
+                if not wait:
+                    return
+                self.stats["wait_seconds"] += wait
+                await asyncio.sleep(wait)
+        finally:
+            with self.lock:
+                self.waiting[priority] -= 1
+
+    def update_from_headers(self, headers):
+        """Clamp budgets to what the provider says is left in the current window"""
+        if headers is None:
+            return
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        with self.lock:
+            try:
+                if remaining_requests is not None and self.rpm:
+                    self.request_budget = min(self.request_budget, float(remaining_requests))
+                if remaining_tokens is not None and self.tpm:
+                    self.token_budget = min(self.token_budget, float(remaining_tokens))
+            except ValueError:
+                pass
+
+    def record_success(self, estimated_tokens, actual_tokens=None):
+        """Settle the token estimate against real usage and relax the backoff"""
+        with self.lock:
+            if self.tpm and actual_tokens is not None:
+                self.token_budget = min(self.tpm, self.token_budget + min(estimated_tokens, self.tpm) - actual_tokens)
+            self.consecutive_429s = max(0, self.consecutive_429s - 1)
+
+    def _backoff(self, attempt):
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.5)
+
+    def on_error(self, error, attempt):
+        """
+        Decide whether a failed call should be retried.
+        Returns the seconds to wait before retrying, or None if the error is not retryable.
+        """
+        status = getattr(error, "status_code", None)
+
+        if status == 429:
+            response = getattr(error, "response", None)
+            headers = response.headers if response is not None else {}
+            retry_after = _parse_duration(headers.get("retry-after")) or \
+                _parse_duration(headers.get("x-ratelimit-reset-requests")) or 0
+            with self.lock:
+                self.consecutive_429s += 1
+                delay = max(retry_after, self._backoff(self.consecutive_429s - 1))
+                # Pause every caller of this provider, not just this one
+                self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+                self.request_budget = 0
+                self.stats["rate_limited"] += 1
+                self.stats["retries"] += 1
+            return delay
+
+        if (status is not None and status >= 500) or isinstance(error, CONNECTION_ERRORS):
+            self.stats["retries"] += 1
+            return self._backoff(attempt)
+
+        return None
+
+    def get_stats(self):
+        with self.lock:
+            self._refill(time.monotonic())
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "request_budget": round(self.request_budget, 2),
+                "token_budget": round(self.token_budget, 2),
+                "blocked_for": max(0.0, round(self.blocked_until - time.monotonic(), 2)),
+                "waiting_interactive": self.waiting[PRIORITY_INTERACTIVE],
+                "waiting_batch": self.waiting[PRIORITY_BATCH],
+                **self.stats,
+            }
+
+
+def get_rate_limiter(provider):
+    """Get the process-wide limiter for a provider"""
+    limiter = _limiters.get(provider)
+    if limiter is not None:
+        return limiter
+
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            defaults = DEFAULT_LIMITS.get(provider, {"rpm": 0, "tpm": 0})
+            rpm = int(os.getenv(f"LLM_RPM_{provider.upper()}", defaults["rpm"]))
+            tpm = int(os.getenv(f"LLM_TPM_{provider.upper()}", defaults["tpm"]))
+            limiter = RateLimiter(provider, rpm, tpm)
+            _limiters[provider] = limiter
+    return limiter
+
+
+def get_all_stats():
+    """Stats for every limiter created so far"""
+    return {provider: limiter.get_stats() for provider, limiter in list(_limiters.items())}
@@ -0,0 +1,208 @@
+"""
+Early conversation termination.
+
+A simulation used to run all scenario.max_turns rounds even after the customer had
+agreed to pay or hung up. TerminationDetector watches each reply and ends the call
+once it reaches a terminal state: cheap local heuristics first, then (optionally)
+a small LLM check for replies the heuristics only half recognise.
+"""
+import os
+import re
+from difflib import SequenceMatcher
+from services.llm import get_llm_response_async
+from services.llm_log import TERMINATION_CHECK
+
+TERMINATION_ENABLED = os.getenv("TERMINATION_ENABLED", "true").lower() == "true"
+TERMINATION_LLM_CHECK = os.getenv("TERMINATION_LLM_CHECK", "false").lower() == "true"
+TERMINATION_MIN_ROUNDS = int(os.getenv("TERMINATION_MIN_ROUNDS", "3"))  # before refusal/looping can end a call
+TERMINATION_REFUSAL_TURNS = 3  # consecutive customer refusals that end the call
+LOOP_SIMILARITY = 0.85  # reply this similar to an earlier one by the same speaker counts as a repeat
+LOOP_ROUNDS = 2  # consecutive rounds where both speakers repeat themselves
+
+# Stop reasons (stored on SimulationRun.stop_reason)
+COMMITMENT = "commitment"
+REFUSAL = "refusal"
+HANG_UP = "hang_up"
+LOOP = "loop"
+MAX_TURNS = "max_turns"
+
+COMMITMENT_PHRASES = re.compile(
+    r"\b(i('ll| will| can| could)( \w+ly)? (pay|make|send|transfer|set (it |that )?up|do)|i('m| am) (going to|gonna) pay"
+    r"|(sounds|that's|that is|it's) (good|fine|okay|ok|a deal|doable)|\bagreed|i agree"
+    r"|let's (do|go with) (that|it)|i accept|works for me)"
+    r"|(pay kar (dunga|dungi|denge)|de (dunga|dungi)|theek hai|ठीक है|भुगतान कर (दूंगा|दूंगी)|कर दूंगा|दे दूंगा)"
+)
+# A commitment is concrete when a date sits near a payment verb or amount, or an amount near a payment verb
+# ("it's okay, I'll think about it next week" is not one)
+COMMITMENT_DATES = re.compile(
+    r"(\b(today|tonight|tomorrow|monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b"
+    r"|\bnext (week|month)\b|\bend of (the |this )?(week|month)\b|\b\d{1,2}(st|nd|rd|th)\b"
+    r"|\bpayday\b|\bkal\b|कल|तारीख)"
+)
+PAYMENT_AMOUNTS = re.compile(r"(\$\s?\d|\b(dollars|bucks|rupees)\b|₹\s?\d|\brs\.?\s?\d|रुपये|\b\d[\d,]*\b(?!(st|nd|rd|th)\b))")
+PAYMENT_VERBS = re.compile(
+    r"(\b(pay|paying|payment|installments?|instalments?|transfer|emi)\b|\bsend (you |the )?(money|it)\b"
+    r"|\bset (it |that )?up\b|pay kar|\bde (dunga|dungi|denge)\b|paise|भुगतान|दे दूंगा|पैसे)"
+)
+SPECIFICS_DISTANCE = 40  # characters between a date or amount and the payment verb it belongs to
+REFUSAL_PHRASES = re.compile(
+    r"\b(i('m| am) not (going to |gonna )?pay|i won't pay|i will not pay|not paying|never pay"
+    r"|i refuse|no way\b|talk to my lawyer|see you in court|leave me alone)"
+    r"|(nahi (dunga|dungi|karunga)|नहीं दूंगा|नहीं दूंगी)"
+)
+HANG_UP_PHRASES = re.compile(
+    r"(\b(hang(s|ing)? up|hung up|goodbye|bye\b|stop calling|don't call (me )?again|call ended)"
+    r"|\*\s*click\s*\*|\[(call ends|hangs up|click)\]|alvida|अलविदा)"
+)
+# "Please don't hang up", "before I hang up" do not end a call
+HANG_UP_NEGATION = re.compile(r"\b(don't|do not|not|never|won't|will not|before (you|i))\b[^.!?]{0,15}$")
+
+
+def _near(text, first, second):
+    """Whether a match of first lies within SPECIFICS_DISTANCE characters of a match of second"""
+    for match in first.finditer(text):
+        window = text[max(0, match.start() - SPECIFICS_DISTANCE):match.end() + SPECIFICS_DISTANCE]
+        if second.search(window):
+            return True
+    return False
+
+
+def is_concrete(text):
+    """A date or amount tied to a payment: "I'll pay tomorrow", "I can do $200 on Friday" """
+    lowered = text.lower()
+    return _near(lowered, COMMITMENT_DATES, PAYMENT_VERBS) or _near(lowered, COMMITMENT_DATES, PAYMENT_AMOUNTS) \
+        or _near(lowered, PAYMENT_AMOUNTS, PAYMENT_VERBS)
+
+
+def is_commitment(text):
+    """A customer line agreeing to a concrete payment"""
+    lowered = text.lower()
+    return bool(COMMITMENT_PHRASES.search(lowered)) and not REFUSAL_PHRASES.search(lowered) and is_concrete(lowered)
+
+
+def is_hang_up(text):
+    """A customer line ending the call (negated phrases like "don't hang up" are ignored)"""
+    lowered = text.lower()
+    return any(not HANG_UP_NEGATION.search(lowered[:match.start()]) for match in HANG_UP_PHRASES.finditer(lowered))
+
+
+CHECK_INSTRUCTION = """You monitor a debt collection phone call between an Agent and a Customer.
+Decide whether the call has reached an end state. Reply with exactly one word:
+COMMITMENT - the customer has agreed to a specific payment or payment plan
+REFUSAL - the customer has definitively refused to pay and will not engage further
+HANG_UP - the customer has ended the call
+CONTINUE - anything else"""
+CHECK_ANSWERS = {"COMMITMENT": COMMITMENT, "REFUSAL": REFUSAL, "HANG_UP": HANG_UP}
+CHECK_CONTEXT_TURNS = 4
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s$₹]", " ", text.lower())).strip()
+
+
+def _is_repeat(text, previous):
+    return any(SequenceMatcher(None, text, earlier).ratio() >= LOOP_SIMILARITY for earlier in previous)
+
+
+class TerminationDetector:
+    """
+    Watches a conversation between an agent (A) and a customer (B), one reply at a time.
+    observe() returns a stop reason once the call should end, else None. After a
+    customer commitment the agent still gets one closing turn to confirm it.
+    """
+
+    def __init__(self, llm_check=TERMINATION_LLM_CHECK, min_rounds=TERMINATION_MIN_ROUNDS):
+        self.llm_check = llm_check
+        self.min_rounds = min_rounds
+        self.turns = []  # (agent, text)
+        self.replies = {"A": [], "B": []}  # normalized, for loop detection
+        self.pending = None  # reason waiting on the agent's closing turn
+        self.refusals = 0
+        self.loop_rounds = 0
+        self.repeated = False
+        self.llm_checks = 0
+
+    async def observe(self, agent, text):
+        """Record one reply; return the stop reason if the call should end after it"""
+        self.turns.append((agent, text))
+        normalized = _normalize(text)
+        rounds = (len(self.turns) + 1) // 2
+
+        repeat = _is_repeat(normalized, self.replies[agent])
+        self.replies[agent].append(normalized)
+
+        if self.pending:
+            return self.pending
+
+        if agent == "A":
+            self.repeated = repeat
+            return None
+
+        # Customer reply: hang-up, commitment, refusal, then looping
+        lowered = text.lower()
+        if is_hang_up(lowered):
+            return COMMITMENT if self._committed() else HANG_UP
+
+        if COMMITMENT_PHRASES.search(lowered) and not REFUSAL_PHRASES.search(lowered):
+            if is_concrete(lowered):
+                self.pending = COMMITMENT
+                return None
+            return await self._confirm(COMMITMENT)
+
+        if REFUSAL_PHRASES.search(lowered):
+            self.refusals += 1
+            if self.refusals >= TERMINATION_REFUSAL_TURNS and rounds >= self.min_rounds:
+                return REFUSAL
+            return await self._confirm(REFUSAL) if rounds >= self.min_rounds else None
+        self.refusals = 0
+
+        self.loop_rounds = self.loop_rounds + 1 if repeat and self.repeated else 0
+        if self.loop_rounds >= LOOP_ROUNDS and rounds >= self.min_rounds:
+            return LOOP
+        return None
+
+    async def restore(self, turns):
+        """
+        Replay the turns of a resumed conversation (heuristics only, no LLM calls).
+        Returns the stop reason if the conversation had already ended.
+        """
+        llm_check, self.llm_check = self.llm_check, False
+        try:
+            for agent, text in turns:
+                reason = await self.observe(agent, text)
+                if reason:
+                    return reason
+            return None
+        finally:
+            self.llm_check = llm_check
+
+    def _committed(self):
+        return any(agent == "B" and is_commitment(text) for agent, text in self.turns)
+
+    async def _confirm(self, suspected):
+        """
+        Ask the LLM about a reply the heuristics only half recognise (a commitment with no
+        amount or date, an isolated refusal). A confirmed commitment still gets a closing turn.
+        """
+        if not self.llm_check:
+            return None
+        self.llm_checks += 1
+        lines = "\n".join(
+            f"{'Agent' if agent == 'A' else 'Customer'}: {text}" for agent, text in self.turns[-CHECK_CONTEXT_TURNS:]
+        )
+        try:
+            answer = await get_llm_response_async(
+                CHECK_INSTRUCTION,
+                [{"role": "user", "content": f"Latest turns:\n{lines}\n\nEnd state?"}],
+                max_tokens=5,
+                call_site=TERMINATION_CHECK
+            )
+        except Exception as e:
+            print(f"Termination check failed ({suspected} suspected), continuing: {e}")
+            return None
+
+        reason = CHECK_ANSWERS.get(re.sub(r"[^A-Z_]", "", answer.upper().replace(" ", "_")))
+        if reason == COMMITMENT:
+            self.pending = COMMITMENT
+            return None
+        return reason
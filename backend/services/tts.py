@@ -1,11 +1,19 @@
 import os
 import uuid
+import threading
 import requests
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
 
+TTS_TIMEOUT = float(os.getenv("TTS_TIMEOUT", "30"))  # seconds per Deepgram request
+TTS_MAX_WORKERS = int(os.getenv("TTS_MAX_WORKERS", "4"))  # concurrent TTS requests (process-wide)
+
+_executor = None
+_executor_lock = threading.Lock()
+
 
 def text_to_speech(text, voice_id=None):
     """
@@ -40,7 +48,8 @@ def text_to_speech(text, voice_id=None):
                 "Content-Type": "application/json"
             },
             params={"model": voice},
-            json={"text": text}
+            json={"text": text},
+            timeout=TTS_TIMEOUT
         )
 
         # Check response
@@ -57,3 +66,39 @@ def text_to_speech(text, voice_id=None):
     except Exception as e:
         print(f"TTS failed: {e}")
         return None  # Continue simulation without audio
+
+
+def submit_speech(text, voice_id=None):
+    """
+    Queue text_to_speech on the shared bounded TTS worker pool.
+    Returns a concurrent.futures.Future for the audio path (None if TTS failed).
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=TTS_MAX_WORKERS, thread_name_prefix="tts")
+    return _executor.submit(text_to_speech, text, voice_id)
+
+
+def concat_audio(audio_paths):
+    """
+    Join MP3 clips (e.g. a reply's first sentence and its remainder) into one file.
+    MP3 frames can be concatenated byte-for-byte. Returns the new path, or None.
+    """
+    audio_paths = [p for p in audio_paths if p]
+    if not audio_paths:
+        return None
+    if len(audio_paths) == 1:
+        return audio_paths[0]
+
+    try:
+        audio_path = Path("static/audio") / f"{uuid.uuid4()}.mp3"
+        with open(audio_path, "wb") as out:
+            for path in audio_paths:
+                with open(path, "rb") as f:
+                    out.write(f.read())
+        return str(audio_path)
+    except Exception as e:
+        print(f"Audio concat failed: {e}")
+        return audio_paths[0]
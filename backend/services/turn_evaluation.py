@@ -0,0 +1,266 @@
+"""
+Incremental turn-level evaluation.
+
+The judge used to read a conversation only after all its turns were done, so a call
+that went off the rails early (a compliance violation, an escalation) still ran to
+max_turns. RollingEvaluator judges the latest window of turns in the background while
+the conversation continues, keeps a running score, and can end calls that are already
+hopeless or already successful. The windows are stored on the run, and the final
+evaluation merges them (judging only the turns after the last window) instead of
+reading the whole transcript again.
+"""
+import os
+import re
+import json
+import asyncio
+from services.llm import get_llm_response_async, cacheable_prompt
+from services.llm_log import TURN_JUDGE
+from services.evaluation import RUBRIC, SCORE_METRICS, overall_score
+
+TURN_EVAL_ENABLED = os.getenv("TURN_EVAL_ENABLED", "false").lower() == "true"
+TURN_EVAL_ABORT = os.getenv("TURN_EVAL_ABORT", "true").lower() == "true"  # false = score only, never end calls
+TURN_EVAL_EVERY = int(os.getenv("TURN_EVAL_EVERY", "2"))  # rounds (agent + customer) per window
+TURN_EVAL_MIN_ROUNDS = int(os.getenv("TURN_EVAL_MIN_ROUNDS", "3"))  # before a hopeless/successful call can end
+TURN_EVAL_HOPELESS_SCORE = float(os.getenv("TURN_EVAL_HOPELESS_SCORE", "3.5"))  # running overall at or below
+TURN_EVAL_SUCCESS_SCORE = float(os.getenv("TURN_EVAL_SUCCESS_SCORE", "8.5"))  # running goal completion at or above
+TURN_EVAL_VIOLATION_SCORE = 2  # window compliance at or below this ends the call at once
+TURN_EVAL_PATIENCE = 2  # consecutive windows judged hopeless before giving up on a call
+TURN_EVAL_CONTEXT = 2  # earlier messages shown before each window
+
+# Stop reasons (stored on SimulationRun.stop_reason, alongside services/termination.py's)
+SUCCEEDED = "succeeded"
+HOPELESS = "hopeless"
+VIOLATION = "violation"
+
+STATUSES = ["ongoing", "succeeded", "hopeless"]
+
+# Same categories as the full judge's structured_issues, so mutation sees one format
+ISSUE_CATEGORIES = ["opening", "emotional_detection", "de_escalation", "empathy",
+                    "objection_handling", "closing", "compliance_issues", "adaptation_moments"]
+
+WINDOW_FORMAT = """{
+    "goal_completion": X,
+    "conversational_quality": X,
+    "compliance": X,
+    "adaptation_quality": X,
+    "status": "ongoing, succeeded or hopeless",
+    "note": "one sentence on the agent in the NEW turns",
+    "structured_issues": {
+        "opening": "issue in these turns or null",
+        "emotional_detection": "issue in these turns or null",
+        "de_escalation": "issue in these turns or null",
+        "empathy": "issue in these turns or null",
+        "objection_handling": "issue in these turns or null",
+        "closing": "issue in these turns or null",
+        "compliance_issues": "issue in these turns or null",
+        "adaptation_moments": "issue in these turns or null"
+    }
+}"""
+
+# Static system message (the same on every call, see cacheable_prompt); the turns follow
+TURN_JUDGE_SYSTEM = f"""You monitor a debt collection call while it is still in progress. You are shown the
+latest turns, marked NEW, after a few earlier turns for context. Score ONLY the agent's behaviour in the
+NEW turns; for goal_completion, score the progress made so far.
+
+{RUBRIC}
+
+status: "succeeded" if the customer has already made a concrete payment commitment, "hopeless" if the
+customer refuses outright or has escalated beyond what the agent can still recover, otherwise "ongoing".
+
+Return ONLY valid JSON in this exact format:
+{WINDOW_FORMAT}"""
+
+
+def new_record():
+    """Empty turn-level evaluation: judged windows and how many messages they cover"""
+    return {"windows": [], "covered": 0}
+
+
+def _format_turns(turns, start, end):
+    first = max(0, start - TURN_EVAL_CONTEXT)
+    lines = []
+    for index in range(first, end):
+        agent, text = turns[index]
+        if index == start:
+            lines.append("NEW turns:")
+        elif index == first:
+            lines.append("Earlier turns (context only):")
+        lines.append(f"{index + 1}. {'Agent' if agent == 'A' else 'Customer'}: {text}")
+    return "\n".join(lines)
+
+
+def parse_window(response):
+    """Scores, status, note and issues from a window judgment, or None if it holds no valid scores"""
+    json_match = re.search(r'\{.*\}', response, re.DOTALL)
+    if not json_match:
+        return None
+    try:
+        data = json.loads(json_match.group())
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or not all(
+        isinstance(data.get(metric), (int, float)) and 1 <= data[metric] <= 10 for metric in SCORE_METRICS
+    ):
+        return None
+    issues = data.get("structured_issues") if isinstance(data.get("structured_issues"), dict) else {}
+    return {
+        "scores": {metric: data[metric] for metric in SCORE_METRICS},
+        "status": data.get("status") if data.get("status") in STATUSES else "ongoing",
+        "note": data.get("note") or data.get("feedback") or "",
+        "structured_issues": {
+            category: issues[category] for category in ISSUE_CATEGORIES
+            if isinstance(issues.get(category), str) and issues[category].strip().lower() not in ("", "null", "none")
+        },
+    }
+
+
+async def evaluate_window(goal, turns, start, end=None):
+    """Judge messages start..end (default: to the last one) of (agent, text) turns; None if unparseable"""
+    end = len(turns) if end is None else end
+    prompt = cacheable_prompt(TURN_JUDGE_SYSTEM, f"Scenario Goal: {goal}\n\n{_format_turns(turns, start, end)}")
+    response = await get_llm_response_async(**prompt, max_tokens=400, call_site=TURN_JUDGE)
+    window = parse_window(response)
+    if window:
+        window.update({"from": start, "to": end})
+    return window
+
+
+def merge_windows(windows):
+    """
+    Conversation-level scores from the windows: goal completion is where the call ended up
+    (the last window), compliance the worst window (a violation anywhere counts), and
+    conversational and adaptation quality the average weighted by window length.
+    """
+    weights = [max(1, window["to"] - window["from"]) for window in windows]
+    scores = {
+        "goal_completion": windows[-1]["scores"]["goal_completion"],
+        "compliance": min(window["scores"]["compliance"] for window in windows),
+    }
+    for metric in ["conversational_quality", "adaptation_quality"]:
+        total = sum(window["scores"][metric] * weight for window, weight in zip(windows, weights))
+        scores[metric] = round(total / sum(weights), 2)
+    return scores
+
+
+def merged_evaluation(windows):
+    """Full judge-format scores from the windows, marked "source": "incremental" """
+    def turns(window):
+        if window["to"] - window["from"] == 1:
+            return f"turn {window['to']}"
+        return f"turns {window['from'] + 1}-{window['to']}"
+
+    return {
+        **merge_windows(windows),
+        "feedback": " ".join(f"{turns(window).capitalize()}: {window['note']}" for window in windows if window["note"]),
+        "structured_issues": {
+            category: "; ".join(
+                f"{turns(window)}: {window['structured_issues'][category]}"
+                for window in windows if category in window["structured_issues"]
+            ) or None
+            for category in ISSUE_CATEGORIES
+        },
+        "source": "incremental",
+        "windows": len(windows),
+    }
+
+
+async def finalize(transcript, goal, record):
+    """
+    Final scores for a conversation judged window by window: the turns after the last window
+    are judged as one more window, then all windows are merged. None when there is nothing
+    to merge or the last window fails (the caller then judges the whole transcript).
+    """
+    if not record or not record.get("windows"):
+        return None
+    turns = [(turn["agent"], turn["text"]) for turn in transcript]
+    windows = list(record["windows"])
+    if record["covered"] < len(turns):
+        try:
+            window = await evaluate_window(goal, turns, record["covered"])
+        except Exception as e:
+            print(f"Judging the last turns failed, judging the whole conversation: {e}")
+            return None
+        if window is None:
+            return None
+        windows.append(window)
+    return merged_evaluation(windows)
+
+
+def abort_reason(windows, running):
+    """Why the call should end now, given the windows so far and the running scores (None = continue)"""
+    latest = windows[-1]
+    if latest["scores"]["compliance"] <= TURN_EVAL_VIOLATION_SCORE:
+        return VIOLATION
+    if latest["to"] // 2 < TURN_EVAL_MIN_ROUNDS:
+        return None
+    if latest["status"] == "succeeded" and running["goal_completion"] >= TURN_EVAL_SUCCESS_SCORE:
+        return SUCCEEDED
+    recent = windows[-TURN_EVAL_PATIENCE:]
+    if len(recent) == TURN_EVAL_PATIENCE and all(window["status"] == "hopeless" for window in recent) \
+            and overall_score(running) <= TURN_EVAL_HOPELESS_SCORE:
+        return HOPELESS
+    return None
+
+
+class RollingEvaluator:
+    """
+    Judges a conversation between an agent (A) and a customer (B) window by window while
+    it runs. observe() starts judging the turns since the last window every TURN_EVAL_EVERY
+    rounds, in the background so the conversation never waits; poll() collects finished
+    windows as "turn_evaluation" events and sets stop_reason once the call should end.
+    Decisions therefore lag the conversation by a turn or so.
+    The record (windows, covered) is shared with the ConversationState, so it is
+    checkpointed with it and stored on the run when the conversation ends.
+    """
+
+    def __init__(self, goal, record=None, abort=TURN_EVAL_ABORT):
+        self.goal = goal
+        self.record = record if record is not None else new_record()
+        self.abort = abort
+        self.task = None
+        self.stop_reason = None
+
+    def observe(self, turns):
+        """Start judging the latest window once it is due (after a customer reply); never blocks"""
+        start = self.record["covered"]
+        if self.task or len(turns) % 2 or len(turns) - start < TURN_EVAL_EVERY * 2:
+            return
+        self.task = asyncio.create_task(evaluate_window(self.goal, list(turns), start))
+
+    def poll(self):
+        """Events for windows judged since the last call"""
+        if not self.task or not self.task.done():
+            return []
+        task, self.task = self.task, None
+        try:
+            window = task.result()
+        except Exception as e:
+            print(f"Turn-level evaluation failed, retrying with the next window: {e}")
+            return []
+        if window is None:
+            return []  # Unparseable: these turns are judged again with the next window
+        return [self._add(window)]
+
+    async def drain(self):
+        """Wait for the window being judged, if any, and return its events"""
+        if self.task:
+            await asyncio.wait([self.task])
+        return self.poll()
+
+    def _add(self, window):
+        self.record["windows"].append(window)
+        self.record["covered"] = window["to"]
+        running = merge_windows(self.record["windows"])
+        reason = abort_reason(self.record["windows"], running) if self.abort else None
+        if reason and not self.stop_reason:
+            self.stop_reason = reason
+        return {
+            "type": "turn_evaluation",
+            "from": window["from"],
+            "to": window["to"],
+            "scores": window["scores"],
+            "status": window["status"],
+            "running": running,
+            "running_overall": overall_score(running),
+            "stop": reason,
+        }
@@ -0,0 +1,486 @@
+"""
+Local OpenAI-compatible stub LLM server for offline load testing.
+
+Speaks the chat-completions protocol used by services/llm.py and
+voice_agent.get_llm_plugin, with configurable latency, throughput and
+error rates. Replies are templated per task: agent and customer turns,
+valid judge JSON for evaluate_conversation (one object per conversation for
+multi-transcript judge prompts), window JSON for turn-level evaluation, pattern JSON for
+extract_patterns, and rewritten prompts for generate_mutation. The files and
+batches endpoints emulate a provider batch API for LLMBatch.
+
+Prompt prefix caching is emulated: prompts are hashed in blocks of
+PREFIX_BLOCK_TOKENS, and the longest previously seen prefix is reported as
+usage.prompt_tokens_details.cached_tokens. Only uncached prompt tokens count
+towards prefill time (STUB_PREFILL_TOKENS_PER_SECOND).
+
+Usage:
+    python stub_llm_server.py                      # serves on http://127.0.0.1:8001/v1
+    STUB_PROFILE=realistic python stub_llm_server.py
+    LLM_PROVIDER=stub uvicorn main:app             # point the backend at it
+
+Settings (env):
+    STUB_PORT                   Port to listen on (default 8001)
+    STUB_PROFILE                instant | fast | realistic | slow | flaky (default fast)
+    STUB_LATENCY_MEDIAN         Median time to first token, seconds
+    STUB_LATENCY_SIGMA          Log-normal spread of the latency
+    STUB_TOKENS_PER_SECOND      Generation speed after the first token
+    STUB_PREFILL_TOKENS_PER_SECOND  Prompt processing speed for uncached prompt tokens
+    STUB_PREFIX_CACHE           Emulate prompt prefix caching (default true)
+    STUB_ERROR_RATE             Fraction of requests answered with a 500
+    STUB_RATE_LIMIT_RATE        Fraction of requests answered with a 429
+    STUB_SCRIPT                 JSON file with a list of replies to cycle through for conversation turns
+    STUB_SEED                   Random seed for reproducible runs
+    STUB_BATCH_SECONDS          How long a batch job stays in progress (default 2)
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import itertools
+from collections import OrderedDict
+from fastapi import FastAPI, Request, UploadFile, File, Form, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+
+# Latency profiles: median seconds to first token, log-normal sigma, tokens/sec, error rates
+PROFILES = {
+    "instant": {"latency_median": 0.0, "latency_sigma": 0.0, "tokens_per_second": 0, "prefill_tokens_per_second": 0,
+                "error_rate": 0.0, "rate_limit_rate": 0.0},
+    "fast": {"latency_median": 0.05, "latency_sigma": 0.3, "tokens_per_second": 500, "prefill_tokens_per_second": 20000,
+             "error_rate": 0.0, "rate_limit_rate": 0.0},
+    "realistic": {"latency_median": 0.6, "latency_sigma": 0.5, "tokens_per_second": 80, "prefill_tokens_per_second": 5000,
+                  "error_rate": 0.01, "rate_limit_rate": 0.02},
+    "slow": {"latency_median": 3.0, "latency_sigma": 0.8, "tokens_per_second": 25, "prefill_tokens_per_second": 2000,
+             "error_rate": 0.02, "rate_limit_rate": 0.05},
+    "flaky": {"latency_median": 0.8, "latency_sigma": 1.0, "tokens_per_second": 60, "prefill_tokens_per_second": 5000,
+              "error_rate": 0.1, "rate_limit_rate": 0.1},
+}
+
+PROFILE_NAME = os.getenv("STUB_PROFILE", "fast")
+PROFILE = dict(PROFILES.get(PROFILE_NAME, PROFILES["fast"]))
+for key in PROFILE:
+    env_value = os.getenv(f"STUB_{key.upper()}")
+    if env_value is not None:
+        PROFILE[key] = float(env_value)
+
+MODEL = "stub-model"
+BATCH_SECONDS = float(os.getenv("STUB_BATCH_SECONDS", "2"))
+PREFIX_CACHE = os.getenv("STUB_PREFIX_CACHE", "true").lower() == "true"
+PREFIX_BLOCK_TOKENS = 64  # cached prefixes are matched in blocks of this many tokens
+PREFIX_CACHE_BLOCKS = 100000  # least recently used prefixes beyond this are forgotten
+
+AGENT_OPENINGS = [
+    "Hi, this is Marcus from ABC Financial Services. This is an attempt to collect a debt. Do you have a moment to talk about your account?",
+    "Hello, Marcus calling from ABC Financial Services about your overdue loan. This is a debt collection call. Is now a good time?",
+]
+
+AGENT_REPLIES = [
+    "I understand this is frustrating. I'm here to help find a solution that works for you.",
+    "Would a smaller monthly payment make this more manageable for you?",
+    "Could you commit to a first payment by Friday? Even a partial amount helps.",
+    "I hear you. Let's look at a hardship plan so this doesn't get any worse.",
+    "Thank you for working with me. I'll send the payment plan details today.",
+]
+
+CUSTOMER_REPLIES = [
+    "Who gave you this number? I'm really busy right now.",
+    "I know I'm behind, but I just can't pay the full amount right now.",
+    "What kind of payment plan are we talking about?",
+    "I lost my job last month, things have been really hard.",
+    "Okay, I can probably do two hundred dollars on Friday.",
+    "Fine. Send me the details and I'll set it up.",
+]
+
+SCRIPTED_REPLIES = None
+if os.getenv("STUB_SCRIPT"):
+    with open(os.getenv("STUB_SCRIPT")) as f:
+        SCRIPTED_REPLIES = itertools.cycle(json.load(f))
+
+if os.getenv("STUB_SEED"):
+    random.seed(int(os.getenv("STUB_SEED")))
+
+stats = {"requests": 0, "streamed": 0, "errors": 0, "rate_limited": 0, "batches": 0, "by_task": {},
+         "prompt_tokens": 0, "cached_tokens": 0, "cached_tokens_by_task": {}}
+client_connections = set()  # (host, port) of every connection that sent a chat completion
+
+prefix_cache = OrderedDict()  # hash of a prompt prefix (whole blocks) -> None
+
+# In-memory batch API state
+files = {}  # file id -> bytes
+batches = {}  # batch id -> batch object
+
+app = FastAPI(title="Stub LLM Server")
+
+
+def classify(system_prompt):
+    """Work out which pipeline step a request comes from"""
+    if "call while it is still in progress" in system_prompt:
+        return "turn_judge"
+    if '"goal_completion"' in system_prompt:
+        return "judge"
+    if '"success_patterns"' in system_prompt:
+        return "patterns"
+    if "evolving an AI agent's system prompt" in system_prompt:
+        return "mutation"
+    if "defaulter" in system_prompt.lower():
+        return "customer"
+    return "agent"
+
+
+def judge_reply(prompt=""):
+    conversations = len(re.findall(r"^=== Conversation \d+ ===$", prompt, re.MULTILINE))
+    if conversations:
+        return json.dumps({"evaluations": [
+            {"conversation": number, **json.loads(judge_reply())} for number in range(1, conversations + 1)
+        ]})
+    scores = {key: random.randint(4, 9) for key in
+              ["goal_completion", "conversational_quality", "compliance", "adaptation_quality"]}
+    return json.dumps({
+        **scores,
+        "feedback": "Stub evaluation: agent stayed professional but could push harder for a specific commitment.",
+        "structured_issues": {
+            "opening": None,
+            "emotional_detection": "Picked up on customer frustration late",
+            "de_escalation": None,
+            "empathy": "Could acknowledge hardship earlier",
+            "objection_handling": "Handled excuses adequately",
+            "closing": "No specific payment date confirmed",
+            "compliance_issues": None,
+            "adaptation_moments": "Turn 3 called for a softer tone"
+        }
+    })
+
+
+def turn_judge_reply(prompt):
+    # Succeeded once a customer line in the new turns is one of the stub's commitments
+    new_turns = prompt.split("NEW turns:", 1)[-1]
+    succeeded = any(reply in new_turns for reply in CUSTOMER_REPLIES[-2:])
+    scores = {key: random.randint(4, 9) for key in
+              ["goal_completion", "conversational_quality", "compliance", "adaptation_quality"]}
+    if succeeded:
+        scores["goal_completion"] = 9
+    return json.dumps({
+        **scores,
+        "status": "succeeded" if succeeded else "ongoing",
+        "note": "Stub window evaluation: agent stayed calm and kept steering towards a payment.",
+        "structured_issues": {
+            "empathy": "Could acknowledge hardship earlier",
+            "closing": None if succeeded else "No specific payment date yet",
+        }
+    })
+
+
+def patterns_reply():
+    return json.dumps({
+        "success_patterns": [
+            {"pattern": "Acknowledge emotion before discussing payment", "trigger": "Customer sounds angry or upset",
+             "example_phrase": "I understand this is frustrating."},
+            {"pattern": "Ask for a specific date", "trigger": "Vague promises",
+             "example_phrase": "Could we set that for Friday?"}
+        ],
+        "failure_patterns": [
+            {"pattern": "Repeating the amount owed", "why_fails": "Escalates defensive customers"}
+        ],
+        "key_insight": "Empathy first, then a concrete small commitment."
+    })
+
+
+def mutation_reply(prompt):
+    current = prompt.split("CURRENT PROMPT:", 1)[-1].split("TESTED ACROSS", 1)[0].strip()
+    variant = random.choice([
+        "Always acknowledge the customer's feelings before mentioning payment.",
+        "Ask for a specific payment date instead of accepting vague promises.",
+        "Offer a hardship plan as soon as the customer mentions financial difficulty.",
+    ])
+    return f"{current}\n\nADDITIONAL GUIDANCE: {variant}"
+
+
+def conversation_reply(task, messages):
+    if SCRIPTED_REPLIES is not None:
+        return next(SCRIPTED_REPLIES)
+    if task == "agent" and len(messages) <= 2:
+        return random.choice(AGENT_OPENINGS)
+    return random.choice(AGENT_REPLIES if task == "agent" else CUSTOMER_REPLIES)
+
+
+def build_reply(messages):
+    system_prompt = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+    # Judge and mutation inputs follow the static system message as the user message
+    request_text = "\n\n".join(m.get("content") or "" for m in messages if m.get("role") != "assistant")
+    task = classify(system_prompt)
+    stats["by_task"][task] = stats["by_task"].get(task, 0) + 1
+
+    if task == "turn_judge":
+        return turn_judge_reply(request_text)
+    if task == "judge":
+        return judge_reply(request_text)
+    if task == "patterns":
+        return patterns_reply()
+    if task == "mutation":
+        return mutation_reply(request_text)
+    return conversation_reply(task, messages)
+
+
+def cached_prefix_tokens(messages):
+    """
+    Prompt tokens a provider would serve from its prefix cache: the longest run of whole
+    blocks matching an earlier prompt. Every block prefix of this prompt is remembered.
+    """
+    if not PREFIX_CACHE:
+        return 0
+    text = "".join(f"<{m.get('role')}>{m.get('content') or ''}" for m in messages)
+    block_chars = PREFIX_BLOCK_TOKENS * 4
+    digest = hashlib.sha256()
+    cached, still_matching = 0, True
+    for end in range(block_chars, len(text) + 1, block_chars):
+        digest.update(text[end - block_chars:end].encode("utf-8"))
+        key = digest.hexdigest()
+        if still_matching and key in prefix_cache:
+            cached = end // 4
+            prefix_cache.move_to_end(key)
+        else:
+            still_matching = False
+            prefix_cache[key] = None
+    while len(prefix_cache) > PREFIX_CACHE_BLOCKS:
+        prefix_cache.popitem(last=False)
+    return cached
+
+
+def sample_latency():
+    if PROFILE["latency_median"] <= 0:
+        return 0.0
+    return random.lognormvariate(0, PROFILE["latency_sigma"]) * PROFILE["latency_median"]
+
+
+def count_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def usage_for(messages, reply):
+    prompt_tokens = sum(count_tokens(m.get("content") or "") for m in messages)
+    cached_tokens = min(cached_prefix_tokens(messages), prompt_tokens)
+    completion_tokens = count_tokens(reply)
+
+    system_prompt = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+    task = classify(system_prompt)
+    stats["prompt_tokens"] += prompt_tokens
+    stats["cached_tokens"] += cached_tokens
+    stats["cached_tokens_by_task"][task] = stats["cached_tokens_by_task"].get(task, 0) + cached_tokens
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+    }
+
+
+def prefill_seconds(usage):
+    """Time to process the prompt tokens that were not served from the prefix cache"""
+    if not PROFILE["prefill_tokens_per_second"]:
+        return 0.0
+    uncached = usage["prompt_tokens"] - usage["prompt_tokens_details"]["cached_tokens"]
+    return uncached / PROFILE["prefill_tokens_per_second"]
+
+
+def completion(completion_id, created, model, reply, usage):
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+        "usage": usage,
+    }
+
+
+def rate_limit_headers():
+    return {
+        "x-ratelimit-remaining-requests": "1000",
+        "x-ratelimit-remaining-tokens": "1000000",
+    }
+
+
+@app.get("/v1/models")
+@app.get("/openai/v1/models")
+def list_models():
+    return {"object": "list", "data": [{"id": MODEL, "object": "model", "owned_by": "stub"}]}
+
+
+@app.get("/stats")
+def get_stats():
+    cached_share = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+    return {"profile": PROFILE_NAME, "settings": PROFILE, **stats, "cached_share": round(cached_share, 3),
+            "connections": len(client_connections)}
+
+
+@app.post("/v1/chat/completions")
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    stats["requests"] += 1
+    if request.client:
+        client_connections.add((request.client.host, request.client.port))
+
+    await asyncio.sleep(sample_latency())
+
+    roll = random.random()
+    if roll < PROFILE["rate_limit_rate"]:
+        stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": "Stub rate limit", "type": "rate_limit_error"}},
+            headers={"retry-after": "1", "x-ratelimit-remaining-requests": "0"}
+        )
+    if roll < PROFILE["rate_limit_rate"] + PROFILE["error_rate"]:
+        stats["errors"] += 1
+        return JSONResponse(status_code=500, content={"error": {"message": "Stub server error", "type": "server_error"}})
+
+    reply = build_reply(messages)
+    max_tokens = body.get("max_tokens")
+    if max_tokens:
+        reply = reply[:max_tokens * 4]
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    model = body.get("model", MODEL)
+    usage = usage_for(messages, reply)
+    await asyncio.sleep(prefill_seconds(usage))
+
+    if body.get("stream"):
+        stats["streamed"] += 1
+
+        async def chunks():
+            words = reply.split(" ")
+            for i, word in enumerate(words):
+                piece = word if i == 0 else f" {word}"
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                if PROFILE["tokens_per_second"]:
+                    await asyncio.sleep(count_tokens(piece) / PROFILE["tokens_per_second"])
+            final = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": usage
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream", headers=rate_limit_headers())
+
+    if PROFILE["tokens_per_second"]:
+        await asyncio.sleep(usage["completion_tokens"] / PROFILE["tokens_per_second"])
+
+    return JSONResponse(content=completion(completion_id, created, model, reply, usage), headers=rate_limit_headers())
+
+
+@app.post("/v1/files")
+@app.post("/openai/v1/files")
+async def upload_file(file: UploadFile = File(...), purpose: str = Form(...)):
+    file_id = f"file-{uuid.uuid4().hex[:12]}"
+    files[file_id] = await file.read()
+    return {"id": file_id, "object": "file", "bytes": len(files[file_id]), "created_at": int(time.time()),
+            "filename": file.filename, "purpose": purpose}
+
+
+@app.get("/v1/files/{file_id}/content")
+@app.get("/openai/v1/files/{file_id}/content")
+def get_file_content(file_id: str):
+    if file_id not in files:
+        raise HTTPException(status_code=404, detail="File not found")
+    return Response(content=files[file_id], media_type="application/octet-stream")
+
+
+async def process_batch(batch):
+    """Answer every line of the input file after BATCH_SECONDS, honouring the error rate per request"""
+    await asyncio.sleep(BATCH_SECONDS)
+    if batch["status"] == "cancelling":
+        batch["status"] = "cancelled"
+        return
+
+    output = []
+    for line in files[batch["input_file_id"]].decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        body = item["body"]
+        request_id = f"batch_req_{uuid.uuid4().hex[:12]}"
+        if random.random() < PROFILE["error_rate"]:
+            response = {"status_code": 500, "request_id": request_id,
+                        "body": {"error": {"message": "Stub server error", "type": "server_error"}}}
+            batch["request_counts"]["failed"] += 1
+        else:
+            messages = body.get("messages", [])
+            reply = build_reply(messages)
+            if body.get("max_tokens"):
+                reply = reply[:body["max_tokens"] * 4]
+            response = {"status_code": 200, "request_id": request_id,
+                        "body": completion(f"chatcmpl-{uuid.uuid4().hex[:12]}", int(time.time()),
+                                           body.get("model", MODEL), reply, usage_for(messages, reply))}
+            batch["request_counts"]["completed"] += 1
+        output.append(json.dumps({"id": request_id, "custom_id": item["custom_id"], "response": response, "error": None}))
+
+    output_file_id = f"file-{uuid.uuid4().hex[:12]}"
+    files[output_file_id] = "\n".join(output).encode("utf-8")
+    batch.update(status="completed", output_file_id=output_file_id, completed_at=int(time.time()))
+
+
+@app.post("/v1/batches")
+@app.post("/openai/v1/batches")
+async def create_batch(request: Request):
+    body = await request.json()
+    if body.get("input_file_id") not in files:
+        raise HTTPException(status_code=400, detail="Unknown input_file_id")
+
+    total = sum(1 for line in files[body["input_file_id"]].decode("utf-8").splitlines() if line.strip())
+    batch = {
+        "id": f"batch_{uuid.uuid4().hex[:12]}",
+        "object": "batch",
+        "endpoint": body.get("endpoint"),
+        "input_file_id": body["input_file_id"],
+        "completion_window": body.get("completion_window", "24h"),
+        "status": "in_progress",
+        "output_file_id": None,
+        "error_file_id": None,
+        "created_at": int(time.time()),
+        "completed_at": None,
+        "request_counts": {"total": total, "completed": 0, "failed": 0},
+    }
+    batches[batch["id"]] = batch
+    stats["batches"] += 1
+    asyncio.create_task(process_batch(batch))
+    return batch
+
+
+@app.get("/v1/batches/{batch_id}")
+@app.get("/openai/v1/batches/{batch_id}")
+def get_batch(batch_id: str):
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batches[batch_id]
+
+
+@app.post("/v1/batches/{batch_id}/cancel")
+@app.post("/openai/v1/batches/{batch_id}/cancel")
+def cancel_batch(batch_id: str):
+    if batch_id not in batches:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    if batches[batch_id]["status"] == "in_progress":
+        batches[batch_id]["status"] = "cancelling"
+    return batches[batch_id]
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    port = int(os.getenv("STUB_PORT", "8001"))
+    print(f"Stub LLM server ({PROFILE_NAME} profile) on http://127.0.0.1:{port}/v1")
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
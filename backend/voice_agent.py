@@ -188,6 +188,14 @@ def get_llm_plugin():
             model="llama-3.3-70b",
             temperature=0.5,
         )
+    elif provider == "stub":
+        # Local stand-in provider (python stub_llm_server.py)
+        return openai.LLM(
+            base_url=os.getenv("STUB_LLM_URL", "http://127.0.0.1:8001/v1"),
+            api_key="stub",
+            model="stub-model",
+            temperature=0.5,
+        )
     else:
         # Default to OpenAI
         return openai.LLM(
@@ -5,6 +5,7 @@ import AudioPlayer from '../components/AudioPlayer';
 
 export default function Simulations() {
   const [simulations, setSimulations] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [scenarios, setScenarios] = useState([]);
   const [selectedRun, setSelectedRun] = useState(null);
   const [loading, setLoading] = useState(false);
@@ -15,10 +16,21 @@ export default function Simulations() {
     fetchScenarios();
   }, []);
 
-  const fetchSimulations = async () => {
+  // Runs come back before they are judged; refresh until the evaluation is in
+  const judging = ['pending', 'running'].includes(selectedRun?.evaluation_status);
+  useEffect(() => {
+    if (!judging) return;
+    const timer = setTimeout(() => viewSimulation(selectedRun.id), 2000);
+    return () => clearTimeout(timer);
+  }, [selectedRun]);
+
+  const fetchSimulations = async (cursor = null) => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/simulations/`);
-      setSimulations(response.data);
+      const response = await axios.get(`${API_BASE_URL}/simulations/`, {
+        params: { fields: 'summary', limit: 50, cursor: cursor ?? undefined },
+      });
+      setSimulations((previous) => (cursor ? [...previous, ...response.data.items] : response.data.items));
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       console.error('Error fetching simulations:', error);
     }
@@ -103,7 +115,7 @@ export default function Simulations() {
 
           {/* Simulation List */}
           <div className="border rounded-lg p-4">
-            <h2 className="font-semibold mb-3">History ({simulations.length})</h2>
+            <h2 className="font-semibold mb-3">History ({simulations.length}{nextCursor ? '+' : ''})</h2>
             <div className="space-y-2 max-h-[500px] overflow-y-auto">
               {simulations.map((sim) => (
                 <div
@@ -139,6 +151,14 @@ export default function Simulations() {
                   </div>
                 </div>
               ))}
+              {nextCursor && (
+                <button
+                  onClick={() => fetchSimulations(nextCursor)}
+                  className="w-full text-sm text-blue-500 hover:underline py-2"
+                >
+                  Load more
+                </button>
+              )}
             </div>
           </div>
         </div>
@@ -169,6 +189,16 @@ export default function Simulations() {
               </div>
 
               {/* Evaluation Scores */}
+              {judging && (
+                <div className="bg-gray-50 border border-gray-200 rounded-lg p-4 mb-4 text-gray-600">
+                  Evaluating...
+                </div>
+              )}
+              {selectedRun.evaluation_status === 'failed' && (
+                <div className="bg-red-50 border border-red-200 rounded-lg p-4 mb-4 text-red-700">
+                  {selectedRun.postprocess_error}
+                </div>
+              )}
               {selectedRun.evaluation && (
                 <div className="bg-blue-50 border border-blue-200 rounded-lg p-4 mb-4">
                   <h3 className="font-semibold text-lg mb-3">Evaluation</h3>